@@ -9,11 +9,28 @@ from .base import (
     load_file,
     run_model,
     run_model_streaming,
+    run_model_coalesced,
+    run_model_batch,
+    CancelToken,
     model_health,
+    endpoint_pool,
+    start_health_monitor,
+    deadlines,
+    Deadlines,
     get_cached,
     set_cached,
     clear_cache,
+    cache_stats,
 )
+from .config import init_config, load_config, reload_config, ConfigError
+from .hedging import run_hedged
+from .microbatch import MicroBatcher
+from .supervisor import Supervisor
+from .scheduler import SCHEDULER, INTERACTIVE, BATCH
+from .sessions import SESSIONS, Session, SessionStore
+from .stopping import StopDetector
+from .tools import TOOLS, tool, execute, parse_tool_calls
+from .workspace import Workspace, apply_patch
 from .deepseek import run_deepseek, get_code_output
 from .qwen import run_face, get_face_output
 from .orchestrator import orchestrate, status, fast_route, clear_history
@@ -27,10 +44,38 @@ __all__ = [
     "load_file",
     "run_model",
     "run_model_streaming",
+    "run_model_coalesced",
+    "run_model_batch",
+    "CancelToken",
     "model_health",
+    "endpoint_pool",
+    "start_health_monitor",
+    "deadlines",
+    "Deadlines",
     "get_cached",
     "set_cached",
     "clear_cache",
+    "cache_stats",
+    "init_config",
+    "load_config",
+    "reload_config",
+    "ConfigError",
+    "run_hedged",
+    "MicroBatcher",
+    "Supervisor",
+    "SCHEDULER",
+    "INTERACTIVE",
+    "BATCH",
+    "SESSIONS",
+    "Session",
+    "SessionStore",
+    "StopDetector",
+    "TOOLS",
+    "tool",
+    "execute",
+    "parse_tool_calls",
+    "Workspace",
+    "apply_patch",
     "run_deepseek",
     "get_code_output",
     "run_face",
@@ -2,16 +2,53 @@ import time
 import requests
 import hashlib
 import json
+import socket
 import sys
+import threading
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Generator, Callable
+from typing import TYPE_CHECKING, Dict, List, Optional, Generator, Callable, Iterator, Sequence
 from pathlib import Path
 
+try:
+    from .cache import ResponseCache
+    from .endpoints import EndpointPool
+    from .latency import LATENCY, TIMEOUT_FLOORS
+    from .scheduler import INTERACTIVE, SCHEDULER, Grant
+    from .stopping import StopDetector
+    from .tracing import TRACER
+except ImportError:
+    from cache import ResponseCache
+    from endpoints import EndpointPool
+    from latency import LATENCY, TIMEOUT_FLOORS
+    from scheduler import INTERACTIVE, SCHEDULER, Grant
+    from stopping import StopDetector
+    from tracing import TRACER
+
+if TYPE_CHECKING:
+    from supervisor import Supervisor
+
 ROOT = Path(__file__).parent.parent
 
-# Simple in-memory cache for responses
-_response_cache: Dict[str, dict] = {}
-MAX_CACHE_SIZE = 50
+# Shared HTTP session: keeps connections to each llama-server alive
+_http = requests.Session()
+
+# How often the watchdog checks stream deadlines (seconds)
+WATCHDOG_INTERVAL = 0.1
+
+# Per-model replica pools (see endpoints.py)
+_pools: Dict[str, EndpointPool] = {}
+_pools_lock = threading.Lock()
+
+# In-memory response cache; outputs deduplicated and compressed (see cache.py)
+_response_cache = ResponseCache()
+
+# Generations currently running, keyed by cache key (single-flight)
+_inflight: Dict[str, "_Flight"] = {}
+_inflight_lock = threading.Lock()
+
+# Starts llama-server processes on demand when set (see supervisor.py)
+_supervisor: Optional["Supervisor"] = None
 
 
 @dataclass
@@ -20,10 +57,32 @@ class ModelConfig:
     url: str
     max_tokens: int = 256
     temperature: float = 0.7
-    timeout: int = 60
+    timeout: int = 60  # Ceiling for a whole request (seconds)
     stop: List[str] = field(default_factory=list)
     top_p: float = 0.9
     repeat_penalty: float = 1.1
+    replicas: List[str] = field(default_factory=list)  # Extra llama-server URLs
+    stop_patterns: List[str] = field(default_factory=list)  # Client-side regex stops
+    # Ceilings for each phase; the deadlines actually used adapt below these
+    # from observed latency (see deadlines())
+    connect_timeout: float = 3.0
+    ttft_timeout: float = 30.0
+    idle_timeout: float = 20.0
+    # Launch settings used when the backend supervisor manages this model
+    # (see supervisor.py); without a model_path the server is started externally
+    model_path: str = ""  # GGUF file, relative to ROOT
+    ctx_size: int = 4096
+    idle_unload: float = 300.0  # Seconds without requests before unloading
+    cpu_weight: float = 1.0  # Share of CPU threads relative to other backends
+    server_args: List[str] = field(default_factory=list)  # Extra llama-server flags
+    # Approximate footprint while generating, for the scheduler (see scheduler.py)
+    ram_mb: int = 0  # Weights + KV cache; 0 = not counted
+    cpu_threads: int = 1  # Cores its server keeps busy while generating
+
+    @property
+    def endpoints(self) -> List[str]:
+        """All completion URLs serving this model, primary first."""
+        return [self.url] + [u for u in self.replicas if u != self.url]
 
 
 MODELS: Dict[str, ModelConfig] = {
@@ -35,15 +94,34 @@ MODELS: Dict[str, ModelConfig] = {
         stop=["<|im_end|>", "<|im_start|>", "\n\nUser:", "\n\nHuman:"],
         top_p=0.9,
         repeat_penalty=1.1,
+        stop_patterns=[r"\n(?:User|Human):"],  # Model inventing the next turn
+        ram_mb=2600,
+        cpu_threads=6,
     ),
     "deepseek": ModelConfig(
         name="deepseek",
         url="http://127.0.0.1:8002/completion",
         temperature=0.2,  # Low temp for precise code
         max_tokens=1024,  # Longer for code output
+        timeout=180,  # 1024 tokens on CPU can take minutes
+        ttft_timeout=45.0,  # Prompt eval on the 6.7B model is slow
         stop=["\n\nTask:", "\n\nOutput:", "```\n\n"],
         top_p=0.95,
         repeat_penalty=1.0,
+        cpu_weight=1.3,  # Larger model, more threads when both are running
+        ram_mb=4800,
+        cpu_threads=8,
+    ),
+    # Embedding server for vector retrieval (see vectors.py), not a chat model
+    "embed": ModelConfig(
+        name="embed",
+        url="http://127.0.0.1:8004/embedding",
+        timeout=30,
+        ttft_timeout=10.0,
+        ctx_size=2048,
+        server_args=["--embedding", "--pooling", "mean"],
+        ram_mb=400,
+        cpu_threads=2,
     ),
     "mistral": ModelConfig(
         name="mistral",
@@ -51,57 +129,338 @@ MODELS: Dict[str, ModelConfig] = {
         temperature=0.3,
         max_tokens=256,
         stop=["</s>", "[INST]", "[/INST]"],
+        ram_mb=5600,
+        cpu_threads=6,
     ),
 }
 
 
+@dataclass
+class Deadlines:
+    """Limits for one request, in seconds."""
+    connect: float
+    ttft: float
+    idle: float
+    total: float
+
+
+def deadlines(model_name: str, max_tokens: Optional[int] = None, kind: str = "chat") -> Deadlines:
+    """
+    Current deadlines for a model: p99 x factor of recent latency for each
+    phase, clamped to the ModelConfig ceilings (see latency.py).
+
+    A generation's total is its TTFT deadline plus max_tokens (the request's
+    n_predict) at the per-token deadline, so a long answer isn't held to the
+    time short ones took. Other kinds of request ("embed", "batch") have
+    their own whole-request histogram.
+    """
+    cfg = MODELS[model_name]
+    ttft = LATENCY.deadline(model_name, "ttft", cfg.ttft_timeout)
+    if kind == "chat":
+        per_token = LATENCY.deadline(model_name, "token", cfg.timeout)
+        floor = min(TIMEOUT_FLOORS["total"], cfg.timeout)
+        total = max(floor, min(ttft + (max_tokens or cfg.max_tokens) * per_token, cfg.timeout))
+    else:
+        total = LATENCY.deadline(model_name, kind, cfg.timeout)
+    return Deadlines(
+        connect=LATENCY.deadline(model_name, "connect", cfg.connect_timeout),
+        ttft=ttft,
+        idle=LATENCY.deadline(model_name, "gap", cfg.idle_timeout),
+        total=total,
+    )
+
+
+def endpoint_pool(model_name: str) -> EndpointPool:
+    """Get the replica pool for a model, tracking changes to its endpoints."""
+    cfg = MODELS[model_name]
+    with _pools_lock:
+        pool = _pools.get(model_name)
+        if pool is None:
+            pool = _pools[model_name] = EndpointPool(cfg.endpoints)
+        elif pool.urls != cfg.endpoints:
+            pool.set_urls(cfg.endpoints)
+        return pool
+
+
 def model_health(model_name: str) -> bool:
+    """Check every replica's /health, feeding the results to its breaker."""
+    pool = endpoint_pool(model_name)
+    healthy = False
+    for ep in pool.endpoints():
+        if _supervisor is not None and _supervisor.is_unloaded(ep.url):
+            continue  # Stopped on purpose; probing it would trip the breaker
+        start = time.perf_counter()
+        try:
+            ok = _http.get(ep.health_url, timeout=2).status_code == 200
+        except requests.RequestException:
+            ok = False
+        TRACER.record("health_check", start, url=ep.url, ok=ok)
+        if ok:
+            LATENCY.record(model_name, "connect", (time.perf_counter() - start) * 1000)
+        pool.report_health(ep.url, ok)
+        healthy = healthy or ok
+    return healthy
+
+
+def start_health_monitor(models: List[str], interval: float = 5.0) -> threading.Thread:
+    """Poll model_health() in the background so breakers track dead replicas."""
+    def loop() -> None:
+        while True:
+            for name in models:
+                if name in MODELS:
+                    model_health(name)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=loop, name="igris-health", daemon=True)
+    thread.start()
+    return thread
+
+
+def set_supervisor(supervisor: Optional["Supervisor"]) -> None:
+    """Route requests through a backend supervisor (None to disable)."""
+    global _supervisor
+    _supervisor = supervisor
+
+
+def get_supervisor() -> Optional["Supervisor"]:
+    return _supervisor
+
+
+def _ensure_backend(model_name: str, cancel: Optional["CancelToken"] = None) -> bool:
+    """Start the model's server if the supervisor manages it. False if it won't come up."""
+    if _supervisor is None:
+        return True
+    with TRACER.span("backend", model=model_name):
+        return _supervisor.ensure(model_name, cancel)
+
+
+@contextmanager
+def _scheduled(
+    model_name: str,
+    priority: int,
+    cancel: Optional["CancelToken"] = None,
+) -> Iterator[Optional[Grant]]:
+    """Hold a scheduler slot for the block; yields None if cancelled while queued."""
     cfg = MODELS[model_name]
-    health_url = cfg.url.replace("/completion", "/health")
+    start = time.perf_counter()
+    grant = SCHEDULER.acquire(
+        model_name, cfg.ram_mb, cfg.cpu_threads, priority,
+        cancelled=(lambda: cancel.cancelled) if cancel is not None else None,
+    )
+    TRACER.record("queue", start, model=model_name)
+    try:
+        yield grant
+    finally:
+        if grant is not None:
+            SCHEDULER.release(grant)
+
+
+@contextmanager
+def _post(
+    model_name: str,
+    payload: dict,
+    timeout: tuple[float, float],
+    stream: bool = False,
+    exclude: Sequence[str] = (),
+    cancel: Optional["CancelToken"] = None,
+) -> Iterator[Optional[requests.Response]]:
+    """
+    POST payload to the least-loaded available replica not in `exclude`.
+
+    Connection failures fail over to the next replica. Yields None if no
+    replica can be reached. The request's outcome is reported to the
+    replica's circuit breaker when the block exits. The chosen replica is
+    noted on `cancel`.
+    """
+    pool = endpoint_pool(model_name)
+    tried: List[str] = list(exclude)
+    while True:
+        ep = pool.acquire(exclude=tried)
+        if ep is None:
+            yield None
+            return
+        tried.append(ep.url)
+        if cancel is not None:
+            cancel.endpoint = ep.url
+        start = time.perf_counter()
+        try:
+            r = _http.post(ep.url, json=payload, timeout=timeout, stream=stream)
+            TRACER.record("connect", start, url=ep.url)
+            break
+        except requests.ConnectionError:
+            pool.release(ep, ok=False)
+        except BaseException:
+            pool.release(ep, ok=False)
+            raise
+
+    ok = True
     try:
-        r = requests.get(health_url, timeout=2)
-        return r.status_code == 200
+        with r:
+            yield r
+    except requests.HTTPError:
+        ok = r.status_code < 500  # Client errors say nothing about replica health
+        raise
     except requests.RequestException:
-        return False
+        ok = False
+        raise
+    finally:
+        pool.release(ep, ok)
 
 
-def run_model(model_name: str, prompt: str) -> dict:
-    cfg = MODELS[model_name]
+def _offline(model_name: str) -> dict:
+    return {
+        "model": model_name,
+        "output": "",
+        "latency_ms": None,
+        "error": "MODEL_OFFLINE",
+    }
+
+
+def _pin_slot(payload: dict, slot: Optional[int]) -> None:
+    """
+    Route a request to llama-server slot `slot` and reuse its cached prompt,
+    so a conversation's next turn only evaluates the new tokens.
+    """
+    if slot is not None:
+        payload["id_slot"] = slot
+        payload["cache_prompt"] = True
 
-    if not model_health(model_name):
-        return {
-            "model": model_name,
-            "output": "",
-            "latency_ms": None,
-            "error": "MODEL_OFFLINE",
-        }
+
+def run_model(
+    model_name: str,
+    prompt: str,
+    max_tokens: Optional[int] = None,
+    priority: int = INTERACTIVE,
+    slot: Optional[int] = None,
+) -> dict:
+    cfg = MODELS[model_name]
 
     payload = {
         "prompt": prompt,
-        "n_predict": cfg.max_tokens,
+        "n_predict": max_tokens or cfg.max_tokens,
         "temperature": cfg.temperature,
         "top_p": cfg.top_p,
         "repeat_penalty": cfg.repeat_penalty,
         "stop": cfg.stop,
     }
+    _pin_slot(payload, slot)
 
-    start = time.perf_counter()
-    r = requests.post(cfg.url, json=payload, timeout=cfg.timeout)
-    latency = round((time.perf_counter() - start) * 1000, 2)
-
-    r.raise_for_status()
-    data = r.json()
+    with _scheduled(model_name, priority) as grant:
+        if not _ensure_backend(model_name):
+            return _offline(model_name)
+        limits = deadlines(model_name, max_tokens)
+        start = time.perf_counter()
+        with _post(model_name, payload, timeout=(limits.connect, limits.total)) as r:
+            if r is None:
+                return _offline(model_name)
+            latency = round((time.perf_counter() - start) * 1000, 2)
+            r.raise_for_status()
+            data = r.json()
+    TRACER.record("generation", start, model=model_name)
 
     return {
         "model": model_name,
         "output": data.get("content", "").strip(),
         "latency_ms": latency,
+        "queue_ms": grant.queue_ms if grant else None,
         "error": None,
     }
 
 
+def run_model_batch(
+    model_name: str,
+    prompts: List[str],
+    max_tokens: Optional[int] = None,
+    priority: int = INTERACTIVE,
+) -> List[dict]:
+    """
+    Run several prompts in one request. llama-server gives each prompt its own
+    slot (start it with --parallel >= len(prompts)) and decodes them together.
+    Returns run_model()-style results in prompt order; latency_ms is the
+    whole request's. Raises requests.RequestException on a malformed reply.
+    """
+    cfg = MODELS[model_name]
+    payload = {
+        "prompt": prompts,
+        "n_predict": max_tokens or cfg.max_tokens,
+        "temperature": cfg.temperature,
+        "top_p": cfg.top_p,
+        "repeat_penalty": cfg.repeat_penalty,
+        "stop": cfg.stop,
+    }
+
+    with _scheduled(model_name, priority) as grant:
+        if not _ensure_backend(model_name):
+            return [_offline(model_name) for _ in prompts]
+        limits = deadlines(model_name, kind="batch")
+        start = time.perf_counter()
+        with _post(model_name, payload, timeout=(limits.connect, limits.total)) as r:
+            if r is None:
+                return [_offline(model_name) for _ in prompts]
+            latency = round((time.perf_counter() - start) * 1000, 2)
+            r.raise_for_status()
+            data = r.json()
+    LATENCY.record(model_name, "batch", latency)
+    TRACER.record("generation", start, model=model_name, prompts=len(prompts))
+
+    # One result per prompt, tagged with "index" by newer servers; a single
+    # prompt may come back unwrapped
+    items = data if isinstance(data, list) else [data]
+    if len(items) != len(prompts):
+        raise requests.RequestException(f"expected {len(prompts)} results, got {len(items)}")
+    if all("index" in item for item in items):
+        items = sorted(items, key=lambda item: item["index"])
+    return [{
+        "model": model_name,
+        "output": item.get("content", "").strip(),
+        "latency_ms": latency,
+        "queue_ms": grant.queue_ms if grant else None,
+        "error": None,
+    } for item in items]
+
+
+def run_embedding(
+    model_name: str,
+    texts: List[str],
+    priority: int = INTERACTIVE,
+) -> Optional[List[List[float]]]:
+    """
+    Embed texts in one request to a llama-server started with --embedding.
+    Returns one vector per text, or None if no replica is reachable.
+    """
+    with _scheduled(model_name, priority):
+        if not _ensure_backend(model_name):
+            return None
+        limits = deadlines(model_name, kind="embed")
+        start = time.perf_counter()
+        with _post(model_name, {"content": texts}, timeout=(limits.connect, limits.total)) as r:
+            if r is None:
+                return None
+            r.raise_for_status()
+            data = r.json()
+    LATENCY.record(model_name, "embed", (time.perf_counter() - start) * 1000)
+
+    # Newer servers return [{"index", "embedding"}, ...], older ones {"embedding"}
+    items = data if isinstance(data, list) else data.get("data") or [data]
+    items = sorted(items, key=lambda item: item.get("index", 0))
+    vectors = []
+    for item in items:
+        vec = item["embedding"]
+        if vec and isinstance(vec[0], list):
+            vec = vec[0]  # Pooled output is nested one level
+        vectors.append(vec)
+    if len(vectors) != len(texts):
+        raise requests.RequestException(
+            f"expected {len(texts)} embeddings, got {len(vectors)}"
+        )
+    return vectors
+
+
 def _cache_key(model_name: str, prompt: str) -> str:
-    """Generate a cache key for a prompt."""
+    """
+    Generate a cache key for a prompt. Shared by every session: a prompt
+    already carries the history and workspace state its answer depends on.
+    """
     content = f"{model_name}:{prompt}"
     return hashlib.md5(content.encode()).hexdigest()
 
@@ -113,94 +472,466 @@ def get_cached(model_name: str, prompt: str) -> Optional[dict]:
 
 
 def set_cached(model_name: str, prompt: str, response: dict) -> None:
-    """Cache a response."""
-    global _response_cache
-    # Evict oldest entries if cache is full
-    if len(_response_cache) >= MAX_CACHE_SIZE:
-        # Remove first 10 entries (simple FIFO)
-        keys = list(_response_cache.keys())[:10]
-        for k in keys:
-            del _response_cache[k]
-    
+    """Cache a response; the least recently used are evicted past MAX_CACHE_BYTES."""
     key = _cache_key(model_name, prompt)
-    _response_cache[key] = response
+    _response_cache.put(key, response)
 
 
 def clear_cache() -> int:
     """Clear all cached responses. Returns count of cleared items."""
-    global _response_cache
-    count = len(_response_cache)
-    _response_cache = {}
-    return count
+    return _response_cache.clear()
+
+
+def cache_stats() -> dict:
+    """Entries, stored bytes and compression ratio of the response cache."""
+    return _response_cache.stats()
+
+
+def _abort_response(r: requests.Response) -> None:
+    """Close a streaming response from any thread, unblocking its reader."""
+    # Shut the socket down first: close() alone waits for a blocked read.
+    # http.client may already have detached the socket from the connection
+    # (Connection: close), so also look behind the response's file object.
+    fp = getattr(getattr(r.raw, "_fp", None), "fp", None)
+    candidates = [
+        getattr(getattr(r.raw, "_connection", None), "sock", None),
+        getattr(getattr(fp, "raw", None), "_sock", None),
+    ]
+    for sock in candidates:
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+    r.close()
+
+
+class CancelToken:
+    """
+    Cancellation handle for a streaming request.
+
+    cancel() may be called from any thread. It closes the HTTP connection, so
+    llama-server stops generating, and run_model_streaming() returns the partial
+    output with error "CANCELLED".
+    """
+
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._response: Optional[requests.Response] = None
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+        self.endpoint: Optional[str] = None  # Replica URL serving the request, once chosen
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "CANCELLED") -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            r = self._response
+            callbacks, self._callbacks = self._callbacks, []
+        if r is not None:
+            _abort_response(r)
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Run callback when cancelled (immediately if already cancelled)."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def bind(self, r: Optional[requests.Response]) -> None:
+        """Attach the live response (or detach with None)."""
+        with self._lock:
+            self._response = r
+            abort = r is not None and self._event.is_set()
+        if abort and r is not None:
+            _abort_response(r)
+
+
+class _StreamWatch:
+    """Deadlines for one in-flight stream, enforced by the watchdog thread."""
+
+    def __init__(self, cancel: CancelToken, limits: Deadlines) -> None:
+        self.cancel = cancel
+        self.limits = limits
+        self.start = self.last = time.monotonic()
+        self.started = False
+        self.max_gap = 0.0
+
+    def touch(self) -> None:
+        """Record a token arriving."""
+        now = time.monotonic()
+        if self.started:
+            self.max_gap = max(self.max_gap, now - self.last)
+        self.started = True
+        self.last = now
+
+    def expired(self, now: float) -> Optional[str]:
+        if now - self.start > self.limits.total:
+            return "TIMEOUT_TOTAL"
+        if not self.started and now - self.start > self.limits.ttft:
+            return "TIMEOUT_TTFT"
+        if self.started and now - self.last > self.limits.idle:
+            return "TIMEOUT_IDLE"
+        return None
+
+
+_watches: set = set()
+_watch_lock = threading.Lock()
+_watchdog: Optional[threading.Thread] = None
+
+
+def _watchdog_loop() -> None:
+    while True:
+        time.sleep(WATCHDOG_INTERVAL)
+        now = time.monotonic()
+        with _watch_lock:
+            expired = [(w, w.expired(now)) for w in _watches]
+        for watch, reason in expired:
+            if reason:
+                watch.cancel.cancel(reason)
+
+
+def _watch(cancel: CancelToken, limits: Deadlines) -> _StreamWatch:
+    global _watchdog
+    watch = _StreamWatch(cancel, limits)
+    with _watch_lock:
+        _watches.add(watch)
+        if _watchdog is None:
+            _watchdog = threading.Thread(target=_watchdog_loop, name="igris-watchdog", daemon=True)
+            _watchdog.start()
+    return watch
+
+
+def _unwatch(watch: _StreamWatch) -> None:
+    with _watch_lock:
+        _watches.discard(watch)
 
 
 def run_model_streaming(
     model_name: str, 
     prompt: str, 
-    on_token: Callable[[str], None]
+    on_token: Callable[[str], None],
+    cancel: Optional[CancelToken] = None,
+    max_tokens: Optional[int] = None,
+    stop_detector: Optional[StopDetector] = None,
+    priority: int = INTERACTIVE,
+    slot: Optional[int] = None,
+    exclude: Sequence[str] = (),
+    stop: Sequence[str] = (),
 ) -> dict:
     """
     Run model with streaming output.
     Calls on_token(text) for each token received.
+    Returns early with error "CANCELLED" if cancel is triggered.
+    max_tokens overrides the model's n_predict for this request. When
+    stop_detector decides the answer is complete, the stream is closed (the
+    server stops generating) and the output is trimmed at the stop point.
+    The request first waits for a scheduler slot at `priority`; that wait is
+    reported as queue_ms, separate from latency_ms.
+    slot pins the request to a server slot (see _pin_slot).
+    exclude lists replica URLs not to send it to (see hedging.py). stop adds
+    stop sequences to the model's own.
     """
-    cfg = MODELS[model_name]
+    cancel = cancel or CancelToken()
+    with _scheduled(model_name, priority, cancel) as grant:
+        if grant is None:
+            return {"model": model_name, "output": "", "latency_ms": None,
+                    "ttft_ms": None, "queue_ms": None, "error": cancel.reason}
+        result = _stream(model_name, prompt, on_token, cancel, max_tokens, stop_detector, slot,
+                         exclude, stop)
+    result["queue_ms"] = grant.queue_ms
+    return result
 
-    if not model_health(model_name):
-        return {
-            "model": model_name,
-            "output": "",
-            "latency_ms": None,
-            "error": "MODEL_OFFLINE",
-        }
+
+def _stream(
+    model_name: str,
+    prompt: str,
+    on_token: Callable[[str], None],
+    cancel: CancelToken,
+    max_tokens: Optional[int],
+    stop_detector: Optional[StopDetector],
+    slot: Optional[int] = None,
+    exclude: Sequence[str] = (),
+    stop: Sequence[str] = (),
+) -> dict:
+    cfg = MODELS[model_name]
 
     payload = {
         "prompt": prompt,
-        "n_predict": cfg.max_tokens,
+        "n_predict": max_tokens or cfg.max_tokens,
         "temperature": cfg.temperature,
         "top_p": cfg.top_p,
         "repeat_penalty": cfg.repeat_penalty,
-        "stop": cfg.stop,
+        "stop": cfg.stop + list(stop),
         "stream": True,
     }
+    _pin_slot(payload, slot)
 
+    # A cold start happens before the deadlines below start counting
+    if not _ensure_backend(model_name, cancel):
+        if cancel.cancelled:
+            return {"model": model_name, "output": "", "latency_ms": None,
+                    "ttft_ms": None, "error": cancel.reason}
+        return _offline(model_name)
+    limits = deadlines(model_name, max_tokens)
     start = time.perf_counter()
     full_output = []
+    ttft = None
+    first = start
+    watch = _watch(cancel, limits)
     
     try:
-        with requests.post(cfg.url, json=payload, timeout=cfg.timeout, stream=True) as r:
-            r.raise_for_status()
-            for line in r.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
-                    if line.startswith('data: '):
-                        data = line[6:]
-                        if data.strip() == '[DONE]':
-                            break
-                        try:
-                            chunk = json.loads(data)
-                            token = chunk.get('content', '')
-                            if token:
-                                full_output.append(token)
-                                on_token(token)
-                        except json.JSONDecodeError:
-                            continue
+        # The socket read timeout is only a backstop; the watchdog enforces
+        # the TTFT, idle-gap and total deadlines
+        with _post(model_name, payload, timeout=(limits.connect, limits.total), stream=True,
+                   exclude=exclude, cancel=cancel) as r:
+            if r is None:
+                return _offline(model_name)
+            cancel.bind(r)
+            try:
+                r.raise_for_status()
+                for line in r.iter_lines():
+                    if cancel.cancelled:
+                        break
+                    if line:
+                        line = line.decode('utf-8')
+                        if line.startswith('data: '):
+                            data = line[6:]
+                            if data.strip() == '[DONE]':
+                                break
+                            try:
+                                chunk = json.loads(data)
+                                token = chunk.get('content', '')
+                                if token:
+                                    watch.touch()
+                                    if ttft is None:
+                                        first = time.perf_counter()
+                                        ttft = round((first - start) * 1000, 2)
+                                        LATENCY.record(model_name, "ttft", ttft)
+                                        TRACER.record("ttft", start, first, model=model_name)
+                                    if stop_detector and stop_detector.feed(token):
+                                        token = stop_detector.kept(token)
+                                        if token:
+                                            full_output.append(token)
+                                            on_token(token)
+                                        break  # Leaving the block closes the stream
+                                    full_output.append(token)
+                                    on_token(token)
+                            except json.JSONDecodeError:
+                                continue
+            except Exception:
+                # Reads fail in odd ways once the socket is torn down
+                if not cancel.cancelled:
+                    raise
+            finally:
+                cancel.bind(None)
+            if cancel.reason and cancel.reason.startswith("TIMEOUT"):
+                # Counts against the replica's circuit breaker
+                raise requests.Timeout(cancel.reason)
     except requests.RequestException as e:
         return {
             "model": model_name,
             "output": "".join(full_output),
             "latency_ms": None,
+            "ttft_ms": ttft,
             "error": str(e),
         }
+    finally:
+        _unwatch(watch)
 
     latency = round((time.perf_counter() - start) * 1000, 2)
-    
+    if ttft is not None:
+        TRACER.record("generation", first, model=model_name, tokens=len(full_output))
+
+    if cancel.cancelled:
+        return {
+            "model": model_name,
+            "output": "".join(full_output),
+            "latency_ms": latency,
+            "ttft_ms": ttft,
+            "error": cancel.reason,
+        }
+
+    if ttft is not None and len(full_output) > 1:
+        per_token = (latency - ttft) / (len(full_output) - 1)
+        LATENCY.record(model_name, "token", per_token)
+    if watch.max_gap:
+        LATENCY.record(model_name, "gap", watch.max_gap * 1000)
+    output = "".join(full_output)
+    if stop_detector and stop_detector.reason:
+        output = stop_detector.output()  # A loop is cut back to its first occurrence
     return {
         "model": model_name,
-        "output": "".join(full_output).strip(),
+        "output": output.strip(),
         "latency_ms": latency,
+        "ttft_ms": ttft,
+        "stop_reason": stop_detector.reason if stop_detector else None,
         "error": None,
     }
 
+class _Flight:
+    """A generation in progress that identical requests can attach to."""
+
+    def __init__(self) -> None:
+        self.tokens: List[str] = []
+        self.result: Optional[dict] = None
+        self.exc: Optional[BaseException] = None
+        self.done = False
+        self.cancelled = False  # The leader's own request was cancelled
+        self.cond = threading.Condition()
+
+    def push(self, token: str) -> None:
+        with self.cond:
+            self.tokens.append(token)
+            self.cond.notify_all()
+
+    def finish(
+        self,
+        result: Optional[dict],
+        exc: Optional[BaseException] = None,
+        cancelled: bool = False,
+    ) -> None:
+        with self.cond:
+            self.result = result
+            self.exc = exc
+            self.cancelled = cancelled
+            self.done = True
+            self.cond.notify_all()
+
+    def _wake(self) -> None:
+        with self.cond:
+            self.cond.notify_all()
+
+    def follow(
+        self,
+        on_token: Optional[Callable[[str], None]],
+        cancel: Optional[CancelToken] = None,
+    ) -> Optional[dict]:
+        """
+        Replay tokens seen so far, then stream the rest as they arrive.
+        Returns None if the leader was cancelled, so the follower can retry,
+        or if the follower's own cancel fires.
+        """
+        if cancel is not None:
+            cancel.on_cancel(self._wake)
+        seen = 0
+        while True:
+            with self.cond:
+                while seen >= len(self.tokens) and not self.done and \
+                        not (cancel is not None and cancel.cancelled):
+                    self.cond.wait()
+                pending = self.tokens[seen:]
+                seen = len(self.tokens)
+                done = self.done
+            if on_token:
+                for token in pending:
+                    on_token(token)
+            if cancel is not None and cancel.cancelled:
+                return None
+            if done:
+                if self.cancelled:
+                    return None
+                if self.exc is not None:
+                    raise self.exc
+                assert self.result is not None
+                return self.result
+
+
+def run_model_coalesced(
+    model_name: str,
+    prompt: str,
+    on_token: Optional[Callable[[str], None]] = None,
+    runner: Optional[Callable[[str, str, Callable[[str], None]], dict]] = None,
+    cancel: Optional[CancelToken] = None,
+) -> dict:
+    """
+    Run a model, sharing one generation among identical concurrent requests.
+
+    The first caller for a (model, prompt) pair becomes the leader and runs the
+    generation; later callers attach to it and receive the same tokens in real
+    time. A successful result is cached once, by the leader. If the leader's
+    request is cancelled, its followers retry and one of them leads a new
+    generation; on_token only gets that generation's text past what the caller
+    was already shown (an identical prompt usually regenerates the same start).
+    A follower whose own cancel fires stops waiting and returns the partial
+    output with the cancel reason as its error.
+    Streams when on_token is given, otherwise runs a regular request.
+    runner(model_name, prompt, on_token) replaces the default streaming call;
+    cancel only reaches the default call, so a runner binds its own.
+    """
+    key = _cache_key(model_name, prompt)
+    shown: List[str] = []  # Text delivered to on_token, across retries
+    delivered = 0  # Its length
+    position = 0  # Characters of the current generation relayed so far
+
+    def deliver(token: str) -> None:
+        nonlocal delivered, position
+        start, position = position, position + len(token)
+        fresh = token[max(0, delivered - start):]
+        if fresh:
+            shown.append(fresh)
+            delivered += len(fresh)
+            if on_token:
+                on_token(fresh)
+
+    while True:
+        position = 0
+        with _inflight_lock:
+            following = _inflight.get(key)
+            if following is None:
+                cached = _response_cache.get(key)
+                if cached:
+                    return cached
+                flight = _inflight[key] = _Flight()
+                break
+        followed = following.follow(deliver, cancel)
+        if cancel is not None and cancel.cancelled:
+            return {"model": model_name, "output": "".join(shown), "latency_ms": None,
+                    "error": cancel.reason, "coalesced": True}
+        if followed is not None:
+            return {**followed, "coalesced": True}
+
+    def relay(token: str) -> None:
+        flight.push(token)
+        deliver(token)
+
+    try:
+        if runner:
+            result = runner(model_name, prompt, relay)
+        elif on_token:
+            result = run_model_streaming(model_name, prompt, relay, cancel=cancel)
+        else:
+            result = run_model(model_name, prompt)
+            if result["output"]:
+                flight.push(result["output"])
+        # A hedged runner may answer with another model; don't cache that under this key.
+        # Answers built on impure tool results (see tools.py) aren't cached either.
+        if not result["error"] and result["model"] == model_name and result.get("cacheable", True):
+            set_cached(model_name, prompt, result)
+    except KeyboardInterrupt:
+        # The leader's user gave up, not its followers: they retry
+        flight.finish(None, cancelled=True)
+        raise
+    except BaseException as e:
+        flight.finish(None, e)
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+    flight.finish(result, cancelled=result["error"] == "CANCELLED")
+    return result
+
 
 def load_file(path: Path) -> str:
     """Load text content from a file."""
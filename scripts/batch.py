@@ -0,0 +1,314 @@
+"""
+IGRIS Batch Mode
+
+Streams a JSONL file of prompts through both backends concurrently and writes
+results as a JSONL stream. Progress is checkpointed so an interrupted run
+resumes where it stopped.
+
+Input lines:  {"id": "...", "input": "..."}   ("prompt" is accepted for "input")
+Output lines: {"line": n, "id": ..., "route": ..., "model": ..., "output": ...,
+               "latency_ms": ..., "error": ...}
+
+With --micro-batch, items for the same model are grouped into multi-prompt
+requests (see microbatch.py); answers are then not stop-detected.
+"""
+
+import argparse
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+try:
+    from .base import CancelToken, run_model_coalesced, run_model_streaming
+    from .microbatch import MicroBatcher
+    from .orchestrator import build_prompt, fast_route, request_options, select_model
+    from .config import init_config
+    from .supervisor import start_from_env
+    from .scheduler import BATCH
+    from .logger import log_system_event
+    from .formatting import print_status
+except ImportError:
+    from base import CancelToken, run_model_coalesced, run_model_streaming
+    from microbatch import MicroBatcher
+    from orchestrator import build_prompt, fast_route, request_options, select_model
+    from config import init_config
+    from supervisor import start_from_env
+    from scheduler import BATCH
+    from logger import log_system_event
+    from formatting import print_status
+
+# Concurrent requests per backend (CPU-bound servers, keep these small)
+DEFAULT_LIMITS = {"qwen": 2, "deepseek": 1}
+
+# Max distance between the oldest unfinished line and the newest submitted one.
+# Bounds memory (pending items + checkpoint) regardless of input size.
+DEFAULT_WINDOW = 64
+
+# Persist the checkpoint every N completed lines
+CHECKPOINT_EVERY = 10
+
+
+class Checkpoint:
+    """
+    Resumable progress for one batch run.
+
+    All lines below `watermark` are finished; `done` holds finished lines above
+    it (at most one window's worth). `output_offset` is the size of the output
+    file when the checkpoint was saved, so a resumed run can drop any results
+    written after it and redo those lines without duplicating output.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.watermark = 0
+        self.done: set[int] = set()
+        self.output_offset = 0
+
+    @classmethod
+    def load(cls, path: Path) -> "Checkpoint":
+        ckpt = cls(path)
+        if path.exists():
+            data = json.loads(path.read_text())
+            ckpt.watermark = data["watermark"]
+            ckpt.done = set(data["done"])
+            ckpt.output_offset = data["output_offset"]
+        return ckpt
+
+    def is_done(self, line: int) -> bool:
+        return line < self.watermark or line in self.done
+
+    def mark(self, line: int) -> None:
+        self.done.add(line)
+        while self.watermark in self.done:
+            self.done.discard(self.watermark)
+            self.watermark += 1
+
+    def save(self, output_offset: int) -> None:
+        self.output_offset = output_offset
+        data = {
+            "watermark": self.watermark,
+            "done": sorted(self.done),
+            "output_offset": output_offset,
+        }
+        tmp = self.path.with_suffix(self.path.suffix + ".tmp")
+        tmp.write_text(json.dumps(data))
+        os.replace(tmp, self.path)
+
+
+def parse_item(raw: str) -> tuple[object, str]:
+    """Return (id, user_input) for an input line. Raises ValueError if invalid."""
+    try:
+        item = json.loads(raw)
+    except json.JSONDecodeError as e:
+        raise ValueError("invalid JSON") from e
+    if not isinstance(item, dict):
+        raise ValueError("expected an object")
+    user_input = item.get("input", item.get("prompt"))
+    if not isinstance(user_input, str) or not user_input.strip():
+        raise ValueError("missing input")
+    return item.get("id"), user_input
+
+
+def process_item(
+    line_no: int,
+    item_id: object,
+    user_input: str,
+    batcher: Optional[MicroBatcher] = None,
+    cancel: Optional[CancelToken] = None,
+) -> dict:
+    """
+    Route and run a single item, through `batcher` if given. Never raises.
+    `cancel` stops its generation (micro-batched requests run to the end).
+    """
+    route = fast_route(user_input)
+    model, _ = select_model(route)
+    prompt = build_prompt(user_input, model, include_history=False)
+
+    def runner(model_name: str, prompt: str, on_token: Callable[[str], None]) -> dict:
+        # Per-item n_predict and client-side stop detection, as in orchestrate()
+        options = request_options(user_input, model_name, route, priority=BATCH)
+        if batcher is not None:
+            return batcher.run(model_name, prompt, options["max_tokens"])
+        return run_model_streaming(model_name, prompt, on_token, cancel=cancel, **options)
+
+    try:
+        response = run_model_coalesced(model, prompt, runner=runner, cancel=cancel)
+    except Exception as e:  # Keep the batch running; record the failure
+        response = {"output": "", "latency_ms": None, "error": str(e)}
+
+    return {
+        "line": line_no,
+        "id": item_id,
+        "route": route,
+        "model": model,
+        "output": response["output"],
+        "latency_ms": response["latency_ms"],
+        "queue_ms": response.get("queue_ms"),
+        "error": response["error"],
+    }
+
+
+def run_batch(
+    input_path: Path,
+    output_path: Path,
+    limits: Optional[Dict[str, int]] = None,
+    window: int = DEFAULT_WINDOW,
+    resume: bool = True,
+    batcher: Optional[MicroBatcher] = None,
+) -> dict:
+    """
+    Process every line of input_path, appending results to output_path.
+
+    Each backend gets its own worker pool sized by `limits`, so a slow deepseek
+    queue never starves qwen items. With a batcher, `limits` counts batches:
+    each pool runs enough items to fill that many. Returns counts of
+    processed/skipped/errors.
+    """
+    limits = {**DEFAULT_LIMITS, **(limits or {})}
+    if batcher is not None:
+        limits = {m: n * batcher.max_batch for m, n in limits.items()}
+    ckpt_path = output_path.with_name(output_path.name + ".ckpt")
+    ckpt = Checkpoint.load(ckpt_path) if resume else Checkpoint(ckpt_path)
+
+    # Drop results written after the last checkpoint; those lines are redone.
+    mode = "r+" if resume and output_path.exists() else "w"
+    out = open(output_path, mode)
+    out.truncate(ckpt.output_offset if mode == "r+" else 0)
+    out.seek(0, os.SEEK_END)
+
+    pools = {m: ThreadPoolExecutor(max_workers=n, thread_name_prefix=f"batch-{m}")
+             for m, n in limits.items()}
+    cond = threading.Condition()
+    stats = {"processed": 0, "skipped": 0, "errors": 0}
+    since_save = 0
+    stopped = False  # Interrupted: items still finishing are redone next run
+    running: Dict[int, CancelToken] = {}  # Submitted items by line, to stop on interrupt
+
+    def complete(line_no: int, record: Optional[dict]) -> None:
+        nonlocal since_save
+        with cond:
+            running.pop(line_no, None)
+            if stopped:
+                return
+            if record is not None:
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+                stats["processed"] += 1
+                if record["error"]:
+                    stats["errors"] += 1
+            ckpt.mark(line_no)
+            since_save += 1
+            if since_save >= CHECKPOINT_EVERY:
+                ckpt.save(out.tell())
+                since_save = 0
+            cond.notify_all()
+
+    def work(line_no: int, item_id: object, user_input: str, cancel: CancelToken) -> None:
+        try:
+            record = process_item(line_no, item_id, user_input, batcher, cancel)
+        except Exception as e:
+            record = {"line": line_no, "id": item_id, "route": None, "model": None,
+                      "output": "", "latency_ms": None, "error": str(e)}
+        complete(line_no, record)
+
+    log_system_event("BATCH_START", {"input": str(input_path), "resume_from": ckpt.watermark})
+    try:
+        with open(input_path) as f:
+            for line_no, raw in enumerate(f):
+                if ckpt.is_done(line_no):
+                    stats["skipped"] += 1
+                    continue
+                with cond:
+                    while line_no - ckpt.watermark >= window:
+                        cond.wait()
+                if not raw.strip():
+                    complete(line_no, None)
+                    continue
+                try:
+                    item_id, user_input = parse_item(raw)
+                except ValueError:
+                    complete(line_no, {"line": line_no, "id": None, "route": None,
+                                       "model": None, "output": "", "latency_ms": None,
+                                       "error": "INVALID_INPUT"})
+                    continue
+                model, _ = select_model(fast_route(user_input))
+                pool = pools.get(model) or next(iter(pools.values()))
+                cancel = CancelToken()
+                with cond:
+                    running[line_no] = cancel
+                pool.submit(work, line_no, item_id, user_input, cancel)
+        for pool in pools.values():
+            pool.shutdown(wait=True)
+    except BaseException:
+        # Ctrl-C: don't run out the queued window or the generations in
+        # progress; keep only what has finished
+        with cond:
+            stopped = True
+            ckpt.save(out.tell())
+            cancels = list(running.values())
+        for pool in pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        for cancel in cancels:
+            cancel.cancel()
+        out.close()
+        raise
+
+    with cond:
+        ckpt.save(out.tell())
+    out.close()
+
+    log_system_event("BATCH_END", stats)
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a JSONL file of prompts through IGRIS.")
+    parser.add_argument("input", type=Path, help="input JSONL file")
+    parser.add_argument("output", type=Path, help="output JSONL file")
+    parser.add_argument("--qwen", type=int, default=DEFAULT_LIMITS["qwen"],
+                        help="concurrent qwen requests")
+    parser.add_argument("--deepseek", type=int, default=DEFAULT_LIMITS["deepseek"],
+                        help="concurrent deepseek requests")
+    parser.add_argument("--window", type=int, default=DEFAULT_WINDOW,
+                        help="max lines in flight ahead of the oldest unfinished one")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore any checkpoint and start from the first line")
+    parser.add_argument("--micro-batch", action="store_true",
+                        help="group items into multi-prompt requests")
+    parser.add_argument("--batch-size", type=int,
+                        help="max prompts per request (at most the servers' --parallel; "
+                             "default IGRIS_BATCH_SIZE or 4)")
+    parser.add_argument("--batch-window-ms", type=float,
+                        help="how long the first item of a batch waits for others "
+                             "(default IGRIS_BATCH_WINDOW_MS or 20)")
+    args = parser.parse_args()
+
+    init_config()
+    start_from_env()
+    batcher = None
+    if args.micro_batch:
+        batcher = MicroBatcher(window_ms=args.batch_window_ms, max_batch=args.batch_size)
+    try:
+        stats = run_batch(
+            args.input,
+            args.output,
+            limits={"qwen": args.qwen, "deepseek": args.deepseek},
+            window=args.window,
+            resume=not args.restart,
+            batcher=batcher,
+        )
+    finally:
+        if batcher is not None:
+            batcher.close()
+    print_status(
+        f"[BATCH] processed={stats['processed']} skipped={stats['skipped']} "
+        f"errors={stats['errors']}",
+        "bold green",
+    )
+
+
+if __name__ == "__main__":
+    main()
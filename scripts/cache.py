@@ -0,0 +1,198 @@
+"""
+IGRIS Response Cache
+
+Storage for cached responses (see base.get_cached). Outputs live in a
+content-addressed blob store: each output is hashed once, and identical
+outputs reached through different prompts share one blob. Blobs larger than
+COMPRESS_MIN bytes are compressed (zlib by default, lzma optional) when that
+makes them smaller. Entries map a cache key to the response metadata and a
+blob reference.
+
+Capacity is a byte budget over stored blobs plus a fixed per-entry overhead,
+with least-recently-used eviction. On code, zlib fits two to three times as
+many answers in the same budget, before dedup.
+
+Measure the compression ratio and decompression latency on a hit with:
+python scripts/cache.py bench
+"""
+
+import argparse
+import hashlib
+import lzma
+import statistics
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+MAX_CACHE_BYTES = 4 * 1024 * 1024
+ENTRY_OVERHEAD = 256  # Key, metadata and bookkeeping per entry (approximate)
+COMPRESS_MIN = 512  # Smaller outputs are stored as-is
+ZLIB_LEVEL = 6
+
+CODECS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "raw": (lambda b: b, lambda b: b),
+    "zlib": (lambda b: zlib.compress(b, ZLIB_LEVEL), zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+@dataclass
+class Blob:
+    data: bytes
+    codec: str
+    size: int  # Uncompressed bytes
+    refs: int = 0
+
+
+class ResponseCache:
+    """Response dicts by key; outputs deduplicated and compressed."""
+
+    def __init__(self, max_bytes: int = MAX_CACHE_BYTES, codec: str = "zlib") -> None:
+        if codec not in CODECS:
+            raise ValueError(f"unknown codec: {codec}")
+        self.max_bytes = max_bytes
+        self.codec = codec
+        self._entries: "OrderedDict[str, Tuple[dict, str]]" = OrderedDict()
+        self._blobs: Dict[str, Blob] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            meta, ref = entry
+            blob = self._blobs[ref]
+        # Decompress outside the lock; blobs are immutable
+        output = CODECS[blob.codec][1](blob.data).decode("utf-8")
+        return {**meta, "output": output}
+
+    def put(self, key: str, response: dict) -> None:
+        raw = response.get("output", "").encode("utf-8")
+        ref = hashlib.blake2b(raw, digest_size=16).hexdigest()
+        meta = {k: v for k, v in response.items() if k != "output"}
+        with self._lock:
+            known = ref in self._blobs
+        blob = None if known else self._encode(raw)  # Compress outside the lock
+
+        with self._lock:
+            self._remove(key)
+            if ref not in self._blobs:
+                if blob is None:  # Evicted since the check above
+                    blob = self._encode(raw)
+                self._blobs[ref] = blob
+                self._bytes += len(blob.data)
+            self._blobs[ref].refs += 1
+            self._entries[key] = (meta, ref)
+            self._bytes += ENTRY_OVERHEAD
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self) -> int:
+        """Drop everything; returns the number of entries removed."""
+        with self._lock:
+            count = len(self._entries)
+            self._entries.clear()
+            self._blobs.clear()
+            self._bytes = 0
+            return count
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stored = sum(len(b.data) for b in self._blobs.values())
+            referenced = sum(self._blobs[ref].size for _, ref in self._entries.values())
+            return {
+                "entries": len(self._entries),
+                "blobs": len(self._blobs),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                # Output bytes served per byte stored, counting dedup and compression
+                "ratio": round(referenced / stored, 2) if stored else None,
+            }
+
+    def _encode(self, raw: bytes) -> Blob:
+        if len(raw) >= COMPRESS_MIN and self.codec != "raw":
+            packed = CODECS[self.codec][0](raw)
+            if len(packed) < len(raw):
+                return Blob(packed, self.codec, len(raw))
+        return Blob(raw, "raw", len(raw))
+
+    def _remove(self, key: str) -> None:
+        # With self._lock held
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= ENTRY_OVERHEAD
+        blob = self._blobs[entry[1]]
+        blob.refs -= 1
+        if blob.refs == 0:
+            del self._blobs[entry[1]]
+            self._bytes -= len(blob.data)
+
+
+# -- benchmark --
+
+def sample_outputs(size: int, count: int) -> List[str]:
+    """Code of `size` bytes each: slices of this package's own source."""
+    source = "".join(p.read_text() for p in sorted(Path(__file__).parent.glob("*.py")))
+    step = max(1, (len(source) - size) // count)
+    return [source[i * step:i * step + size] for i in range(count)]
+
+
+def benchmark(sizes: List[int], hits: int = 2000) -> List[dict]:
+    """Compression ratio, and hit latency per codec and output size."""
+    rows = []
+    for size in sizes:
+        for codec in CODECS:
+            cache = ResponseCache(max_bytes=1 << 40, codec=codec)
+            outputs = sample_outputs(size, 50)
+            start = time.perf_counter()
+            for i, output in enumerate(outputs):
+                cache.put(f"k{i}", {"model": "deepseek", "output": output, "error": None})
+            put_us = (time.perf_counter() - start) * 1e6 / len(outputs)
+            times = []
+            for i in range(hits):
+                t = time.perf_counter()
+                cache.get(f"k{i % len(outputs)}")
+                times.append((time.perf_counter() - t) * 1e6)
+            times.sort()
+            stats = cache.stats()
+            rows.append({
+                "size": size,
+                "codec": codec,
+                "ratio": stats["ratio"],
+                "entries_per_mb": int(len(outputs) * (1 << 20) / stats["bytes"]),
+                "put_us": round(put_us, 1),
+                "hit_p50_us": round(statistics.median(times), 1),
+                "hit_p95_us": round(times[int(0.95 * len(times))], 1),
+            })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="IGRIS response cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="compression ratio and hit latency per codec")
+    bench.add_argument("--sizes", type=int, nargs="+", default=[256, 2048, 16384, 65536])
+    bench.add_argument("--hits", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'size':>7} {'codec':>5} {'ratio':>6} {'entries/MB':>10} "
+          f"{'put us':>8} {'hit p50 us':>10} {'hit p95 us':>10}")
+    for row in benchmark(args.sizes, args.hits):
+        print(f"{row['size']:>7} {row['codec']:>5} {row['ratio']:>6} {row['entries_per_mb']:>10} "
+              f"{row['put_us']:>8} {row['hit_p50_us']:>10} {row['hit_p95_us']:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+"""
+IGRIS Backend Cassettes
+
+Records real exchanges with the llama-servers and plays them back later, for
+deterministic, network-free runs with realistic token timing. A requests
+transport adapter is mounted on base._http, so everything above it (the
+endpoint pools, streaming, stop detection, hedging, the orchestrator) runs
+unchanged.
+
+- record: requests go to the servers as usual. Each request's method, path
+  and JSON body are saved with the response status, headers, the time until
+  the headers arrived, and the body chunks, each with the delay since the
+  previous one (for a completion stream, the first is the prompt evaluation
+  time). Saved as gzipped JSON.
+- replay: requests are answered from the cassette, chunks paced by the
+  recorded delays divided by `speed` (0 means no delays). Identical requests
+  get their recordings in order, the last one repeating once they run out.
+  An unrecorded request fails like an unreachable server.
+
+Record or replay a REPL session with IGRIS_CASSETTE=path and
+IGRIS_CASSETTE_MODE=record|replay (IGRIS_REPLAY_SPEED to pace it). Summarize
+a cassette with: python scripts/cassette.py show <path>
+"""
+
+import argparse
+import atexit
+import gzip
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+VERSION = 1
+KEPT_HEADERS = ("content-type",)
+
+Key = Tuple[str, str, str]  # (method, path, canonical body)
+# BaseAdapter.send()'s parameters, as typed by requests
+Timeout = Union[None, float, Tuple[Optional[float], Optional[float]]]
+Cert = Union[None, str, Tuple[str, str]]
+
+
+def request_key(request: requests.PreparedRequest) -> Key:
+    """What identifies a request in a cassette; the host is left out so ports can change."""
+    raw = request.body or b""
+    if isinstance(raw, bytes):
+        body = raw.decode("utf-8", "surrogateescape")
+    else:
+        body = raw if isinstance(raw, str) else ""  # Streamed uploads aren't keyed
+    try:
+        body = json.dumps(json.loads(body), sort_keys=True, separators=(",", ":"))
+    except ValueError:
+        pass
+    return request.method or "GET", urlsplit(request.url or "").path, body
+
+
+class Cassette:
+    """Recorded interactions, in the order they finished."""
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = path
+        self.interactions: List[dict] = []
+        self._queues: Dict[Key, Deque[dict]] = {}
+        self._last: Dict[Key, dict] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path) -> "Cassette":
+        cassette = cls(path)
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != VERSION:
+            raise ValueError(f"unsupported cassette version: {data.get('version')}")
+        for interaction in data["interactions"]:
+            cassette.add(interaction)
+        return cassette
+
+    def save(self, path: Optional[Path] = None) -> Path:
+        path = path or self.path
+        if path is None:
+            raise ValueError("no cassette path")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with self._lock:
+            data = {"version": VERSION, "interactions": list(self.interactions)}
+        with gzip.open(tmp, "wt", encoding="utf-8") as f:
+            json.dump(data, f, separators=(",", ":"))
+        os.replace(tmp, path)
+        return path
+
+    def add(self, interaction: dict) -> None:
+        key = (interaction["method"], interaction["path"], interaction["body"])
+        with self._lock:
+            self.interactions.append(interaction)
+            self._queues.setdefault(key, deque()).append(interaction)
+
+    def next_for(self, key: Key) -> Optional[dict]:
+        """The next recording for a request; the last one again once they run out."""
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue:
+                self._last[key] = queue.popleft()
+            return self._last.get(key)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self.interactions)
+
+
+class _RecordingBody:
+    """Wraps a urllib3 response body, noting each chunk and when it arrived."""
+
+    def __init__(self, raw: Any, on_done: Callable[[List[list]], None], start: float) -> None:
+        self._raw = raw
+        self._on_done = on_done
+        self._chunks: List[list] = []
+        self._last = start
+        self._done = False
+
+    def _note(self, chunk: bytes) -> None:
+        now = time.perf_counter()
+        if chunk:
+            self._chunks.append([round((now - self._last) * 1000, 2),
+                                 chunk.decode("utf-8", "surrogateescape")])
+        self._last = now
+
+    def stream(self, amt: int = 2 ** 16, decode_content: Optional[bool] = None) -> Iterator[bytes]:
+        for chunk in self._raw.stream(amt, decode_content=decode_content):
+            self._note(chunk)
+            yield chunk
+        self._finish()
+
+    def read(self, amt: Optional[int] = None, *args: Any, **kwargs: Any) -> bytes:
+        chunk: bytes = self._raw.read(amt, *args, **kwargs)
+        self._note(chunk)
+        if not chunk:
+            self._finish()
+        return chunk
+
+    def close(self) -> None:
+        self._finish()  # A stream closed early is recorded up to where it stopped
+        self._raw.close()
+
+    def _finish(self) -> None:
+        if not self._done:
+            self._done = True
+            self._on_done(self._chunks)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._raw, name)
+
+
+class _ReplayBody:
+    """A response body played back from recorded chunks at a chosen speed."""
+
+    def __init__(self, chunks: List[list], speed: float, read_timeout: Optional[float]) -> None:
+        self._chunks = chunks
+        self._speed = speed
+        self._read_timeout = read_timeout
+        self._closed = threading.Event()
+        self._buffer = b""
+        self._position = 0
+
+    def _next(self) -> Optional[bytes]:
+        if self._closed.is_set() or self._position >= len(self._chunks):
+            return None
+        delay_ms: float = self._chunks[self._position][0]
+        text: str = self._chunks[self._position][1]
+        self._position += 1
+        delay = delay_ms / 1000 / self._speed if self._speed else 0.0
+        if self._read_timeout is not None and delay > self._read_timeout:
+            self._closed.wait(self._read_timeout)
+            raise requests.exceptions.ConnectionError("Read timed out (replayed)")
+        if delay and self._closed.wait(delay):
+            return None  # Closed while waiting, like a cancelled stream
+        return text.encode("utf-8", "surrogateescape")
+
+    def stream(self, amt: int = 2 ** 16, decode_content: Optional[bool] = None) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(amt)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, amt: Optional[int] = None, *args: Any, **kwargs: Any) -> bytes:
+        while not self._buffer or (amt is None and self._position < len(self._chunks)):
+            chunk = self._next()
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if amt is None:
+            amt = len(self._buffer)
+        data, self._buffer = self._buffer[:amt], self._buffer[amt:]
+        return data
+
+    def close(self) -> None:
+        self._closed.set()
+
+    def release_conn(self) -> None:
+        pass
+
+
+class CassetteAdapter(BaseAdapter):
+    """Transport adapter that records to or replays from a Cassette."""
+
+    def __init__(
+        self,
+        cassette: Cassette,
+        mode: str,
+        speed: float = 1.0,
+        real: Optional[BaseAdapter] = None,
+    ) -> None:
+        super().__init__()
+        if mode not in ("record", "replay"):
+            raise ValueError(f"unknown cassette mode: {mode}")
+        self.cassette = cassette
+        self.mode = mode
+        self.speed = speed
+        self.real = real or HTTPAdapter()
+        self.misses = 0
+
+    def send(
+        self,
+        request: requests.PreparedRequest,
+        stream: bool = False,
+        timeout: Timeout = None,
+        verify: Union[bool, str] = True,
+        cert: Cert = None,
+        proxies: Optional[Dict[str, str]] = None,
+    ) -> requests.Response:
+        if self.mode == "record":
+            return self._record(request, stream, timeout, verify, cert, proxies)
+        return self._replay(request, timeout)
+
+    def _record(
+        self,
+        request: requests.PreparedRequest,
+        stream: bool,
+        timeout: Timeout,
+        verify: Union[bool, str],
+        cert: Cert,
+        proxies: Optional[Dict[str, str]],
+    ) -> requests.Response:
+        start = time.perf_counter()
+        response = self.real.send(request, stream=True, timeout=timeout, verify=verify,
+                                  cert=cert, proxies=proxies)
+        headers_at = time.perf_counter()
+        method, path, body = request_key(request)
+        headers = {k: v for k, v in response.headers.items() if k.lower() in KEPT_HEADERS}
+
+        def done(chunks: List[list]) -> None:
+            self.cassette.add({"method": method, "path": path, "body": body,
+                               "status": response.status_code, "headers": headers,
+                               "headers_ms": round((headers_at - start) * 1000, 2),
+                               "chunks": chunks})
+        response.raw = _RecordingBody(response.raw, done, headers_at)
+        return response
+
+    def _replay(self, request: requests.PreparedRequest, timeout: Timeout) -> requests.Response:
+        recorded = self.cassette.next_for(request_key(request))
+        if recorded is None:
+            self.misses += 1
+            raise requests.ConnectionError(f"no recording for {request.method} {request.url}",
+                                           request=request)
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if self.speed:
+            time.sleep(recorded.get("headers_ms", 0) / 1000 / self.speed)
+        response = requests.Response()
+        response.status_code = recorded["status"]
+        response.headers = CaseInsensitiveDict(recorded["headers"])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.raw = _ReplayBody(recorded["chunks"], self.speed, read_timeout)
+        response.reason = "Replayed"
+        response.url = request.url or ""
+        response.request = request
+        # requests types this as HTTPAdapter, but only calls send() on it (redirects)
+        response.connection = self  # type: ignore[assignment]
+        return response
+
+    def close(self) -> None:
+        self.real.close()
+
+
+@contextmanager
+def _mounted(session: requests.Session, adapter: CassetteAdapter) -> Iterator[CassetteAdapter]:
+    previous: Dict[str, BaseAdapter] = {prefix: session.adapters[prefix]
+                                        for prefix in ("http://", "https://")
+                                        if prefix in session.adapters}
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    try:
+        yield adapter
+    finally:
+        for prefix, old in previous.items():
+            session.mount(prefix, old)
+
+
+def _default_session() -> requests.Session:
+    try:
+        from .base import _http
+    except ImportError:
+        from base import _http
+    return _http
+
+
+@contextmanager
+def recording(path: Path, session: Optional[requests.Session] = None) -> Iterator[Cassette]:
+    """Record the session's exchanges (base._http by default) to path."""
+    session = session or _default_session()
+    cassette = Cassette(path)
+    with _mounted(session, CassetteAdapter(cassette, "record", real=session.get_adapter("http://"))):
+        try:
+            yield cassette
+        finally:
+            cassette.save()
+
+
+@contextmanager
+def replaying(
+    path: Path,
+    speed: float = 1.0,
+    session: Optional[requests.Session] = None,
+) -> Iterator[CassetteAdapter]:
+    """Answer the session's requests (base._http by default) from the cassette at path."""
+    session = session or _default_session()
+    with _mounted(session, CassetteAdapter(Cassette.load(path), "replay", speed=speed)) as adapter:
+        yield adapter
+
+
+def install_from_env() -> Optional[CassetteAdapter]:
+    """Mount a cassette on base._http per IGRIS_CASSETTE / IGRIS_CASSETTE_MODE."""
+    path = os.environ.get("IGRIS_CASSETTE")
+    if not path:
+        return None
+    mode = os.environ.get("IGRIS_CASSETTE_MODE", "replay")
+    session = _default_session()
+    if mode == "record":
+        cassette = Cassette(Path(path))
+        adapter = CassetteAdapter(cassette, "record", real=session.get_adapter("http://"))
+        atexit.register(cassette.save)
+    else:
+        speed = float(os.environ.get("IGRIS_REPLAY_SPEED", "1"))
+        adapter = CassetteAdapter(Cassette.load(Path(path)), "replay", speed=speed)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return adapter
+
+
+# -- summary --
+
+def summarize(cassette: Cassette) -> List[dict]:
+    """Per endpoint: requests, body bytes, and time to first byte and total (ms, mean)."""
+    groups: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+    for interaction in cassette.interactions:
+        groups[(interaction["method"], interaction["path"])].append(interaction)
+    rows = []
+    for (method, path), items in sorted(groups.items()):
+        first = [i.get("headers_ms", 0) + i["chunks"][0][0] for i in items if i["chunks"]]
+        total = [i.get("headers_ms", 0) + sum(c[0] for c in i["chunks"]) for i in items]
+        rows.append({
+            "endpoint": f"{method} {path}",
+            "requests": len(items),
+            "chunks": sum(len(i["chunks"]) for i in items),
+            "bytes": sum(len(c[1]) for i in items for c in i["chunks"]),
+            "ttfb_ms": round(sum(first) / len(first), 1) if first else None,
+            "total_ms": round(sum(total) / len(total), 1),
+        })
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="IGRIS backend cassettes.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show", help="summarize a recorded cassette")
+    show.add_argument("path", type=Path)
+    args = parser.parse_args()
+
+    cassette = Cassette.load(args.path)
+    print(f"{args.path}: {len(cassette)} interactions")
+    print(f"{'endpoint':<20} {'requests':>8} {'chunks':>7} {'bytes':>9} {'ttfb ms':>8} {'total ms':>9}")
+    for row in summarize(cassette):
+        print(f"{row['endpoint']:<20} {row['requests']:>8} {row['chunks']:>7} {row['bytes']:>9} "
+              f"{row['ttfb_ms'] if row['ttfb_ms'] is not None else '-':>8} {row['total_ms']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+IGRIS Configuration
+
+Loads the model registry from a TOML file and hot-reloads it while IGRIS is
+running. The built-in MODELS in base.py are the defaults; the file overrides
+fields per model, adds models, or disables them:
+
+    [models.deepseek]
+    replicas = ["http://127.0.0.1:8012/completion"]
+    max_tokens = 768
+
+    [models.mistral]
+    enabled = false
+
+A model without an explicit url uses <NAME>_PORT from the environment (or
+.env) when set, so ports live in one place; <NAME>_MODEL likewise sets the
+model_path the backend supervisor launches.
+
+Edits are validated before anything changes. A bad file is rejected and the
+last good registry stays active. Requests already streaming keep the
+ModelConfig they started with.
+"""
+
+import os
+import re
+import sys
+import threading
+from dataclasses import fields, replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+if sys.version_info >= (3, 11):
+    import tomllib
+else:
+    import tomli as tomllib
+
+try:
+    from .base import ROOT, MODELS, ModelConfig
+    from .logger import log_system_event
+except ImportError:
+    from base import ROOT, MODELS, ModelConfig
+    from logger import log_system_event
+
+ENV_PATH = ROOT / ".env"
+
+# Models the router depends on; a config may not disable these
+REQUIRED_MODELS = ("qwen", "deepseek")
+
+# Built-in registry, captured before any file is applied
+BUILTIN_MODELS: Dict[str, ModelConfig] = {name: replace(cfg) for name, cfg in MODELS.items()}
+
+_FIELD_TYPES = {f.name: f.type for f in fields(ModelConfig)}
+_ZERO_OK = {"temperature", "ram_mb"}  # Numeric settings that may be 0
+_apply_lock = threading.Lock()
+
+
+class ConfigError(ValueError):
+    """The configuration file is invalid."""
+
+
+def config_path() -> Path:
+    """The config file: IGRIS_CONFIG, read at use so .env can set it, or igris.toml."""
+    return Path(os.environ.get("IGRIS_CONFIG", ROOT / "igris.toml"))
+
+
+def load_dotenv(path: Path = ENV_PATH) -> None:
+    """Read KEY=VALUE lines into os.environ without overriding real env vars."""
+    if not path.exists():
+        return
+    for line in path.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        os.environ.setdefault(key.strip(), value.strip().strip("\"'"))
+
+
+def _check_field(model: str, key: str, value: Any) -> Any:
+    tp = _FIELD_TYPES.get(key)
+    where = f"models.{model}.{key}"
+    if tp is None:
+        raise ConfigError(f"{where}: unknown setting")
+    if tp is str:
+        ok = isinstance(value, str)
+    elif tp is int:
+        ok = isinstance(value, int) and not isinstance(value, bool)
+    elif tp is float:
+        ok = isinstance(value, (int, float)) and not isinstance(value, bool)
+        value = float(value) if ok else value
+    else:  # List[str]
+        ok = isinstance(value, list) and all(isinstance(v, str) for v in value)
+    if not ok:
+        raise ConfigError(f"{where}: expected {getattr(tp, '__name__', tp)}, got {value!r}")
+    if isinstance(value, (int, float)) and (value < 0 if key in _ZERO_OK else value <= 0):
+        raise ConfigError(f"{where}: out of range: {value!r}")
+    if key == "stop_patterns":
+        for pattern in value:
+            try:
+                re.compile(pattern)
+            except re.error as e:
+                raise ConfigError(f"{where}: bad pattern {pattern!r}: {e}") from e
+    return value
+
+
+def _local_url(port: int, cfg: Optional[ModelConfig]) -> str:
+    """URL for a local server on port, keeping the model's API path (/completion by default)."""
+    path = urlsplit(cfg.url).path if cfg else "/completion"
+    return f"http://127.0.0.1:{port}{path}"
+
+
+def parse_config(data: Dict[str, Any]) -> Dict[str, ModelConfig]:
+    """Build and validate a full registry from parsed TOML. Raises ConfigError."""
+    tables = data.get("models", {})
+    if not isinstance(tables, dict):
+        raise ConfigError("[models] must be a table")
+
+    registry = {name: replace(cfg) for name, cfg in BUILTIN_MODELS.items()}
+    for name, table in tables.items():
+        if not isinstance(table, dict):
+            raise ConfigError(f"models.{name} must be a table")
+        table = dict(table)
+        if not table.pop("enabled", True):
+            if name in REQUIRED_MODELS:
+                raise ConfigError(f"models.{name}: cannot be disabled")
+            registry.pop(name, None)
+            continue
+        port = table.pop("port", None)
+        if port is not None and "url" not in table:
+            if not isinstance(port, int) or isinstance(port, bool):
+                raise ConfigError(f"models.{name}.port: expected int, got {port!r}")
+            table["url"] = _local_url(port, registry.get(name))
+        settings = {key: _check_field(name, key, value) for key, value in table.items()}
+        settings["name"] = name
+
+        base_cfg = registry.get(name)
+        if base_cfg is None:
+            if "url" not in settings:
+                raise ConfigError(f"models.{name}: new models need a url or port")
+            registry[name] = ModelConfig(**settings)
+        else:
+            registry[name] = replace(base_cfg, **settings)
+
+    # <NAME>_PORT and <NAME>_MODEL from the environment fill in what the file didn't set
+    for name, cfg in registry.items():
+        table = tables.get(name, {})
+        env_port = os.environ.get(f"{name.upper()}_PORT")
+        if env_port and "url" not in table and "port" not in table:
+            if not env_port.isdigit():
+                raise ConfigError(f"{name.upper()}_PORT: not a port number: {env_port!r}")
+            cfg = replace(cfg, url=_local_url(int(env_port), cfg))
+        env_model = os.environ.get(f"{name.upper()}_MODEL")
+        if env_model and "model_path" not in table:
+            cfg = replace(cfg, model_path=env_model)
+        registry[name] = cfg
+
+    for name, cfg in registry.items():
+        for url in cfg.endpoints:
+            if not url.startswith(("http://", "https://")):
+                raise ConfigError(f"models.{name}: invalid url {url!r}")
+    return registry
+
+
+def load_config(path: Optional[Path] = None) -> Dict[str, ModelConfig]:
+    """Read, parse and validate a config file. Raises ConfigError."""
+    path = path or config_path()
+    try:
+        data = tomllib.loads(path.read_text())
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        raise ConfigError(f"{path}: {e}") from e
+    return parse_config(data)
+
+
+def apply_config(registry: Dict[str, ModelConfig]) -> List[str]:
+    """
+    Swap the registry into MODELS. Returns names of added/changed/removed models.
+
+    MODELS is updated in place (every module holds a reference to it) with a
+    single dict.update, so a reader sees either the old or the new config for
+    a model, never a partial one.
+    """
+    with _apply_lock:
+        changed = [n for n, cfg in registry.items() if MODELS.get(n) != cfg]
+        removed = [n for n in MODELS if n not in registry]
+        MODELS.update(registry)
+        for name in removed:
+            MODELS.pop(name, None)
+    return sorted(changed + removed)
+
+
+def reload_config(path: Optional[Path] = None) -> bool:
+    """Load and apply the config file, keeping the current registry on error."""
+    path = path or config_path()
+    try:
+        registry = load_config(path)
+    except ConfigError as e:
+        log_system_event("CONFIG_REJECTED", {"path": str(path), "error": str(e)})
+        return False
+    changed = apply_config(registry)
+    if changed:
+        log_system_event("CONFIG_RELOADED", {"path": str(path), "models": changed})
+    return True
+
+
+class ConfigWatcher(threading.Thread):
+    """Polls the config file's mtime and reloads it when it changes."""
+
+    def __init__(self, path: Optional[Path] = None, interval: float = 1.0) -> None:
+        super().__init__(name="igris-config", daemon=True)
+        self.path = path or config_path()
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._mtime = self._stat()
+
+    def _stat(self) -> Optional[float]:
+        try:
+            return self.path.stat().st_mtime
+        except OSError:
+            return None
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            mtime = self._stat()
+            if mtime is not None and mtime != self._mtime:
+                self._mtime = mtime
+                reload_config(self.path)
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+def init_config(path: Optional[Path] = None, watch: bool = True) -> Optional[ConfigWatcher]:
+    """Load .env and the config file (if present); optionally watch for edits."""
+    load_dotenv()
+    path = path or config_path()
+    if path.exists():
+        reload_config(path)
+    else:
+        try:
+            registry = parse_config({})  # Built-ins plus any .env ports
+        except ConfigError as e:
+            log_system_event("CONFIG_REJECTED", {"path": str(ENV_PATH), "error": str(e)})
+            registry = {name: replace(cfg) for name, cfg in BUILTIN_MODELS.items()}
+        apply_config(registry)
+    if not watch:
+        return None
+    watcher = ConfigWatcher(path)
+    watcher.start()
+    return watcher
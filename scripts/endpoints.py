@@ -0,0 +1,152 @@
+"""
+IGRIS Endpoint Pool
+
+Load balancing across llama-server replicas of one model, with a per-replica
+circuit breaker so dead replicas are skipped instead of timed out.
+"""
+
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitBreaker:
+    """
+    Classic closed/open/half-open breaker.
+
+    CLOSED: requests flow; `failure_threshold` consecutive failures open it.
+    OPEN: requests are refused until `reset_timeout` seconds have passed.
+    HALF_OPEN: a single probe request is let through; its outcome closes or
+    re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 10.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def available(self, now: Optional[float] = None) -> bool:
+        """Whether a request could be sent now (does not change state)."""
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN:
+            return not self.probing
+        now = time.monotonic() if now is None else now
+        return now - self.opened_at >= self.reset_timeout
+
+    def allow(self) -> bool:
+        """Claim permission for one request, moving OPEN -> HALF_OPEN when due."""
+        if not self.available():
+            return False
+        if self.state == OPEN:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN:
+            self.probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.state = CLOSED
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.trip()
+
+    def trip(self) -> None:
+        """Open the breaker immediately (e.g. the health check failed)."""
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.probing = False
+
+
+class Endpoint:
+    """One replica URL with its breaker and in-flight request count."""
+
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.breaker = CircuitBreaker()
+        self.outstanding = 0
+
+    @property
+    def health_url(self) -> str:
+        # Sibling of the API path, so /completion and /embedding servers both work
+        return self.url.rsplit("/", 1)[0] + "/health"
+
+
+class EndpointPool:
+    """Least-outstanding-requests balancer over a model's replicas."""
+
+    def __init__(self, urls: Iterable[str]) -> None:
+        self._lock = threading.Lock()
+        self._endpoints: Dict[str, Endpoint] = {}
+        self.set_urls(urls)
+
+    @property
+    def urls(self) -> List[str]:
+        return list(self._endpoints)
+
+    def endpoints(self) -> List[Endpoint]:
+        with self._lock:
+            return list(self._endpoints.values())
+
+    def set_urls(self, urls: Iterable[str]) -> None:
+        """Replace the replica list, keeping breaker state for retained URLs."""
+        with self._lock:
+            self._endpoints = {
+                url: self._endpoints.get(url) or Endpoint(url) for url in urls
+            }
+
+    def acquire(self, exclude: Iterable[str] = ()) -> Optional[Endpoint]:
+        """
+        Pick the available replica with the fewest outstanding requests.
+        Returns None when every replica is excluded or its breaker is open.
+        """
+        skip = set(exclude)
+        with self._lock:
+            candidates = [
+                ep for ep in self._endpoints.values()
+                if ep.url not in skip and ep.breaker.available()
+            ]
+            if not candidates:
+                return None
+            ep = min(candidates, key=lambda e: e.outstanding)
+            ep.breaker.allow()
+            ep.outstanding += 1
+            return ep
+
+    def release(self, ep: Endpoint, ok: bool) -> None:
+        """Finish a request started with acquire() and feed its outcome to the breaker."""
+        with self._lock:
+            ep.outstanding = max(0, ep.outstanding - 1)
+            if ok:
+                ep.breaker.record_success()
+            else:
+                ep.breaker.record_failure()
+
+    def report_health(self, url: str, healthy: bool) -> None:
+        """Feed a health-check result: failures open the breaker, successes allow a probe."""
+        with self._lock:
+            ep = self._endpoints.get(url)
+            if ep is None:
+                return
+            if not healthy:
+                ep.breaker.trip()
+            elif ep.breaker.state == OPEN:
+                ep.breaker.state = HALF_OPEN
+                ep.breaker.probing = False
+
+    def any_available(self, exclude: Iterable[str] = ()) -> bool:
+        skip = set(exclude)
+        with self._lock:
+            return any(ep.breaker.available() for ep in self._endpoints.values()
+                       if ep.url not in skip)
@@ -114,9 +114,12 @@ def print_success(message: str) -> None:
         print(message)
 
 
-def print_latency(model: str, latency_ms: float) -> None:
-    """Print latency info."""
+def print_latency(model: str, latency_ms: float, queue_ms: Optional[float] = None) -> None:
+    """Print latency info (and scheduler queue wait, if any)."""
+    text = f"[{model.upper()}] {latency_ms}ms"
+    if queue_ms:
+        text += f" (queued {queue_ms}ms)"
     if RICH_AVAILABLE and console:
-        console.print(f"[dim][{model.upper()}] {latency_ms}ms[/dim]")
+        console.print(f"[dim]{text}[/dim]")
     else:
-        print(f"[{model.upper()}] {latency_ms}ms")
+        print(text)
@@ -0,0 +1,239 @@
+"""
+IGRIS Hedged Requests
+
+Races a backup request against a slow primary instead of waiting for it to
+fail. If the primary has not streamed its first token within a budget derived
+from observed TTFT percentiles, an alternate is started in parallel: another
+replica of the same model when one is available, otherwise the fallback model.
+Whichever streams first wins and the other is cancelled. A primary that errors
+before streaming anything fails over immediately.
+"""
+
+import queue
+import threading
+import time
+from typing import Callable, List, Optional, Sequence, Union
+
+try:
+    from .base import MODELS, CancelToken, deadlines, endpoint_pool, run_model_streaming
+    from .latency import LATENCY
+    from .logger import log_system_event
+    from .formatting import print_status
+    from .tracing import TRACER
+except ImportError:
+    from base import MODELS, CancelToken, deadlines, endpoint_pool, run_model_streaming
+    from latency import LATENCY
+    from logger import log_system_event
+    from formatting import print_status
+    from tracing import TRACER
+
+# Hedge once the primary is slower than this TTFT percentile...
+HEDGE_PERCENTILE = 95
+# ...given at least this many samples; otherwise use the default budget
+HEDGE_MIN_SAMPLES = 5
+HEDGE_DEFAULT_MS = 15000.0
+# Never hedge sooner than this (avoids doubling load on every request)
+HEDGE_FLOOR_MS = 1000.0
+
+
+def hedge_budget_ms(model_name: str) -> float:
+    """How long to wait for the primary's first token before hedging."""
+    ceiling = deadlines(model_name).ttft * 1000
+    if LATENCY.count(model_name, "ttft") < HEDGE_MIN_SAMPLES:
+        return min(HEDGE_DEFAULT_MS, ceiling)
+    p = LATENCY.percentile(model_name, "ttft", HEDGE_PERCENTILE) or HEDGE_DEFAULT_MS
+    return max(HEDGE_FLOOR_MS, min(p, ceiling))
+
+
+def pick_alternate(
+    model_name: str,
+    fallback_model: str,
+    exclude: Sequence[str] = (),
+) -> Optional[str]:
+    """
+    Prefer another replica of the same model than those in `exclude` (the one
+    serving the primary), else the fallback model if reachable.
+    """
+    pool = endpoint_pool(model_name)
+    if len(pool.endpoints()) > 1 and pool.any_available(exclude=exclude):
+        return model_name
+    if fallback_model in MODELS and endpoint_pool(fallback_model).any_available():
+        return fallback_model
+    return None
+
+
+class _Attempt:
+    """One racing request."""
+
+    def __init__(self, model: str, started_ms: float) -> None:
+        self.model = model
+        self.started_ms = started_ms
+        self.cancel = CancelToken()
+        self.lost = False  # Cancelled because another attempt won
+
+
+def run_hedged(
+    model_name: str,
+    prompt: str,
+    on_token: Optional[Callable[[str], None]],
+    fallback_model: str,
+    fallback_prompt: Union[str, Callable[[], str]],
+    cancel: Optional[CancelToken] = None,
+    options: Optional[Callable[[str], dict]] = None,
+) -> dict:
+    """
+    Stream from model_name, hedging or failing over to an alternate.
+
+    Only the winning attempt's tokens reach on_token. The returned dict is the
+    winner's result (its "model" says which one answered). fallback_prompt
+    may be a function, called only if the fallback model is actually
+    launched (building it can mean a retrieval). Cancelling `cancel`
+    aborts every attempt and returns the partial output with its reason.
+    options(model) returns extra run_model_streaming() keyword arguments for
+    each attempt (e.g. max_tokens, a fresh stop_detector).
+    """
+    events: "queue.Queue[tuple[int, str, object]]" = queue.Queue()
+    attempts: List[_Attempt] = []
+    start = time.perf_counter()
+    timeout_ms = deadlines(model_name).ttft * 1000
+
+    def elapsed_ms() -> float:
+        return round((time.perf_counter() - start) * 1000, 2)
+
+    def launch(model: str, exclude: Sequence[str] = ()) -> None:
+        idx = len(attempts)
+        attempt = _Attempt(model, elapsed_ms())
+        attempts.append(attempt)
+        extra = options(model) if options else {}
+        if exclude:
+            extra = {**extra, "exclude": exclude}
+        trace_id = TRACER.current()
+
+        def work() -> None:
+            try:
+                attempt_prompt = prompt
+                if model != model_name:
+                    attempt_prompt = fallback_prompt() if callable(fallback_prompt) else fallback_prompt
+                with TRACER.bind(trace_id):
+                    result = run_model_streaming(
+                        model, attempt_prompt,
+                        lambda t: events.put((idx, "token", t)),
+                        cancel=attempt.cancel,
+                        **extra,
+                    )
+            except Exception as e:
+                result = {"model": model, "output": "", "latency_ms": None, "error": str(e)}
+            events.put((idx, "done", result))
+
+        threading.Thread(target=work, name=f"igris-hedge-{idx}", daemon=True).start()
+
+    def start_backup(reason: str, detail: dict) -> bool:
+        # Never hedge onto the replica that is already slow (or just failed)
+        primary = attempts[0].cancel.endpoint
+        exclude = [primary] if primary else []
+        alternate = pick_alternate(model_name, fallback_model, exclude)
+        if alternate is None:
+            return False
+        target = "replica" if alternate == model_name else alternate
+        print_status(f"[IGRIS] {model_name} {reason}, trying {target}...", "yellow")
+        launch(alternate, exclude if alternate == model_name else ())
+        if reason != "slow":
+            log_system_event("FALLBACK", {
+                "primary": model_name,
+                "alternate": alternate,
+                **detail,
+                # Versus waiting out the primary's first-token deadline before switching
+                "time_saved_ms": round(max(0.0, timeout_ms - detail["failed_after_ms"]), 2),
+            })
+        return True
+
+    def pick_winner(idx: int) -> None:
+        for i, attempt in enumerate(attempts):
+            if i != idx:
+                attempt.lost = True
+                attempt.cancel.cancel()
+        if hedged:
+            backup = attempts[1]
+            log_system_event("HEDGE", {
+                "primary": model_name,
+                "alternate": backup.model,
+                "budget_ms": round(budget, 2),
+                "hedged_at_ms": backup.started_ms,
+                "winner": "primary" if idx == 0 else "alternate",
+                "first_token_ms": elapsed_ms(),
+                # Sequential fallback would only have started the alternate
+                # once the primary hit its first-token deadline
+                "time_saved_ms": round(max(0.0, timeout_ms - backup.started_ms), 2)
+                if idx != 0 else 0.0,
+            })
+
+    launch(model_name)
+    budget = hedge_budget_ms(model_name)
+    hedged = False
+    backup_started = False
+    winner: Optional[int] = None
+    winner_output: List[str] = []
+    finished = 0
+    if cancel is not None:
+        cancel.on_cancel(lambda: events.put((-1, "cancelled", None)))
+
+    try:
+        while True:
+            wait = None
+            if winner is None and not backup_started:
+                wait = max(0.0, budget - elapsed_ms()) / 1000
+            try:
+                idx, kind, value = events.get(timeout=wait)
+            except queue.Empty:
+                hedged = start_backup("slow", {})
+                backup_started = True  # Hedge at most once
+                continue
+
+            if kind == "cancelled":
+                answered = attempts[winner].model if winner is not None else model_name
+                return {
+                    "model": answered,
+                    "output": "".join(winner_output),
+                    "latency_ms": elapsed_ms(),
+                    "error": cancel.reason if cancel is not None else "CANCELLED",
+                }
+
+            if kind == "token":
+                if winner is None:
+                    winner = idx
+                    pick_winner(idx)
+                if idx == winner:
+                    winner_output.append(value)  # type: ignore[arg-type]
+                    if on_token:
+                        on_token(value)  # type: ignore[arg-type]
+                continue
+
+            finished += 1
+            result: dict = value  # type: ignore[assignment]
+            if attempts[idx].lost:
+                pass
+            elif not result["error"]:
+                if winner is None:
+                    winner = idx  # Finished without streaming anything
+                    pick_winner(idx)
+                if idx == winner:
+                    return result
+            elif len(attempts) == 1 and winner is None:
+                # Primary failed before streaming anything and no alternate
+                # is running yet: fail over now. Once tokens have reached
+                # on_token, a second answer would be appended to them.
+                detail = {"error": result["error"], "failed_after_ms": elapsed_ms()}
+                backup_started = True
+                if not start_backup("failed", detail):
+                    return result
+                continue
+            elif idx == winner:
+                return result
+
+            if winner is None and finished == len(attempts):
+                return result
+    finally:
+        # Covers cancellation and KeyboardInterrupt: close every stream still
+        # open so no llama-server slot keeps generating for nobody
+        for attempt in attempts:
+            attempt.cancel.cancel()
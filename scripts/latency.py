@@ -0,0 +1,81 @@
+"""
+IGRIS Latency Tracking
+
+Rolling per-model latency samples, used to derive hedging budgets and
+adaptive request deadlines.
+
+Metrics recorded by the client:
+    connect  health-check round trip (proxy for connection setup)
+    ttft     time to first streamed token
+    gap      longest pause between tokens in one stream
+    token    mean time per token after the first, in one stream
+    embed    full duration of an embedding request
+    batch    full duration of a multi-prompt request (base.run_model_batch())
+
+A generation's total deadline is derived from ttft and token for its own
+n_predict (see base.deadlines()), not from past request durations.
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Deque, Dict, Optional
+
+# Samples kept per (model, metric)
+WINDOW = 200
+
+# Adaptive deadlines: percentile x factor, clamped to [floor, ceiling]
+TIMEOUT_PERCENTILE = 99
+TIMEOUT_FACTOR = 3.0
+# Until this many samples exist, the ceiling (configured maximum) applies
+TIMEOUT_MIN_SAMPLES = 20
+TIMEOUT_FLOORS = {"connect": 0.5, "ttft": 5.0, "gap": 3.0, "total": 15.0, "embed": 5.0,
+                  "batch": 15.0}  # seconds
+
+
+class LatencyTracker:
+    """Thread-safe rolling window of latency samples (ms) per model and metric."""
+
+    def __init__(self, window: int = WINDOW) -> None:
+        self.window = window
+        self._samples: Dict[tuple[str, str], Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, metric: str, value_ms: float) -> None:
+        with self._lock:
+            samples = self._samples.get((model, metric))
+            if samples is None:
+                samples = self._samples[(model, metric)] = deque(maxlen=self.window)
+            samples.append(value_ms)
+
+    def count(self, model: str, metric: str) -> int:
+        with self._lock:
+            return len(self._samples.get((model, metric), ()))
+
+    def percentile(self, model: str, metric: str, p: float) -> Optional[float]:
+        """Nearest-rank percentile (0-100), or None with no samples."""
+        with self._lock:
+            samples = sorted(self._samples.get((model, metric), ()))
+        if not samples:
+            return None
+        rank = max(0, min(len(samples) - 1, math.ceil(p / 100 * len(samples)) - 1))
+        return samples[rank]
+
+    def deadline(self, model: str, metric: str, ceiling: float) -> float:
+        """
+        Adaptive deadline in seconds for one phase of a request:
+        p99 x factor of recent samples, clamped to [floor, ceiling].
+        """
+        if self.count(model, metric) < TIMEOUT_MIN_SAMPLES:
+            return ceiling
+        p = self.percentile(model, metric, TIMEOUT_PERCENTILE) or 0.0
+        floor = min(TIMEOUT_FLOORS.get(metric, 0.0), ceiling)
+        return max(floor, min(p / 1000 * TIMEOUT_FACTOR, ceiling))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+
+# Process-wide tracker fed by the streaming client
+LATENCY = LatencyTracker()
@@ -36,7 +36,9 @@ def log_request(
     model: str,
     latency_ms: Optional[float],
     output: str,
-    error: Optional[str] = None
+    error: Optional[str] = None,
+    queue_ms: Optional[float] = None,
+    history_turns: Optional[int] = None
 ) -> None:
     """
     Log a request/response cycle to the daily log file.
@@ -49,6 +51,9 @@ def log_request(
         latency_ms: Response time in milliseconds
         output: Model output (truncated for storage)
         error: Error message if any
+        queue_ms: Time spent waiting for a scheduler slot, excluded from latency_ms
+        history_turns: Conversation turns included in the prompt (0: the answer
+            depends on the input alone, so it can be pre-cached; see warmup.py)
     """
     entry = {
         "timestamp": datetime.now().isoformat(),
@@ -57,10 +62,13 @@ def log_request(
         "confidence": round(confidence, 3),
         "model": model,
         "latency_ms": latency_ms,
+        "queue_ms": queue_ms,
         "output_length": len(output),
         "output_preview": output[:200] if output else "",
         "error": error,
     }
+    if history_turns is not None:
+        entry["history_turns"] = history_turns
     
     log_file = get_log_file()
     with open(log_file, "a") as f:
@@ -132,6 +140,7 @@ def get_session_stats() -> dict:
         return {"requests": 0, "errors": 0}
     
     latencies = [e["latency_ms"] for e in entries if e.get("latency_ms")]
+    queue_waits = [e["queue_ms"] for e in entries if e.get("queue_ms") is not None]
     intents = {}
     models = {}
     errors = 0
@@ -148,6 +157,7 @@ def get_session_stats() -> dict:
         "requests": len(entries),
         "errors": errors,
         "avg_latency_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        "avg_queue_ms": round(sum(queue_waits) / len(queue_waits), 2) if queue_waits else None,
         "intents": intents,
         "models": models,
     }
@@ -0,0 +1,253 @@
+"""
+IGRIS Micro-batching
+
+Groups single-prompt requests into multi-prompt ones for throughput
+workloads (batch.py, replays). Each run_model() call is one request holding
+one scheduler grant, so concurrent batch items queue behind each other while
+llama-server's parallel slots sit idle. A MicroBatcher collects requests for
+the same model and n_predict that arrive within `window_ms` of the first, up
+to `max_batch`, sends them as one run_model_batch() request that the server
+decodes together, and hands each caller its own result.
+
+Batching trades latency for throughput: a request may wait up to the window
+before it is sent, and a batch finishes when its longest generation does.
+Keep max_batch at or below the server's --parallel slots (IGRIS_SLOTS).
+Answers are not streamed and get no client-side stop detection.
+
+Measure throughput and latency against the mock server with:
+python scripts/microbatch.py bench
+"""
+
+import argparse
+import os
+import queue
+import statistics
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable, Dict, List, Optional, Tuple
+
+try:
+    from .base import endpoint_pool, run_model, run_model_batch
+    from .scheduler import BATCH
+except ImportError:
+    from base import endpoint_pool, run_model, run_model_batch
+    from scheduler import BATCH
+
+# Used when IGRIS_BATCH_WINDOW_MS / IGRIS_BATCH_SIZE aren't set; those are
+# read when a MicroBatcher is created, so .env can set them
+BATCH_WINDOW_MS = 20.0
+MAX_BATCH = 4
+
+Sender = Callable[[str, List[str], Optional[int], int], List[dict]]
+
+
+@dataclass
+class _Pending:
+    prompt: str
+    future: Future
+    queued_at: float = field(default_factory=time.perf_counter)
+
+
+class MicroBatcher:
+    """Collects concurrent requests per (model, n_predict) into multi-prompt requests."""
+
+    def __init__(
+        self,
+        window_ms: Optional[float] = None,
+        max_batch: Optional[int] = None,
+        priority: int = BATCH,
+        send: Sender = run_model_batch,
+    ) -> None:
+        if window_ms is None:
+            window_ms = float(os.environ.get("IGRIS_BATCH_WINDOW_MS", BATCH_WINDOW_MS))
+        if max_batch is None:
+            max_batch = int(os.environ.get("IGRIS_BATCH_SIZE", MAX_BATCH))
+        self.window_ms = window_ms
+        self.max_batch = max(1, max_batch)
+        self.priority = priority
+        self.send = send
+        self._queues: Dict[Tuple[str, Optional[int]], "queue.Queue[Optional[_Pending]]"] = {}
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, model_name: str, prompt: str, max_tokens: Optional[int] = None) -> Future:
+        """Queue a prompt; the future resolves to its run_model()-style result."""
+        pending = _Pending(prompt, Future())
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            key = (model_name, max_tokens)
+            if key not in self._queues:
+                self._queues[key] = queue.Queue()
+                thread = threading.Thread(target=self._collect, args=(key, self._queues[key]),
+                                          name=f"igris-microbatch-{model_name}", daemon=True)
+                self._threads.append(thread)
+                thread.start()
+            self._queues[key].put(pending)
+        return pending.future
+
+    def run(self, model_name: str, prompt: str, max_tokens: Optional[int] = None) -> dict:
+        """submit() and wait for the result."""
+        result: dict = self.submit(model_name, prompt, max_tokens).result()
+        return result
+
+    def close(self) -> None:
+        """Send what is queued, then stop the collector threads."""
+        with self._lock:
+            self._closed = True
+            for q in self._queues.values():
+                q.put(None)
+            threads = list(self._threads)
+        for thread in threads:
+            thread.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "mean_batch": round(self.requests / self.batches, 2) if self.batches else None,
+            }
+
+    def _collect(self, key: Tuple[str, Optional[int]], pending: "queue.Queue[Optional[_Pending]]") -> None:
+        stopping = False
+        while not stopping:
+            first = pending.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = first.queued_at + self.window_ms / 1000
+            while len(batch) < self.max_batch:
+                try:
+                    item = pending.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._dispatch(key, batch)
+
+    def _dispatch(self, key: Tuple[str, Optional[int]], batch: List[_Pending]) -> None:
+        model_name, max_tokens = key
+        sent_at = time.perf_counter()
+        try:
+            results = self.send(model_name, [p.prompt for p in batch], max_tokens, self.priority)
+            # A short reply would leave some callers waiting forever
+            answered = list(zip(batch, results, strict=True))
+        except Exception as e:
+            for p in batch:
+                p.future.set_exception(e)
+            return
+        with self._lock:
+            self.batches += 1
+            self.requests += len(batch)
+        for p, result in answered:
+            wait_ms = (sent_at - p.queued_at) * 1000
+            p.future.set_result({
+                **result,
+                "batch_size": len(batch),
+                "queue_ms": round(wait_ms + (result.get("queue_ms") or 0), 2),
+            })
+
+
+# -- benchmark --
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def benchmark(
+    requests: int = 32,
+    clients: int = 8,
+    settings: Optional[List[Tuple[float, int]]] = None,
+    n_predict: int = 16,
+) -> List[dict]:
+    """
+    Throughput and per-request latency for `requests` prompts from `clients`
+    concurrent callers, one run_model() each and then micro-batched with each
+    (window_ms, max_batch) in settings.
+    """
+    settings = settings or [(5, 2), (20, 4), (20, 8)]
+    modes: List[Tuple[str, Callable[[str], dict]]] = [
+        ("single", lambda prompt: run_model("qwen", prompt, n_predict, priority=BATCH)),
+    ]
+    batchers = []
+    for window_ms, max_batch in settings:
+        batcher = MicroBatcher(window_ms=window_ms, max_batch=max_batch)
+        batchers.append(batcher)
+        modes.append((f"batch {max_batch} / {window_ms:g}ms",
+                      partial(batcher.run, "qwen", max_tokens=n_predict)))
+
+    rows = []
+    for name, call in modes:
+        latencies: List[float] = []
+
+        def timed(
+            prompt: str,
+            call: Callable[[str], dict] = call,
+            latencies: List[float] = latencies,
+        ) -> None:
+            t = time.perf_counter()
+            result = call(prompt)
+            if result["error"]:
+                raise RuntimeError(result["error"])
+            latencies.append((time.perf_counter() - t) * 1000)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            list(pool.map(timed, [f"request {i}" for i in range(requests)]))
+        elapsed = time.perf_counter() - start
+        rows.append({
+            "mode": name,
+            "req_per_s": round(requests / elapsed, 2),
+            "p50_ms": round(statistics.median(latencies), 1),
+            "p95_ms": round(_percentile(latencies, 0.95), 1),
+        })
+    for batcher in batchers:
+        batcher.close()
+    return rows
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="IGRIS micro-batching.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    bench = sub.add_parser("bench", help="throughput vs latency against a local mock server")
+    bench.add_argument("--requests", type=int, default=32)
+    bench.add_argument("--clients", type=int, default=8)
+    bench.add_argument("--n-predict", type=int, default=16)
+    bench.add_argument("--ttft", type=float, default=0.1, help="mock prompt evaluation time")
+    bench.add_argument("--token-delay", type=float, default=0.01, help="mock time per token")
+    bench.add_argument("--parallel", type=int, default=8, help="mock server slots")
+    bench.add_argument("--batch-overhead", type=float, default=0.1)
+    args = parser.parse_args()
+
+    try:
+        from .mock_server import MockServer
+    except ImportError:
+        from mock_server import MockServer
+    options = argparse.Namespace(load_time=0.0, ttft=args.ttft, token_delay=args.token_delay,
+                                 parallel=args.parallel, batch_overhead=args.batch_overhead,
+                                 crash_after=0, embedding_dim=8)
+    server = MockServer(("127.0.0.1", 0), options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    for ep in endpoint_pool("qwen").endpoints()[:1]:
+        ep.url = f"http://127.0.0.1:{server.server_address[1]}/completion"
+
+    print(f"{args.requests} requests from {args.clients} clients, n_predict {args.n_predict}, "
+          f"mock ttft {args.ttft}s, {args.token_delay}s/token, {args.parallel} slots")
+    print(f"{'mode':<18} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for row in benchmark(args.requests, args.clients, n_predict=args.n_predict):
+        print(f"{row['mode']:<18} {row['req_per_s']:>7} {row['p50_ms']:>8} {row['p95_ms']:>8}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
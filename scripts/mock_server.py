@@ -0,0 +1,210 @@
+"""
+IGRIS Mock llama-server
+
+A stand-in for llama-server with the same command line and the endpoints IGRIS
+uses (/health, /completion streaming or not, and /embedding). It loads nothing
+and answers with canned tokens, so the supervisor, benchmarks and tests can run
+without model files:
+
+    python scripts/mock_server.py -m any.gguf --port 8001 --ttft 0.2
+
+Timing options simulate a slow backend: --load-time (health returns 503 while
+"loading"), --ttft and --token-delay. --parallel limits how many prompts are
+decoded at once. A non-streaming request may carry a list of prompts; they are
+decoded together, each extra one adding --batch-overhead to the time of every
+step, and answered with a list of results. --crash-after exits abruptly after
+that many completions. Embeddings are hashed bags of words, so texts sharing words
+get similar vectors.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+WORDS = ["Hello", " from", " the", " mock", " server", "."]
+
+
+def tokens_for(prompt: str, n_predict: int) -> List[str]:
+    """Deterministic output for a prompt: WORDS cycled up to n_predict tokens."""
+    return [WORDS[i % len(WORDS)] for i in range(max(0, n_predict))]
+
+
+def embed(text: str, dim: int) -> List[float]:
+    """Unit-length hashed bag-of-words vector."""
+    vec = [0.0] * dim
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        h = int.from_bytes(hashlib.md5(word.encode()).digest()[:4], "little")
+        vec[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, options: argparse.Namespace) -> None:
+        super().__init__(address, Handler)
+        self.options = options
+        self.started = time.monotonic()
+        self.completions = 0
+        self.lock = threading.Lock()
+        self.busy_slots = 0
+        self.slots_free = threading.Condition()
+
+    def take_slots(self, count: int) -> int:
+        """Wait for `count` decoding slots (at most --parallel); returns how many were taken."""
+        if self.options.parallel:
+            count = min(count, self.options.parallel)
+        with self.slots_free:
+            while self.options.parallel and self.busy_slots + count > self.options.parallel:
+                self.slots_free.wait()
+            self.busy_slots += count
+        return count
+
+    def give_slots(self, count: int) -> None:
+        with self.slots_free:
+            self.busy_slots -= count
+            self.slots_free.notify_all()
+
+    def decode(self, count: int, n_tokens: int) -> None:
+        """Evaluate and decode `count` prompts together, in waves of --parallel."""
+        opts = self.options
+        taken = self.take_slots(count)
+        try:
+            waves = -(-count // taken)
+            step = 1 + opts.batch_overhead * (taken - 1)
+            time.sleep(waves * step * (opts.ttft + opts.token_delay * n_tokens))
+        finally:
+            self.give_slots(taken)
+
+    def loaded(self) -> bool:
+        return time.monotonic() - self.started >= float(self.options.load_time)
+
+    def count_completion(self) -> None:
+        with self.lock:
+            self.completions += 1
+            crash = self.options.crash_after and self.completions >= self.options.crash_after
+        if crash:
+            os._exit(1)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockServer
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
+
+    def _json(self, status: int, body: object) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path != "/health":
+            self._json(404, {"error": "not found"})
+        elif not self.server.loaded():
+            self._json(503, {"status": "loading model"})
+        else:
+            self._json(200, {"status": "ok"})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path not in ("/completion", "/embedding"):
+            self._json(404, {"error": "not found"})
+            return
+        if not self.server.loaded():
+            self._json(503, {"error": "loading model"})
+            return
+        if self.path == "/embedding":
+            contents = body.get("content", "")
+            texts = contents if isinstance(contents, list) else [contents]
+            dim = self.server.options.embedding_dim
+            self._json(200, [{"index": i, "embedding": [embed(t, dim)]}
+                             for i, t in enumerate(texts)])
+            return
+
+        prompts = body.get("prompt", "")
+        n_predict = int(body.get("n_predict", 16))
+        if isinstance(prompts, list) and not body.get("stream"):
+            self.server.decode(len(prompts), n_predict)
+            self._json(200, [{"index": i, "content": "".join(tokens_for(p, n_predict)),
+                              "tokens_predicted": n_predict} for i, p in enumerate(prompts)])
+            self.server.count_completion()
+            return
+        tokens = tokens_for(prompts, n_predict)
+        if not body.get("stream"):
+            self.server.decode(1, len(tokens))
+            self._json(200, {"content": "".join(tokens), "tokens_predicted": len(tokens)})
+            self.server.count_completion()
+            return
+
+        self.server.take_slots(1)
+        try:
+            self._stream(tokens)
+        finally:
+            self.server.give_slots(1)
+
+    def _stream(self, tokens: List[str]) -> None:
+        opts = self.server.options
+        time.sleep(opts.ttft)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        try:
+            for token in tokens:
+                self.wfile.write(f"data: {json.dumps({'content': token, 'stop': False})}\n\n".encode())
+                self.wfile.flush()
+                time.sleep(opts.token_delay)
+            self.wfile.write(f"data: {json.dumps({'content': '', 'stop': True})}\n\n".encode())
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # Client closed the stream early
+        self.close_connection = True
+        self.server.count_completion()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mock llama-server for IGRIS tests.")
+    # llama-server flags the supervisor passes; accepted and ignored
+    parser.add_argument("-m", "--model", default="")
+    parser.add_argument("-c", "--ctx-size", type=int, default=4096)
+    parser.add_argument("-t", "--threads", type=int, default=1)
+    parser.add_argument("-np", "--parallel", type=int, default=0,
+                        help="prompts decoded at once (0: unlimited)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--embedding", action="store_true")
+    parser.add_argument("--pooling", default="mean")
+    parser.add_argument("--load-time", type=float, default=0.0,
+                        help="seconds /health reports 503 after start")
+    parser.add_argument("--ttft", type=float, default=0.0, help="delay before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.0, help="delay between tokens")
+    parser.add_argument("--batch-overhead", type=float, default=0.1,
+                        help="extra step time per additional prompt decoded together")
+    parser.add_argument("--crash-after", type=int, default=0,
+                        help="exit after this many completions")
+    parser.add_argument("--embedding-dim", type=int, default=64)
+    args = parser.parse_args()
+
+    server = MockServer((args.host, args.port), args)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
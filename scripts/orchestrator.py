@@ -1,22 +1,57 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
 from datetime import datetime
+from functools import partial
+from typing import Callable, Optional
 import requests
 
 try:
     from .base import (
-        run_model, run_model_streaming, model_health, MODELS, ROOT, load_file,
-        get_cached, set_cached, clear_cache
+        run_model_streaming, run_model_coalesced, model_health, MODELS, CancelToken,
+        ROOT, load_file, get_cached, clear_cache, cache_stats, endpoint_pool, start_health_monitor,
+        deadlines, get_supervisor
     )
-    from .logger import log_request, log_system_event, get_session_stats, clear_today_logs
+    from .config import init_config
+    from .cassette import install_from_env as install_cassette
+    from .supervisor import start_from_env
+    from .hedging import run_hedged
+    from .rag import build_index, configured_paths, format_context
+    from .vectors import EMBED_MODEL, NUMPY_AVAILABLE, build_vectors, retrieve
+    from .scheduler import BATCH, INTERACTIVE, SCHEDULER
+    from .sessions import DEFAULT_SESSION, MAX_HISTORY, SESSIONS, Session
+    from .stopping import StopDetector
+    from .tools import TOOL_CALL_END, Runner, tool_instructions, with_tools
+    from .workspace import split_code
+    from .tracing import TRACER
+    from .warmup import WARM_STATS, start_warmup
+    from .logger import LOG_DIR, log_request, log_system_event, get_session_stats, clear_today_logs
     from .formatting import (
         format_output, print_streaming, print_status, print_error,
         print_latency, print_success, RICH_AVAILABLE
     )
 except ImportError:
     from base import (
-        run_model, run_model_streaming, model_health, MODELS, ROOT, load_file,
-        get_cached, set_cached, clear_cache
+        run_model_streaming, run_model_coalesced, model_health, MODELS, CancelToken,
+        ROOT, load_file, get_cached, clear_cache, cache_stats, endpoint_pool, start_health_monitor,
+        deadlines, get_supervisor
     )
-    from logger import log_request, log_system_event, get_session_stats, clear_today_logs
+    from config import init_config
+    from cassette import install_from_env as install_cassette
+    from supervisor import start_from_env
+    from hedging import run_hedged
+    from rag import build_index, configured_paths, format_context
+    from vectors import EMBED_MODEL, NUMPY_AVAILABLE, build_vectors, retrieve
+    from scheduler import BATCH, INTERACTIVE, SCHEDULER
+    from sessions import DEFAULT_SESSION, MAX_HISTORY, SESSIONS, Session
+    from stopping import StopDetector
+    from tools import TOOL_CALL_END, Runner, tool_instructions, with_tools
+    from workspace import split_code
+    from tracing import TRACER
+    from warmup import WARM_STATS, start_warmup
+    from logger import LOG_DIR, log_request, log_system_event, get_session_stats, clear_today_logs
     from formatting import (
         format_output, print_streaming, print_status, print_error,
         print_latency, print_success, RICH_AVAILABLE
@@ -30,6 +65,14 @@ DEEPSEEK_SYSTEM = ROOT / "prompts/DEEPSEEK_SYSTEM.md"
 # Enable streaming by default
 STREAMING_ENABLED = True
 
+# Let the models call local tools (see tools.py); toggled with /tools. None
+# until then: IGRIS_TOOLS decides, read at use so .env can set it
+TOOLS_ENABLED: Optional[bool] = None
+
+# /profile once: run the next turn under cProfile
+PROFILE_NEXT = False
+PROFILE_TOP = 15  # Functions listed after a profiled turn
+
 # Code-related keywords for fast heuristic routing
 CODE_KEYWORDS = {
     "code", "script", "function", "program", "debug", "fix", "implement",
@@ -44,22 +87,50 @@ NON_CODE_INDICATORS = {
     "explain", "what is", "how does", "why", "describe", "summarize",
     "tell me about", "difference between", "compare", "help me understand",
 }
-# Conversation history for context
-MAX_HISTORY = 4  
-conversation_history: list[tuple[str, str]] = []
+# Generation budgets (n_predict) by request shape; capped at the model's max_tokens
+SHORT_CHAT_TOKENS = 64    # Greetings and one-liners
+CHAT_TOKENS = 160         # Short questions
+SMALL_CODE_TOKENS = 384   # Short code tasks ("hello world in rust")
 
 
-def build_prompt(user_input: str, model: str, include_history: bool = True) -> str:
-    """Build a properly formatted prompt for the target model."""
+def build_prompt(
+    user_input: str,
+    model: str,
+    session: Optional[Session] = None,
+    include_history: bool = True,
+    include_context: bool = True,
+    include_tools: bool = False,
+) -> str:
+    """
+    Build a properly formatted prompt for the target model.
+
+    For qwen, the session's recent turns (and a summary of older ones) come
+    first; without a session the prompt has no history.
+
+    For deepseek, snippets from the local document index (see rag.py and
+    vectors.py) that match the task are added ahead of it, within
+    rag.CONTEXT_TOKENS. If the task edits the code in the session's
+    workspace (see editing()), the relevant part of it and the user's
+    changes since the last turn come next, instead of the pasted file (see
+    workspace.py). Other tasks get a fresh prompt with no session state.
+
+    With include_tools, the tool descriptions follow the system prompt, ahead
+    of anything that changes between requests.
+    """
     if model == "qwen":
         system = load_file(FACE_SYSTEM)
+        if include_tools:
+            system += f"\n\n{tool_instructions()}"
+        history = session.turns() if session and include_history else []
+        if include_history and session and session.summary:
+            system += f"\n\nEarlier in this conversation the user asked about: {session.summary}"
         
         # Build conversation with history
         prompt = f"<|im_start|>system\n{system}\n<|im_end|>\n"
         
         # Add recent history for context
-        if include_history and conversation_history:
-            for user_msg, assistant_msg in conversation_history[-MAX_HISTORY:]:
+        if history:
+            for user_msg, assistant_msg in history[-MAX_HISTORY:]:
                 prompt += f"<|im_start|>user\n{user_msg}\n<|im_end|>\n"
                 prompt += f"<|im_start|>assistant\n{assistant_msg}\n<|im_end|>\n"
         
@@ -70,10 +141,20 @@ def build_prompt(user_input: str, model: str, include_history: bool = True) -> s
         
     elif model == "deepseek":
         system = load_file(DEEPSEEK_SYSTEM)
+        if include_tools:
+            system += f"\n\n{tool_instructions()}"
+        task, code = split_code(user_input)
+        workspace = ""
+        if session and include_history and editing(session, user_input):
+            task = task or "Review this code and fix any problems."
+            workspace = session.workspace.context(task)
+        else:
+            task = user_input
+        context = format_context(retrieve(task)) if include_context else ""
         return f"""{system}
 
-Task:
-{user_input}
+{context}{workspace}Task:
+{task}
 
 Output:
 """
@@ -81,19 +162,33 @@ Output:
         return user_input
 
 
-def add_to_history(user_input: str, response: str) -> None:
-    """Add a conversation turn to history."""
+def add_to_history(session: Session, user_input: str, response: str) -> None:
+    """Add a conversation turn to a session's history."""
     # Don't add very short exchanges or errors
     if len(response) > 10 and not response.startswith("Error"):
-        conversation_history.append((user_input, response))
-        # Trim to max size
-        while len(conversation_history) > MAX_HISTORY:
-            conversation_history.pop(0)
+        session.add_turn(user_input, response)
+
+
+def editing(session: Session, user_input: str) -> bool:
+    """Whether a deepseek task edits the session's workspace: pasted code or names in it."""
+    task, code = split_code(user_input)
+    return session.workspace.active and (bool(code) or session.workspace.applies_to(task))
+
 
+def update_workspace(session: Session, output: str, fresh: bool = False) -> None:
+    """Apply a deepseek answer (a diff or code) to the session's workspace."""
+    with session.lock:
+        outcome = session.workspace.apply_reply(output, fresh=fresh)
+        version, lines = session.workspace.version, session.workspace.text.count("\n") + 1
+    if outcome == "failed":
+        print_error("The diff didn't apply; the workspace is unchanged (/workspace shows it).")
+    elif outcome != "unchanged":
+        print_status(f"[WORKSPACE] {outcome}: version {version}, {lines} lines", "dim")
 
-def clear_history() -> None:
-    """Clear conversation history."""
-    conversation_history.clear()
+
+def clear_history(session: Optional[Session] = None) -> None:
+    """Clear conversation history (of the default session unless given)."""
+    (session or SESSIONS.get(DEFAULT_SESSION)).clear()
 
 
 def fast_route(user_input: str) -> str:
@@ -119,17 +214,130 @@ def fast_route(user_input: str) -> str:
         return "general"
 
 
+def select_model(route: str) -> tuple[str, str]:
+    """Map a fast_route() result to (model, intent)."""
+    if route == "code":
+        return "deepseek", "CODE"
+    # Both 'general' and 'ambiguous' go to Qwen
+    return "qwen", "GENERAL" if route == "general" else "AMBIGUOUS"
+
+
+def choose_n_predict(user_input: str, model: str, route: str) -> int:
+    """
+    Pick a generation budget from the route and the shape of the input.
+    A short chat gets a small budget; explanations, long inputs and pasted
+    code get the model's full max_tokens.
+    """
+    limit = MODELS[model].max_tokens
+    lower = user_input.lower()
+    words = len(user_input.split())
+    has_code = "```" in user_input or user_input.count("\n") >= 3
+
+    if model == "qwen":
+        if any(indicator in lower for indicator in NON_CODE_INDICATORS) or has_code:
+            return limit
+        if route == "general" and words <= 6:
+            return min(limit, SHORT_CHAT_TOKENS)
+        if words <= 20:
+            return min(limit, CHAT_TOKENS)
+        return limit
+
+    if model == "deepseek" and words <= 12 and not has_code:
+        return min(limit, SMALL_CODE_TOKENS)
+    return limit
+
+
+def tools_enabled() -> bool:
+    """Whether tool calling is on: /tools if used, else IGRIS_TOOLS."""
+    if TOOLS_ENABLED is None:
+        return os.environ.get("IGRIS_TOOLS", "0") == "1"
+    return TOOLS_ENABLED
+
+
+def request_options(
+    user_input: str,
+    model: str,
+    route: str,
+    priority: int = INTERACTIVE,
+    slot: Optional[int] = None,
+    tools: bool = False,
+) -> dict:
+    """
+    Per-request run_model_streaming() options: n_predict, stop detection,
+    priority, slot, and with tools the stop at the end of a tool call.
+    """
+    options = {
+        "max_tokens": choose_n_predict(user_input, model, route),
+        "stop_detector": StopDetector(
+            patterns=MODELS[model].stop_patterns,
+            code_only=model == "deepseek",
+        ),
+        "priority": priority,
+        "slot": slot,
+    }
+    if tools:
+        options["stop"] = [TOOL_CALL_END]
+    return options
+
+
+def warm_plan(user_input: str) -> tuple[str, str, dict]:
+    """How orchestrate() would answer user_input as a session's first turn (see warmup.py)."""
+    route = fast_route(user_input)
+    model, _ = select_model(route)
+    return model, build_prompt(user_input, model), request_options(user_input, model, route, BATCH)
+
+
 def status() -> str:
     """Check health of model endpoints."""
     lines = ["[IGRIS STATUS]"]
     
     # Only check the 2 models we actually use
     active_models = ["qwen", "deepseek"]
+    supervisor = get_supervisor()
+    backends = supervisor.status() if supervisor else {}
     for name in active_models:
         if name in MODELS:
-            state = "ONLINE" if model_health(name) else "OFFLINE"
-            lines.append(f"  {name}: {state}")
+            if supervisor and supervisor.is_unloaded(MODELS[name].url):
+                state = "UNLOADED"  # Started on the next request
+            else:
+                state = "ONLINE" if model_health(name) else "OFFLINE"
+            limits = deadlines(name)
+            lines.append(
+                f"  {name}: {state} (deadlines: ttft {limits.ttft:.1f}s, "
+                f"idle {limits.idle:.1f}s, total {limits.total:.0f}s)"
+            )
+            backend = backends.get(name)
+            if backend and backend["pid"]:
+                lines.append(
+                    f"    backend pid {backend['pid']}, {backend['threads']} threads, "
+                    f"idle {backend['idle_s']}s"
+                )
+            endpoints = endpoint_pool(name).endpoints()
+            if len(endpoints) > 1:
+                for ep in endpoints:
+                    lines.append(
+                        f"    {ep.url} [{ep.breaker.state}, {ep.outstanding} in flight]"
+                    )
     
+    load = SCHEDULER.snapshot()
+    ram_budget = f"{load['ram_budget_mb']}MB" if load["ram_budget_mb"] is not None else "unlimited"
+    lines.append(
+        f"  scheduler: {load['cpu_used']}/{load['cpu_budget']} threads, "
+        f"{load['ram_used_mb']}MB/{ram_budget} RAM, {load['queued']} queued"
+    )
+    cache = cache_stats()
+    if cache["entries"]:
+        lines.append(
+            f"  cache: {cache['entries']} responses, {cache['bytes'] // 1024}KB/"
+            f"{cache['max_bytes'] // 1024}KB (x{cache['ratio']} compression and dedup)"
+        )
+    warm = WARM_STATS.snapshot()
+    if warm["warmed"]:
+        lines.append(
+            f"  warmed: {warm['warmed']} answers, {warm['entries_hit']} used "
+            f"(hit rate {warm['hit_rate']:.0%}, {warm['hits']} hits)"
+        )
+
     stats = get_session_stats()
     if stats["requests"] > 0:
         lines.append(f"\n[SESSION STATS]")
@@ -137,11 +345,17 @@ def status() -> str:
         lines.append(f"  Errors: {stats['errors']}")
         if stats.get("avg_latency_ms"):
             lines.append(f"  Avg Latency: {stats['avg_latency_ms']}ms")
+        if stats.get("avg_queue_ms"):
+            lines.append(f"  Avg Queue Wait: {stats['avg_queue_ms']}ms")
     
     return "\n".join(lines)
 
 
-def orchestrate(user_input: str) -> str:
+def orchestrate(
+    user_input: str,
+    cancel: Optional[CancelToken] = None,
+    session_id: str = DEFAULT_SESSION,
+) -> str:
     """
     Optimized orchestration with fast routing.
     
@@ -149,27 +363,48 @@ def orchestrate(user_input: str) -> str:
     1. Fast heuristic check (no model call)
     2. Route to appropriate model
     3. Log and return response
+
+    Generation stops early if `cancel` is triggered (from any thread) or on
+    Ctrl-C; either way the open stream is closed and a CANCELLED entry logged.
+    History, cache entries and the server slot belong to session `session_id`.
     """
+    with TRACER.trace(), TRACER.span("turn", session=session_id), \
+            SESSIONS.use(session_id) as session:
+        return _orchestrate(user_input, cancel, session)
+
+
+def _orchestrate(user_input: str, cancel: Optional[CancelToken], session: Session) -> str:
     # Step 1: Fast route
-    route = fast_route(user_input)
+    with TRACER.span("fast_route"):
+        route = fast_route(user_input)
     print(f"[IGRIS] Route: {route}")
     
     # Step 2: Select model based on route
-    if route == "code":
-        target_model = "deepseek"
-        intent = "CODE"
-    else:
-        # Both 'general' and 'ambiguous' go to Qwen
-        target_model = "qwen"
-        intent = "GENERAL" if route == "general" else "AMBIGUOUS"
+    target_model, intent = select_model(route)
     
-    # Step 3: Build proper prompt
-    prompt = build_prompt(user_input, target_model)
+    # Step 3: Build proper prompt. Code pasted for deepseek becomes the
+    # session's workspace; later turns that edit it send a region and a diff of it.
+    if target_model == "deepseek":
+        _, code = split_code(user_input)
+        if code:
+            with session.lock:
+                session.workspace.update(code)
+    tools = tools_enabled()
+    with TRACER.span("build_prompt", model=target_model):
+        prompt = build_prompt(user_input, target_model, session, include_tools=tools)
+    # Earlier turns the prompt depends on (for deepseek, the workspace stands in for them)
+    if target_model == "qwen":
+        history_turns = len(session.turns())
+    else:
+        history_turns = int(editing(session, user_input))
     
     # Step 4: Check cache first
-    cached = get_cached(target_model, prompt)
+    with TRACER.span("cache_lookup"):
+        cached = get_cached(target_model, prompt)
     if cached:
         print_status(f"[CACHE HIT] {target_model}", "dim green")
+        if cached.get("warmed"):
+            WARM_STATS.hit(target_model, prompt)
         output = cached["output"]
         log_request(
             user_input=user_input,
@@ -177,23 +412,62 @@ def orchestrate(user_input: str) -> str:
             confidence=1.0,
             model=target_model,
             latency_ms=0,
-            output=output
+            output=output,
+            history_turns=history_turns
         )
         # Add to history for context
         if target_model == "qwen":
-            add_to_history(user_input, output)
+            add_to_history(session, user_input, output)
+        else:
+            update_workspace(session, output, fresh=not history_turns)
         return output
     
     print_status(f"[IGRIS] Using {target_model}...", "dim blue")
     
-    # Step 5: Call the model (streaming or regular)
+    # Step 5: Call the model. Identical prompts already being generated are
+    # coalesced onto that generation; a slow or failing target is hedged with
+    # a replica or the other model (see hedging.py).
+    cancel = cancel or CancelToken()
+    streamed: list[str] = []
+
+    def on_token(token: str) -> None:
+        streamed.append(token)
+        if STREAMING_ENABLED:
+            print_streaming(token)
+
+    fallback_model = "qwen" if target_model == "deepseek" else "deepseek"
+    options = partial(request_options, user_input, route=route, slot=session.slot,
+                      tools=tools)
+    runner: Runner = partial(
+        run_hedged,
+        fallback_model=fallback_model,
+        # Built only if the hedge or failover actually launches
+        fallback_prompt=partial(build_prompt, user_input, fallback_model, session,
+                                include_tools=tools),
+        cancel=cancel,
+        options=options,
+    )
+    if tools:
+        # Continuations extend a prompt only the answering model has seen; no hedging
+        def follow_up(model: str, text: str, on_token: Callable[[str], None]) -> dict:
+            return run_model_streaming(model, text, on_token, cancel=cancel, **options(model))
+        runner = with_tools(runner, follow_up)
     try:
+        with TRACER.span("generate", model=target_model):
+            response = run_model_coalesced(target_model, prompt, on_token, runner=runner,
+                                           cancel=cancel)
         if STREAMING_ENABLED:
-            # Streaming mode - print tokens as they arrive
-            response = run_model_streaming(target_model, prompt, print_streaming)
             print()  # Newline after streaming
-        else:
-            response = run_model(target_model, prompt)
+    except KeyboardInterrupt:
+        cancel.cancel()
+        response = {
+            "model": target_model,
+            "output": "".join(streamed),
+            "latency_ms": None,
+            "error": "CANCELLED",
+        }
+        if STREAMING_ENABLED:
+            print()
     except requests.exceptions.Timeout:
         print_error(f"{target_model.capitalize()} timed out.")
         log_request(
@@ -219,55 +493,70 @@ def orchestrate(user_input: str) -> str:
         )
         return ""
     
+    if response["error"] == "CANCELLED":
+        print_status("[IGRIS] Cancelled.", "yellow")
+        log_request(
+            user_input=user_input,
+            intent=intent,
+            confidence=1.0,
+            model=response["model"],
+            latency_ms=response["latency_ms"],
+            output=response["output"],
+            error="CANCELLED"
+        )
+        return ""
+
     if response["error"]:
-        # Fallback: try the other model
-        fallback_model = "qwen" if target_model == "deepseek" else "deepseek"
-        print_status(f"[IGRIS] {target_model} offline, trying {fallback_model}...", "yellow")
-        
-        try:
-            fallback_prompt = build_prompt(user_input, fallback_model)
-            if STREAMING_ENABLED:
-                response = run_model_streaming(fallback_model, fallback_prompt, print_streaming)
-                print()
-            else:
-                response = run_model(fallback_model, fallback_prompt)
-            if not response["error"]:
-                target_model = fallback_model
-        except requests.RequestException:
-            pass
-        
-        if response["error"]:
+        if response["error"] == "MODEL_OFFLINE":
             print_error("All models offline.")
-            log_request(
-                user_input=user_input,
-                intent=intent,
-                confidence=1.0,
-                model=target_model,
-                latency_ms=None,
-                output="",
-                error=response["error"]
-            )
-            return ""
+        else:
+            print_error(f"{response['model'].capitalize()} error: {response['error']}")
+        log_request(
+            user_input=user_input,
+            intent=intent,
+            confidence=1.0,
+            model=response["model"],
+            latency_ms=None,
+            output="",
+            error=response["error"]
+        )
+        return ""
+    target_model = response["model"]
     
-    # Step 6: Cache successful response
+    # Step 6: Report (the successful response was cached by run_model_coalesced)
     output = response["output"]
     latency = response["latency_ms"]
     
-    set_cached(target_model, prompt, response)
-    print_latency(target_model, latency)
+    queue_ms = response.get("queue_ms")
+    with TRACER.span("render"):
+        print_latency(target_model, latency, queue_ms)
+        if response.get("tool_calls"):
+            calls = response["tool_calls"]
+            print_status(
+                f"[TOOLS] {len(calls)} calls: " + ", ".join(
+                    f"{c['name']} {c['ms']:.0f}ms" + ("" if c["ok"] else " (failed)")
+                    + (" (memo)" if c["cached"] else "") for c in calls),
+                "dim",
+            )
     
-    log_request(
-        user_input=user_input,
-        intent=intent,
-        confidence=1.0,
-        model=target_model,
-        latency_ms=latency,
-        output=output
-    )
+    with TRACER.span("log"):
+        log_request(
+            user_input=user_input,
+            intent=intent,
+            confidence=1.0,
+            model=target_model,
+            latency_ms=latency,
+            output=output,
+            queue_ms=queue_ms,
+            history_turns=history_turns
+        )
     
-    # Add to conversation history for context (only for general chat)
+    # Add to conversation history for context (only for general chat);
+    # code answers update the workspace instead
     if target_model == "qwen":
-        add_to_history(user_input, output)
+        add_to_history(session, user_input, output)
+    else:
+        update_workspace(session, output, fresh=not history_turns)
     
     # For non-streaming mode, return output (streaming already printed)
     if not STREAMING_ENABLED:
@@ -275,17 +564,88 @@ def orchestrate(user_input: str) -> str:
     return ""
 
 
+def export_trace() -> None:
+    """Write the collected spans as a Chrome trace to logs/ and start afresh."""
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    path = TRACER.export_chrome(LOG_DIR / f"trace-{stamp}.json")
+    TRACER.clear()
+    print_status(f"[PROFILE] Trace written to {path} (open in ui.perfetto.dev)", "dim")
+
+
+def profiled_turn(user_input: str) -> str:
+    """Run one turn under cProfile; print the hottest functions and save the stats."""
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(orchestrate, user_input)
+    finally:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        LOG_DIR.mkdir(exist_ok=True)
+        path = LOG_DIR / f"profile-{stamp}.prof"
+        profiler.dump_stats(path)
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP)
+        print(out.getvalue())
+        print_status(f"[PROFILE] cProfile stats written to {path}", "dim")
+
+
+def print_breakdown() -> None:
+    """Show how the last turn's time was spent, stage by stage."""
+    stages = TRACER.breakdown()
+    if stages:
+        print_status(
+            "[PROFILE] " + ", ".join(f"{name} {ms:.1f}ms" for name, ms in stages), "dim"
+        )
+
+
+def reindex(announce: bool = True) -> None:
+    """Update the document index for IGRIS_RAG_PATHS and report what changed."""
+    stats = build_index()
+    log_system_event("RAG_INDEX", stats)
+    if announce:
+        print_status(
+            f"[IGRIS] Indexed {stats['files']} files ({stats['changed']} changed, "
+            f"{stats['removed']} removed) in {stats['ms']}ms",
+            "dim",
+        )
+    if NUMPY_AVAILABLE and EMBED_MODEL in MODELS:
+        vstats = build_vectors()
+        log_system_event("VECTOR_INDEX", vstats)
+        if announce and "error" not in vstats:
+            print_status(
+                f"[IGRIS] Embedded {vstats['embedded']} chunks "
+                f"({vstats['reused']} unchanged) in {vstats['ms']}ms",
+                "dim",
+            )
+        elif announce:
+            print_status(f"[IGRIS] Vector index skipped: {vstats['error']}", "dim")
+
+
 def main():
     """Main REPL loop."""
-    global STREAMING_ENABLED
+    global STREAMING_ENABLED, PROFILE_NEXT, TOOLS_ENABLED
     
     timestamp = datetime.now().strftime('%H:%M:%S')
     
     print_status(f"[{timestamp}] IGRIS online", "bold green")
     print("Features: streaming, caching, syntax highlighting")
     print("Commands: /status, /stats, /clear, /cache, /stream, /reset, /quit")
+    print("Ctrl-C stops the current answer; Ctrl-C at the prompt exits.")
     
     log_system_event("STARTUP", {"version": "1.0", "time": timestamp})
+    init_config()
+    cassette = install_cassette()
+    if cassette:
+        print(f"Backend cassette: {cassette.mode} ({cassette.cassette.path})")
+    if start_from_env():
+        print("Model servers start on first use and unload when idle.")
+    if configured_paths():
+        # Incremental: only files changed since the last run are re-read
+        threading.Thread(target=reindex, args=(False,), name="igris-rag-index",
+                         daemon=True).start()
+    start_health_monitor(["qwen", "deepseek"])
+    # Pre-computes answers to frequent questions from the logs while idle
+    start_warmup(warm_plan)
+    tracing_before_profile = False  # Restored after a /profile once turn
     
     while True:
         try:
@@ -319,10 +679,29 @@ def main():
                 print_status(f"[IGRIS] Streaming: {state}", "cyan")
                 continue
             
+            if user_input == "/tools":
+                TOOLS_ENABLED = not tools_enabled()
+                state = "ON" if TOOLS_ENABLED else "OFF"
+                print_status(f"[IGRIS] Tool calling: {state}", "cyan")
+                continue
+            
+            if user_input in ("/workspace", "/workspace clear"):
+                workspace = SESSIONS.get(DEFAULT_SESSION).workspace
+                if user_input == "/workspace clear":
+                    workspace.clear()
+                    print_success("[IGRIS] Workspace cleared.")
+                elif workspace.active:
+                    print(f"[WORKSPACE] version {workspace.version}")
+                    format_output(f"```\n{workspace.text}\n```")
+                else:
+                    print("[WORKSPACE] Empty")
+                continue
+            
             if user_input == "/history":
-                if conversation_history:
-                    print(f"[HISTORY] {len(conversation_history)} turns stored")
-                    for i, (u, a) in enumerate(conversation_history):
+                history = SESSIONS.get(DEFAULT_SESSION).turns()
+                if history:
+                    print(f"[HISTORY] {len(history)} turns stored")
+                    for i, (u, a) in enumerate(history):
                         print(f"  {i+1}. User: {u[:50]}...")
                 else:
                     print("[HISTORY] Empty")
@@ -336,6 +715,27 @@ def main():
                 print_success(f"[IGRIS] Reset complete: {log_count} log entries cleared, {cache_count} cached responses cleared, history cleared.")
                 continue
             
+            if user_input in ("/profile", "/profile once"):
+                if user_input == "/profile once":
+                    PROFILE_NEXT = True
+                    tracing_before_profile = TRACER.enabled
+                    TRACER.enable()
+                    print_status("[IGRIS] The next request will be profiled.", "cyan")
+                elif TRACER.enabled:
+                    TRACER.disable()
+                    export_trace()
+                else:
+                    TRACER.enable()
+                    print_status("[IGRIS] Tracing ON; /profile again to stop and export.", "cyan")
+                continue
+
+            if user_input == "/reindex":
+                if not configured_paths():
+                    print_error("Set IGRIS_RAG_PATHS to the directories to index.")
+                else:
+                    reindex()
+                continue
+
             if user_input in ("/quit", "/exit"):
                 log_system_event("SHUTDOWN", {"reason": "user_exit"})
                 print_status("Exiting IGRIS.", "yellow")
@@ -349,17 +749,37 @@ def main():
                     /clear    - Clear conversation history
                     /cache    - Clear response cache
                     /stream   - Toggle streaming mode
+                    /tools    - Toggle tool calling
                     /history  - Show conversation history
+                    /workspace - Show the code being edited (clear: start over)
                     /reset    - Reset all (clear logs, cache, history)
+                    /reindex  - Update the local document index
+                    /profile  - Toggle stage tracing (once: also cProfile the next request)
                     /help     - Show this help
                     /quit     - Exit IGRIS
                 """)
                 continue
 
-            response = orchestrate(user_input)
+            try:
+                if PROFILE_NEXT:
+                    PROFILE_NEXT = False
+                    response = profiled_turn(user_input)
+                    print_breakdown()
+                    if not tracing_before_profile:
+                        TRACER.disable()
+                        export_trace()  # Otherwise exported with the rest by the next /profile
+                else:
+                    response = orchestrate(user_input)
+                    if TRACER.enabled:
+                        print_breakdown()
+            except KeyboardInterrupt:
+                # Interrupted outside the generation itself; stay in the REPL
+                print_status("\n[IGRIS] Cancelled.", "yellow")
+                continue
             if response:
                 # Non-streaming mode - format and print
-                format_output(response)
+                with TRACER.span("render"):
+                    format_output(response)
 
         except KeyboardInterrupt:
             log_system_event("SHUTDOWN", {"reason": "interrupt"})
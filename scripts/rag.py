@@ -0,0 +1,447 @@
+"""
+IGRIS Local Document Retrieval
+
+BM25 search over local files so deepseek can answer questions about our
+codebases without pasting files into the prompt. Configure the directories to
+index with IGRIS_RAG_PATHS (separated by os.pathsep, relative to the project
+root) and build the index with:
+
+    python scripts/rag.py index
+    python scripts/rag.py search "how are replicas balanced"
+
+The index lives in IGRIS_RAG_INDEX (default index/ under the project root):
+
+- forward.json: per-file mtime, size and hash plus each chunk's text and term
+  counts, so a re-index reads and tokenizes only files that changed
+- gen-*/: the query-side structures. lexicon.json maps each term to its
+  postings offset and document frequency; postings.bin / freqs.bin (chunk ids
+  and term frequencies) and chunks.bin / chunk_meta.bin (snippet text) are
+  flat uint32/byte arrays, memory-mapped at query time
+- CURRENT: names the live generation. It is swapped atomically, so searches
+  keep working while a re-index runs.
+"""
+
+import argparse
+import hashlib
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import threading
+import time
+from array import array
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+try:
+    from .base import ROOT
+    from .config import load_dotenv
+except ImportError:
+    from base import ROOT
+    from config import load_dotenv
+
+EXTENSIONS = {
+    ".py", ".md", ".txt", ".rst", ".toml", ".cfg", ".ini", ".json", ".yaml", ".yml",
+    ".sh", ".ps1", ".js", ".ts", ".c", ".h", ".cpp", ".hpp", ".rs", ".go", ".java",
+}
+SKIP_DIRS = {".git", "__pycache__", "node_modules", ".venv", "venv", "build", "logs"}
+MAX_FILE_BYTES = 1_000_000
+CHUNK_CHARS = 1200  # Chunks end at a line boundary at or before this size
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Terms in more than this fraction of chunks carry almost no signal; skipping
+# them keeps queries fast on large indexes
+MAX_DF_RATIO = 0.5
+
+TOP_K = 4
+MIN_SCORE = 1.0
+CONTEXT_TOKENS = 1024  # Prompt budget for injected snippets
+CHARS_PER_TOKEN = 4  # Rough estimate; no tokenizer on the client side
+
+META_FIELDS = 5  # chunk_meta.bin: path index, first line, text offset, text length, doc length
+
+STOPWORDS = {
+    "the", "and", "for", "are", "but", "not", "you", "all", "can", "was", "this",
+    "that", "with", "from", "have", "has", "how", "what", "when", "where", "which",
+    "does", "into", "its", "our", "their", "there", "then", "than", "these",
+    "is", "it", "in", "of", "to", "a", "an", "on", "or", "as", "be", "by", "at", "we",
+}
+
+_WORD = re.compile(r"[A-Za-z0-9_]+")
+_PART = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words; identifiers also yield their snake_case/camelCase parts."""
+    terms = []
+    for word in _WORD.findall(text):
+        lower = word.lower()
+        if len(lower) > 1 and lower not in STOPWORDS:
+            terms.append(lower)
+        if "_" in word or (word != lower and word != word.upper()):
+            for part in _PART.findall(word):
+                part = part.lower()
+                if len(part) > 1 and part != lower and part not in STOPWORDS:
+                    terms.append(part)
+    return terms
+
+
+def chunk_text(text: str) -> List[Tuple[int, str]]:
+    """Split into (first line number, text) chunks of about CHUNK_CHARS."""
+    chunks: List[Tuple[int, str]] = []
+    buf: List[str] = []
+    size = 0
+    start = 1
+    for lineno, line in enumerate(text.splitlines(keepends=True), 1):
+        if buf and size + len(line) > CHUNK_CHARS:
+            chunks.append((start, "".join(buf)))
+            buf, size, start = [], 0, lineno
+        buf.append(line)
+        size += len(line)
+    if buf and "".join(buf).strip():
+        chunks.append((start, "".join(buf)))
+    return chunks
+
+
+def configured_paths() -> List[Path]:
+    """Directories from IGRIS_RAG_PATHS, resolved against ROOT."""
+    raw = os.environ.get("IGRIS_RAG_PATHS", "")
+    return [ROOT / p for p in raw.split(os.pathsep) if p.strip()]
+
+
+def default_index_dir() -> Path:
+    """IGRIS_RAG_INDEX resolved against ROOT, read at use so .env can set it."""
+    return ROOT / os.environ.get("IGRIS_RAG_INDEX", "index")
+
+
+def discover(paths: List[Path], index_dir: Path) -> Iterator[Path]:
+    for base in paths:
+        if base.is_file():
+            yield base
+            continue
+        for dirpath, dirnames, filenames in os.walk(base):
+            dirnames[:] = sorted(
+                d for d in dirnames
+                if d not in SKIP_DIRS and not d.startswith(".")
+                and Path(dirpath, d).resolve() != index_dir.resolve()
+            )
+            for name in sorted(filenames):
+                if Path(name).suffix.lower() in EXTENSIONS:
+                    yield Path(dirpath, name)
+
+
+def _display_path(path: Path) -> str:
+    try:
+        return str(path.resolve().relative_to(ROOT.resolve()))
+    except ValueError:
+        return str(path.resolve())
+
+
+# -- indexing --
+
+_build_lock = threading.Lock()
+
+
+def build_index(paths: Optional[List[Path]] = None, index_dir: Optional[Path] = None) -> dict:
+    """
+    Incrementally (re)index paths. Files whose mtime and size are unchanged are
+    not read; files that changed are hashed and only re-tokenized if their
+    content differs. Returns counts of files, changed, removed and chunks.
+    """
+    paths = paths if paths is not None else configured_paths()
+    index_dir = index_dir or default_index_dir()
+    start = time.perf_counter()
+    with _build_lock:
+        index_dir.mkdir(parents=True, exist_ok=True)
+        forward_path = index_dir / "forward.json"
+        try:
+            forward: Dict[str, dict] = json.loads(forward_path.read_text())
+        except (OSError, json.JSONDecodeError):
+            forward = {}
+
+        files: Dict[str, dict] = {}
+        changed = 0
+        for path in discover(paths, index_dir):
+            key = _display_path(path)
+            try:
+                st = path.stat()
+                if st.st_size > MAX_FILE_BYTES:
+                    continue
+                old = forward.get(key)
+                if old and old["mtime"] == st.st_mtime and old["size"] == st.st_size:
+                    files[key] = old
+                    continue
+                data = path.read_bytes()
+            except OSError:
+                continue
+            if b"\0" in data[:1024]:
+                continue  # Binary
+            sha1 = hashlib.sha1(data).hexdigest()
+            if old and old["sha1"] == sha1:
+                files[key] = {**old, "mtime": st.st_mtime, "size": st.st_size}
+                continue
+            text = data.decode("utf-8", errors="replace")
+            files[key] = {
+                "mtime": st.st_mtime,
+                "size": st.st_size,
+                "sha1": sha1,
+                "chunks": [
+                    {"line": line, "text": chunk, "tf": dict(Counter(tokenize(chunk)))}
+                    for line, chunk in chunk_text(text)
+                ],
+            }
+            changed += 1
+
+        removed = len(set(forward) - set(files))
+        if changed or removed or current_generation(index_dir) is None:
+            _write_generation(files, index_dir)
+            tmp = forward_path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(files))
+            os.replace(tmp, forward_path)
+        elif files != forward:
+            forward_path.write_text(json.dumps(files))  # Only mtimes moved
+
+    return {
+        "files": len(files),
+        "changed": changed,
+        "removed": removed,
+        "chunks": sum(len(f["chunks"]) for f in files.values()),
+        "ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+def _write_generation(files: Dict[str, dict], index_dir: Path) -> None:
+    postings_by_term: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+    paths: List[str] = []
+    meta = array("I")
+    texts = bytearray()
+    total_len = 0
+
+    for path in sorted(files):
+        path_idx = len(paths)
+        paths.append(path)
+        for chunk in files[path]["chunks"]:
+            chunk_id = len(meta) // META_FIELDS
+            encoded = chunk["text"].encode("utf-8")
+            doc_len = sum(chunk["tf"].values())
+            meta.extend([path_idx, chunk["line"], len(texts), len(encoded), doc_len])
+            texts += encoded
+            total_len += doc_len
+            for term, count in chunk["tf"].items():
+                postings_by_term[term].append((chunk_id, count))
+
+    postings = array("I")
+    freqs = array("I")
+    lexicon: Dict[str, List[int]] = {}
+    for term in sorted(postings_by_term):
+        entries = postings_by_term[term]
+        lexicon[term] = [len(postings), len(entries)]
+        for chunk_id, count in entries:
+            postings.append(chunk_id)
+            freqs.append(count)
+
+    n_chunks = len(meta) // META_FIELDS
+    gen = index_dir / f"gen-{time.time_ns()}"
+    gen.mkdir()
+    with open(gen / "postings.bin", "wb") as f:
+        postings.tofile(f)
+    with open(gen / "freqs.bin", "wb") as f:
+        freqs.tofile(f)
+    with open(gen / "chunk_meta.bin", "wb") as f:
+        meta.tofile(f)
+    (gen / "chunks.bin").write_bytes(bytes(texts))
+    (gen / "lexicon.json").write_text(json.dumps({
+        "paths": paths,
+        "n_chunks": n_chunks,
+        "avgdl": total_len / n_chunks if n_chunks else 0.0,
+        "terms": lexicon,
+    }))
+
+    tmp = index_dir / "CURRENT.tmp"
+    tmp.write_text(gen.name)
+    os.replace(tmp, index_dir / "CURRENT")
+    # Open readers keep their mappings; unlinked files stay valid until closed
+    for old in index_dir.glob("gen-*"):
+        if old != gen:
+            shutil.rmtree(old, ignore_errors=True)
+
+
+def current_generation(index_dir: Path) -> Optional[Path]:
+    try:
+        name = (index_dir / "CURRENT").read_text().strip()
+    except OSError:
+        return None
+    gen = index_dir / name
+    return gen if gen.is_dir() else None
+
+
+# -- search --
+
+@dataclass
+class Hit:
+    path: str
+    line: int
+    text: str
+    score: float
+    chunk_id: int = -1
+
+
+def _map(path: Path) -> Tuple[Optional[mmap.mmap], memoryview]:
+    """Memory-map a file read-only; empty files get an empty view."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None, memoryview(b"")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return mm, memoryview(mm)
+
+
+class Index:
+    """A read-only, memory-mapped index generation."""
+
+    def __init__(self, gen: Path) -> None:
+        self.gen = gen
+        lexicon = json.loads((gen / "lexicon.json").read_text())
+        self.paths: List[str] = lexicon["paths"]
+        self.terms: Dict[str, List[int]] = lexicon["terms"]
+        self.n_chunks: int = lexicon["n_chunks"]
+        self.avgdl: float = lexicon["avgdl"] or 1.0
+        self._maps = [_map(gen / name) for name in
+                      ("postings.bin", "freqs.bin", "chunk_meta.bin", "chunks.bin")]
+        views = [view for _, view in self._maps]
+        self.postings = views[0].cast("I") if len(views[0]) else views[0]
+        self.freqs = views[1].cast("I") if len(views[1]) else views[1]
+        self.meta = views[2].cast("I") if len(views[2]) else views[2]
+        self.texts = views[3]
+
+    def search(self, query: str, k: int = TOP_K) -> List[Hit]:
+        """Top-k chunks for query by BM25."""
+        n = self.n_chunks
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            entry = self.terms.get(term)
+            if entry is None:
+                continue
+            offset, df = entry
+            if n > 20 and df > n * MAX_DF_RATIO:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            ids = self.postings[offset:offset + df]
+            tfs = self.freqs[offset:offset + df]
+            for chunk_id, tf in zip(ids, tfs, strict=True):
+                doc_len = self.meta[chunk_id * META_FIELDS + 4]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len / self.avgdl)
+                scores[chunk_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        top = heapq.nlargest(k, scores.items(), key=lambda kv: kv[1])
+        return [self.chunk(chunk_id, score) for chunk_id, score in top]
+
+    def chunk(self, chunk_id: int, score: float = 0.0) -> Hit:
+        """The stored snippet for a chunk id."""
+        base = chunk_id * META_FIELDS
+        path_idx, line, offset, length = self.meta[base:base + 4]
+        text = bytes(self.texts[offset:offset + length]).decode("utf-8", errors="replace")
+        return Hit(self.paths[path_idx], line, text, round(score, 3), chunk_id)
+
+    def close(self) -> None:
+        for mm, view in self._maps:
+            view.release()
+            if mm is not None:
+                mm.close()
+
+
+_open_index: Optional[Index] = None
+_open_lock = threading.Lock()
+
+
+def open_index(index_dir: Optional[Path] = None) -> Optional[Index]:
+    """The current index generation, reopened when a re-index swaps it."""
+    global _open_index
+    gen = current_generation(index_dir or default_index_dir())
+    if gen is None:
+        return None
+    with _open_lock:
+        if _open_index is None or _open_index.gen != gen:
+            # The previous generation is left to the GC: a search may still use it
+            _open_index = Index(gen)
+        return _open_index
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def retrieve(
+    query: str,
+    budget_tokens: int = CONTEXT_TOKENS,
+    k: int = TOP_K,
+    index_dir: Optional[Path] = None,
+) -> List[Hit]:
+    """Best matching snippets that fit in budget_tokens, best first."""
+    index = open_index(index_dir)
+    if index is None:
+        return []
+    hits = [hit for hit in index.search(query, k) if hit.score >= MIN_SCORE]
+    return pack(hits, budget_tokens)
+
+
+def pack(hits: List[Hit], budget_tokens: int) -> List[Hit]:
+    """Keep hits, in order, while their estimated size fits budget_tokens."""
+    chosen: List[Hit] = []
+    used = 0
+    for hit in hits:
+        cost = estimate_tokens(hit.text) + 8  # Header line
+        if used + cost > budget_tokens:
+            continue
+        chosen.append(hit)
+        used += cost
+    return chosen
+
+
+def format_context(hits: List[Hit]) -> str:
+    """Snippets as a prompt section; empty string when there are none."""
+    if not hits:
+        return ""
+    parts = ["Relevant local files:"]
+    for hit in hits:
+        parts.append(f"--- {hit.path}:{hit.line}\n{hit.text.rstrip()}")
+    return "\n".join(parts) + "\n\n"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build or query the IGRIS document index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    index_cmd = sub.add_parser("index", help="index files (incremental)")
+    index_cmd.add_argument("paths", nargs="*", type=Path,
+                           help="files or directories (default: IGRIS_RAG_PATHS)")
+    search_cmd = sub.add_parser("search", help="show the best matches for a query")
+    search_cmd.add_argument("query")
+    search_cmd.add_argument("-k", type=int, default=TOP_K)
+    args = parser.parse_args()
+    load_dotenv()
+
+    if args.command == "index":
+        paths = args.paths or configured_paths()
+        if not paths:
+            parser.error("no paths given and IGRIS_RAG_PATHS is not set")
+        print(build_index(paths))
+        return
+
+    index = open_index()
+    if index is None:
+        parser.error(f"no index in {default_index_dir()}; run the index command first")
+    start = time.perf_counter()
+    hits = index.search(args.query, args.k)
+    elapsed = (time.perf_counter() - start) * 1000
+    for hit in hits:
+        print(f"{hit.score:7.3f}  {hit.path}:{hit.line}")
+    print(f"[{len(hits)} hits in {elapsed:.2f}ms]")
+
+
+if __name__ == "__main__":
+    main()
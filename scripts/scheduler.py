@@ -0,0 +1,216 @@
+"""
+IGRIS Resource Scheduler
+
+Admits generations against a machine-wide RAM and CPU budget so co-resident
+models don't push each other into swap. Each model declares its approximate
+footprint in ModelConfig:
+
+- ram_mb: working set while generating (weights + KV cache); counted once per
+  model no matter how many of its requests are running
+- cpu_threads: cores the model's server keeps busy; also counted once per
+  model, since a llama-server's threads are fixed per process and its
+  parallel slots share them
+
+A request that doesn't fit waits in a priority queue instead of overcommitting.
+Interactive requests are served before batch ones, and a waiting interactive
+request is never overtaken by batch work. When nothing is running, the head
+of the queue is always admitted, so a model bigger than the budget still runs
+(alone). Background work can register with on_interactive() to step aside
+as soon as an interactive request arrives.
+
+Budgets default to total RAM minus RAM_RESERVE_MB and every core; set
+IGRIS_RAM_MB / IGRIS_THREADS to override.
+"""
+
+import itertools
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Priorities (lower runs first)
+INTERACTIVE = 0
+BATCH = 1
+
+RAM_RESERVE_MB = 2048  # Left for the OS, page cache and IGRIS itself
+QUEUE_POLL = 0.1  # Seconds between cancellation checks while queued
+
+
+def total_ram_mb() -> Optional[int]:
+    """Physical RAM in MB, or None if it can't be determined."""
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _env_int(name: str) -> Optional[int]:
+    value = os.environ.get(name, "")
+    return int(value) if value.isdigit() else None
+
+
+class Grant:
+    """An admitted request; release it through Scheduler.release()."""
+
+    def __init__(self, model: str, ram_mb: int, cpu_threads: int, priority: int) -> None:
+        self.model = model
+        self.ram_mb = ram_mb
+        self.cpu_threads = cpu_threads
+        self.priority = priority
+        self.queued_at = time.perf_counter()
+        self.queue_ms = 0.0
+        self.granted = False
+
+
+class Scheduler:
+    """Priority admission queue over a RAM/CPU budget."""
+
+    def __init__(self, ram_mb: Optional[int] = None, cpu_threads: Optional[int] = None) -> None:
+        self._ram_mb = ram_mb
+        self._cpu_threads = cpu_threads
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[int, int, Grant]] = []
+        self._seq = itertools.count()
+        self._running: Dict[str, int] = {}  # model -> admitted requests
+        self._model_ram: Dict[str, int] = {}  # model -> MB charged while it runs
+        self._model_cpu: Dict[str, int] = {}  # model -> threads charged while it runs
+        self._ram_used = 0
+        self._cpu_used = 0
+        self._interactive = 0  # Interactive requests queued or running
+        self.last_interactive = 0.0  # time.monotonic() of the last one's arrival or end
+        self._listeners: List[Callable[[], None]] = []
+
+    @property
+    def ram_budget(self) -> Optional[int]:
+        """MB available to models; None means unlimited."""
+        if self._ram_mb is not None:
+            return self._ram_mb
+        env = _env_int("IGRIS_RAM_MB")
+        if env is not None:
+            return env
+        total = total_ram_mb()
+        return max(0, total - RAM_RESERVE_MB) if total else None
+
+    @property
+    def cpu_budget(self) -> int:
+        return self._cpu_threads or _env_int("IGRIS_THREADS") or os.cpu_count() or 1
+
+    def _fits(self, grant: Grant) -> bool:
+        # Priority comes first: not even a model that is already running takes
+        # on lower priority work while a higher priority request waits
+        if any(not e[2].granted and e[0] < grant.priority for e in self._queue):
+            return False
+        if not self._running or grant.model in self._running:
+            return True  # Its RAM and threads are already charged
+        budget = self.ram_budget
+        return (budget is None or self._ram_used + grant.ram_mb <= budget) and \
+            self._cpu_used + grant.cpu_threads <= self.cpu_budget
+
+    def _admit(self, grant: Grant) -> None:
+        if grant.model not in self._running:
+            self._model_ram[grant.model] = grant.ram_mb
+            self._ram_used += grant.ram_mb
+            self._model_cpu[grant.model] = grant.cpu_threads
+            self._cpu_used += grant.cpu_threads
+        self._running[grant.model] = self._running.get(grant.model, 0) + 1
+        grant.granted = True
+        grant.queue_ms = round((time.perf_counter() - grant.queued_at) * 1000, 2)
+
+    def _dispatch(self) -> None:
+        """Admit queued requests in priority order while they fit (caller holds _cond)."""
+        blocked: Optional[int] = None
+        admitted = False
+        for entry in sorted(self._queue):
+            grant = entry[2]
+            if blocked is not None and grant.priority > blocked:
+                break  # Lower priority work can't overtake a blocked request
+            if self._fits(grant):
+                self._admit(grant)
+                admitted = True
+            elif blocked is None:
+                blocked = grant.priority
+        if admitted:
+            self._queue = [e for e in self._queue if not e[2].granted]
+            self._cond.notify_all()
+
+    def acquire(
+        self,
+        model: str,
+        ram_mb: int,
+        cpu_threads: int,
+        priority: int = INTERACTIVE,
+        cancelled: Optional[Callable[[], bool]] = None,
+    ) -> Optional[Grant]:
+        """Wait until the request fits the budget. Returns None if cancelled while queued."""
+        grant = Grant(model, ram_mb, cpu_threads, priority)
+        with self._cond:
+            if priority == INTERACTIVE:
+                self._interactive += 1
+                self.last_interactive = time.monotonic()
+                listeners = list(self._listeners)
+        if priority == INTERACTIVE:
+            for listener in listeners:
+                listener()  # E.g. cancel background work before queueing behind it
+        with self._cond:
+            self._queue.append((priority, next(self._seq), grant))
+            self._dispatch()
+            while not grant.granted:
+                if cancelled is not None and cancelled():
+                    self._queue = [e for e in self._queue if e[2] is not grant]
+                    self._end_interactive(grant)
+                    self._dispatch()
+                    return None
+                self._cond.wait(QUEUE_POLL)
+        return grant
+
+    def release(self, grant: Grant) -> None:
+        with self._cond:
+            self._end_interactive(grant)
+            self._running[grant.model] -= 1
+            if not self._running[grant.model]:
+                del self._running[grant.model]
+                self._ram_used -= self._model_ram.pop(grant.model)
+                self._cpu_used -= self._model_cpu.pop(grant.model)
+            self._dispatch()
+
+    def _end_interactive(self, grant: Grant) -> None:
+        if grant.priority == INTERACTIVE:
+            self._interactive -= 1
+            self.last_interactive = time.monotonic()
+
+    def interactive_idle(self) -> float:
+        """Seconds since interactive work last ran; 0.0 while any is queued or running."""
+        with self._cond:
+            if self._interactive:
+                return 0.0
+            return time.monotonic() - self.last_interactive
+
+    def on_interactive(self, listener: Callable[[], None]) -> Callable[[], None]:
+        """
+        Call listener() whenever an interactive request arrives, before it
+        queues. Returns a function that unregisters it.
+        """
+        with self._cond:
+            self._listeners.append(listener)
+
+        def remove() -> None:
+            with self._cond:
+                if listener in self._listeners:
+                    self._listeners.remove(listener)
+        return remove
+
+    def snapshot(self) -> dict:
+        """Current usage and queue depth, for /status."""
+        with self._cond:
+            return {
+                "running": dict(self._running),
+                "queued": len(self._queue),
+                "queued_interactive": sum(1 for p, _, _ in self._queue if p == INTERACTIVE),
+                "ram_used_mb": self._ram_used,
+                "ram_budget_mb": self.ram_budget,
+                "cpu_used": self._cpu_used,
+                "cpu_budget": self.cpu_budget,
+            }
+
+
+SCHEDULER = Scheduler()
@@ -0,0 +1,223 @@
+"""
+IGRIS Sessions
+
+Conversation state per session id, so several conversations can run in one
+process without mixing contexts. A Session holds:
+
+- history: the last MAX_HISTORY (user, assistant) turns
+- summary: a short digest of older turns, kept under SUMMARY_CHARS
+- workspace: the code being edited with deepseek (see workspace.py)
+- slot: the llama-server slot pinned to the conversation, so its prompt
+  prefix stays in that slot's KV cache between turns (IGRIS_SLOTS, matching
+  the servers' --parallel)
+
+SessionStore keeps at most MAX_SESSIONS in memory. The least recently used
+idle sessions beyond that are written to IGRIS_SESSION_DIR (default
+sessions/) and read back on their next use. Both settings are read at first
+use, after .env is loaded. Sessions checked out with SessionStore.use() are never evicted
+while in use. The store and each session are guarded by locks; async callers
+use aget(), which does any disk read off the event loop.
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+try:
+    from .base import ROOT
+    from .workspace import Workspace
+except ImportError:
+    from base import ROOT
+    from workspace import Workspace
+
+DEFAULT_SESSION = "default"
+MAX_SESSIONS = 64
+MAX_HISTORY = 4
+SUMMARY_CHARS = 600
+TOPIC_CHARS = 80  # Per dropped turn in the summary
+
+_ID_PATTERN = re.compile(r"[A-Za-z0-9_.-]{1,64}")
+
+
+@dataclass
+class Session:
+    id: str
+    history: List[Tuple[str, str]] = field(default_factory=list)
+    summary: str = ""
+    slot: Optional[int] = None
+    workspace: Workspace = field(default_factory=Workspace)
+    last_used: float = field(default_factory=time.time)
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False, compare=False)
+    users: int = field(default=0, repr=False, compare=False)
+
+    def add_turn(self, user_input: str, response: str) -> None:
+        """Append a turn; turns past MAX_HISTORY move into the summary."""
+        with self.lock:
+            self.history.append((user_input, response))
+            while len(self.history) > MAX_HISTORY:
+                dropped, _ = self.history.pop(0)
+                topic = " ".join(dropped.split())[:TOPIC_CHARS]
+                summary = f"{self.summary}; {topic}" if self.summary else topic
+                self.summary = summary[-SUMMARY_CHARS:]
+            self.last_used = time.time()
+
+    def turns(self) -> List[Tuple[str, str]]:
+        with self.lock:
+            return list(self.history)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.history.clear()
+            self.summary = ""
+            self.workspace.clear()
+
+    def to_dict(self) -> dict:
+        with self.lock:
+            return {
+                "id": self.id,
+                "history": self.history,
+                "summary": self.summary,
+                "slot": self.slot,
+                "workspace": self.workspace.to_dict(),
+                "last_used": self.last_used,
+            }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Session":
+        return cls(
+            id=data["id"],
+            history=[tuple(turn) for turn in data.get("history", [])],
+            summary=data.get("summary", ""),
+            slot=data.get("slot"),
+            workspace=Workspace.from_dict(data.get("workspace", {})),
+            last_used=data.get("last_used", time.time()),
+        )
+
+
+class SessionStore:
+    """Sessions by id: an LRU in memory, spilling idle ones to disk."""
+
+    def __init__(
+        self,
+        directory: Optional[Path] = None,
+        max_sessions: int = MAX_SESSIONS,
+        slots: Optional[int] = None,
+    ) -> None:
+        self._directory = directory
+        self.max_sessions = max_sessions
+        self._slots = slots
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self) -> Path:
+        """Where idle sessions are spilled: the constructor's, else IGRIS_SESSION_DIR."""
+        return self._directory or ROOT / os.environ.get("IGRIS_SESSION_DIR", "sessions")
+
+    @property
+    def slots(self) -> int:
+        """Server slots to pin sessions to: the constructor's, else IGRIS_SLOTS."""
+        slots = self._slots if self._slots is not None else int(os.environ.get("IGRIS_SLOTS", "1"))
+        return max(1, slots)
+
+    def _path(self, session_id: str) -> Path:
+        return self.directory / f"{session_id}.json"
+
+    def get(self, session_id: str = DEFAULT_SESSION) -> Session:
+        """The session for an id, loaded from disk or created as needed."""
+        with self._lock:
+            return self._checkout(session_id, hold=False)
+
+    async def aget(self, session_id: str = DEFAULT_SESSION) -> Session:
+        return await asyncio.to_thread(self.get, session_id)
+
+    @contextmanager
+    def use(self, session_id: str = DEFAULT_SESSION) -> Iterator[Session]:
+        """Check out a session; it stays in memory until the block exits."""
+        with self._lock:
+            session = self._checkout(session_id, hold=True)
+        try:
+            yield session
+        finally:
+            with self._lock:
+                session.users -= 1
+                self._evict()
+
+    def drop(self, session_id: str) -> None:
+        """Forget a session, in memory and on disk."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._path(session_id).unlink(missing_ok=True)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def ids(self) -> List[str]:
+        """In-memory session ids, least recently used first."""
+        with self._lock:
+            return list(self._sessions)
+
+    def _checkout(self, session_id: str, hold: bool) -> Session:
+        if not _ID_PATTERN.fullmatch(session_id):
+            raise ValueError(f"invalid session id: {session_id!r}")
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._load(session_id) or Session(id=session_id, slot=self._free_slot())
+            self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        session.last_used = time.time()
+        if hold:
+            session.users += 1
+        self._evict()
+        return session
+
+    def _free_slot(self) -> int:
+        slots = self.slots
+        in_use = [0] * slots
+        for session in self._sessions.values():
+            if session.slot is not None and session.slot < slots:
+                in_use[session.slot] += 1
+        return in_use.index(min(in_use))
+
+    def _load(self, session_id: str) -> Optional[Session]:
+        path = self._path(session_id)
+        try:
+            session = Session.from_dict(json.loads(path.read_text()))
+        except (OSError, ValueError, KeyError):
+            return None
+        path.unlink(missing_ok=True)  # Disk only holds evicted sessions
+        if session.slot is None or session.slot >= self.slots:
+            session.slot = self._free_slot()
+        return session
+
+    def _evict(self) -> None:
+        # With self._lock held. Least recently used first; checked-out sessions stay
+        excess = len(self._sessions) - self.max_sessions
+        for session_id in list(self._sessions):
+            if excess <= 0:
+                break
+            session = self._sessions[session_id]
+            if session.users:
+                continue
+            self._save(session)
+            del self._sessions[session_id]
+            excess -= 1
+
+    def _save(self, session: Session) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(session.id)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(session.to_dict()))
+        os.replace(tmp, path)
+
+
+SESSIONS = SessionStore()
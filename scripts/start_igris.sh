@@ -3,26 +3,35 @@
 SESSION="igris"
 ROOT="$(cd "$(dirname "$0")/.." && pwd)"
 
+# Ports and model paths come from .env (see .env.example)
+if [ -f "$ROOT/.env" ]; then
+    set -a; . "$ROOT/.env"; set +a
+fi
+QWEN_PORT="${QWEN_PORT:-8001}"
+DEEPSEEK_PORT="${DEEPSEEK_PORT:-8002}"
+QWEN_MODEL="${QWEN_MODEL:-models/qwen2.5-3b-instruct-q4_k_m.gguf}"
+DEEPSEEK_MODEL="${DEEPSEEK_MODEL:-models/deepseek-coder-6.7b-instruct-q4_k_m.gguf}"
+
 # Kill existing session if running
 tmux kill-session -t $SESSION 2>/dev/null
 
 tmux new-session -d -s $SESSION -c "$ROOT"
 
-# QWEN (Face/General) - Port 8001
+# QWEN (Face/General)
 tmux send-keys -t $SESSION \
-"echo '[IGRIS] Starting Qwen on port 8001...' && \
+"echo '[IGRIS] Starting Qwen on port $QWEN_PORT...' && \
 $ROOT/llama.cpp/build/bin/llama-server \
--m $ROOT/models/qwen2.5-3b-instruct-q4_k_m.gguf \
---host 127.0.0.1 --port 8001 \
+-m $ROOT/$QWEN_MODEL \
+--host 127.0.0.1 --port $QWEN_PORT \
 -c 4096 -t 6" C-m
 
-# DEEPSEEK (Coder) - Port 8002
+# DEEPSEEK (Coder)
 tmux split-window -h -t $SESSION -c "$ROOT"
 tmux send-keys -t $SESSION \
-"echo '[IGRIS] Starting DeepSeek on port 8002...' && \
+"echo '[IGRIS] Starting DeepSeek on port $DEEPSEEK_PORT...' && \
 $ROOT/llama.cpp/build/bin/llama-server \
--m $ROOT/models/deepseek-coder-6.7b-instruct-q4_k_m.gguf \
---host 127.0.0.1 --port 8002 \
+-m $ROOT/$DEEPSEEK_MODEL \
+--host 127.0.0.1 --port $DEEPSEEK_PORT \
 -c 4096 -t 8" C-m
 
 tmux select-layout even-horizontal
@@ -30,8 +39,8 @@ echo ""
 echo "╔══════════════════════════════════════════════════════════════╗"
 echo "║  IGRIS - Optimized 2-Model Architecture                      ║"
 echo "╠══════════════════════════════════════════════════════════════╣"
-echo "║  Qwen (General)  : http://127.0.0.1:8001                     ║"
-echo "║  DeepSeek (Code) : http://127.0.0.1:8002                     ║"
+printf "║  Qwen (General)  : %-42s║\n" "http://127.0.0.1:$QWEN_PORT"
+printf "║  DeepSeek (Code) : %-42s║\n" "http://127.0.0.1:$DEEPSEEK_PORT"
 echo "╚══════════════════════════════════════════════════════════════╝"
 echo ""
 echo "Run: python scripts/orchestrator.py"
@@ -0,0 +1,156 @@
+"""
+IGRIS Client-Side Stop Detection
+
+Watches a streamed answer and decides when it is finished, so the stream can
+be closed early instead of letting llama-server run to n_predict:
+
+- code-only answers that open with a ``` fence stop at the closing fence
+- user-defined stop patterns (regular expressions)
+- repetition loops (the same lines or the same short span over and over);
+  inside an open code fence much longer repeats are needed, since table
+  literals, repeated test cases and identical rows are legitimate there
+"""
+
+import re
+from typing import Iterable, List, Optional
+
+# Regex stop patterns are searched this far back from the newest text, so a
+# match split across tokens is still found without rescanning everything
+PATTERN_LOOKBACK = 256
+
+# Line loops: the last block of 1..MAX_LOOP_LINES lines repeated LINE_REPEATS
+# times, where the block has at least MIN_LOOP_CHARS non-blank characters
+MAX_LOOP_LINES = 8
+LINE_REPEATS = 5
+MIN_LOOP_CHARS = 16
+
+# Span loops without newlines ("the the the ..."): a unit of up to
+# MAX_SPAN_PERIOD chars repeated to cover at least SPAN_REPEAT_CHARS
+MAX_SPAN_PERIOD = 64
+SPAN_REPEAT_CHARS = 200
+SPAN_CHECK_EVERY = 8  # tokens
+
+# The same limits inside an open ``` block
+FENCED_LINE_REPEATS = 40
+FENCED_SPAN_REPEAT_CHARS = 2000
+
+FENCE = "```"
+
+
+class StopDetector:
+    """
+    Incremental end-of-answer detector for one stream.
+
+    Feed each token with feed(); once it returns True the stream should be
+    closed and output() gives the answer trimmed at the stop point.
+    """
+
+    def __init__(
+        self,
+        patterns: Iterable[str] = (),
+        code_only: bool = False,
+        detect_loops: bool = True,
+    ) -> None:
+        self.patterns = [re.compile(p) for p in patterns]
+        self.code_only = code_only
+        self.detect_loops = detect_loops
+        self.text = ""
+        self.reason: Optional[str] = None
+        self.cut: Optional[int] = None
+        self._tokens = 0
+        self._in_fence = False  # Whether the complete lines so far leave a ``` block open
+        self._scanned = 0  # Start of the first line not yet checked for a fence
+
+    def feed(self, token: str) -> bool:
+        """Add a streamed token. Returns True once generation should stop."""
+        if self.reason:
+            return True
+        prev_len = len(self.text)
+        self.text += token
+        self._tokens += 1
+
+        if self.code_only:
+            self._check_fence(prev_len)
+        if not self.reason and self.patterns:
+            self._check_patterns(prev_len)
+        if not self.reason and self.detect_loops:
+            if "\n" in token:
+                self._track_fences()
+                self._check_line_loop()
+            if not self.reason and self._tokens % SPAN_CHECK_EVERY == 0:
+                self._check_span_loop()
+        return self.reason is not None
+
+    def output(self) -> str:
+        """The answer so far, trimmed at the stop point if one was found."""
+        return self.text if self.cut is None else self.text[:self.cut]
+
+    def kept(self, token: str) -> str:
+        """The part of the last fed token that falls before the stop point."""
+        if self.cut is None:
+            return token
+        start = len(self.text) - len(token)
+        return token[:max(0, self.cut - start)]
+
+    def _stop(self, reason: str, cut: int) -> None:
+        self.reason = reason
+        self.cut = cut
+
+    def _check_fence(self, prev_len: int) -> None:
+        body_start = len(self.text) - len(self.text.lstrip())
+        if not self.text.startswith(FENCE, body_start):
+            return
+        open_end = self.text.find("\n", body_start)
+        if open_end < 0:
+            return  # Opening fence line not finished yet
+        # Markdown fences don't nest: the next fence line closes the block
+        close = self.text.find("\n" + FENCE, max(open_end, prev_len - len(FENCE) - 1))
+        if close >= 0:
+            self._stop("CODE_FENCE", close + 1 + len(FENCE))
+
+    def _check_patterns(self, prev_len: int) -> None:
+        pos = max(0, prev_len - PATTERN_LOOKBACK)
+        for pattern in self.patterns:
+            match = pattern.search(self.text, pos)
+            if match:
+                self._stop("STOP_PATTERN", match.start())
+                return
+
+    def _track_fences(self) -> None:
+        end = self.text.rfind("\n") + 1
+        for line in self.text[self._scanned:end].split("\n"):
+            if line.lstrip().startswith(FENCE):
+                self._in_fence = not self._in_fence
+        self._scanned = end
+
+    def _check_line_loop(self) -> None:
+        needed = FENCED_LINE_REPEATS if self._in_fence else LINE_REPEATS
+        *lines, partial = self.text.rsplit("\n", MAX_LOOP_LINES * needed)
+        for size in range(1, MAX_LOOP_LINES + 1):
+            if len(lines) < size * needed:
+                break
+            block = lines[-size:]
+            if sum(len(line.strip()) for line in block) < MIN_LOOP_CHARS:
+                continue
+            if lines[-size * needed:] == block * needed:
+                # Keep the first occurrence of the block, drop the repeats
+                repeats: List[str] = lines[-size * (needed - 1):]
+                dropped = sum(len(line) + 1 for line in repeats) + len(partial)
+                self._stop("REPETITION", len(self.text) - dropped)
+                return
+
+    def _check_span_loop(self) -> None:
+        text = self.text
+        needed = FENCED_SPAN_REPEAT_CHARS if self._in_fence else SPAN_REPEAT_CHARS
+        if len(text) < needed:
+            return
+        for period in range(1, MAX_SPAN_PERIOD + 1):
+            unit = text[-period:]
+            repeats = -(-needed // period)  # ceil
+            if text.endswith(unit * repeats):
+                # Walk back to where the loop began and keep one unit of it
+                start = len(text) - period * repeats
+                while start >= period and text[start - period:start] == unit:
+                    start -= period
+                self._stop("REPETITION", start + period)
+                return
@@ -0,0 +1,358 @@
+"""
+IGRIS Backend Supervisor
+
+Runs llama-server processes on demand instead of keeping every model resident:
+
+- a backend is started by the first request routed to it
+- after idle_unload seconds without requests it is stopped, freeing its RAM
+- a backend that crashes is restarted; after MAX_RESTARTS crashes within
+  RESTART_WINDOW it is left down until the next request asks for it
+- CPU threads are split between running backends by cpu_weight, so two busy
+  models don't oversubscribe the cores; when one stops, the others are
+  restarted with their larger share once idle
+
+Only models with a model_path are managed, on their primary url. Replicas and
+models without a model_path are expected to be started externally (e.g. by
+start_igris.sh).
+"""
+
+import atexit
+import os
+import shlex
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+
+try:
+    from .base import MODELS, ROOT, CancelToken, ModelConfig, _http, endpoint_pool, set_supervisor
+    from .logger import LOG_DIR, log_system_event
+except ImportError:
+    from base import MODELS, ROOT, CancelToken, ModelConfig, _http, endpoint_pool, set_supervisor
+    from logger import LOG_DIR, log_system_event
+
+# Server command when LLAMA_SERVER isn't set (read at start-up, so .env can set
+# it); either may include arguments (e.g. "python scripts/mock_server.py")
+DEFAULT_LLAMA_SERVER = str(ROOT / "llama.cpp/build/bin/llama-server")
+
+START_TIMEOUT = 180.0  # Loading a 7B model from a cold disk is slow
+STOP_TIMEOUT = 10.0
+HEALTH_POLL = 0.1
+MONITOR_INTERVAL = 1.0
+MAX_RESTARTS = 3
+RESTART_WINDOW = 60.0
+
+# Backend states
+STOPPED = "stopped"
+STARTING = "starting"
+READY = "ready"
+FAILED = "failed"
+
+
+def _launch_key(cfg: ModelConfig) -> tuple:
+    """The settings a running server was started with; a change needs a restart."""
+    return (cfg.url, cfg.model_path, cfg.ctx_size, tuple(cfg.server_args))
+
+
+class Backend:
+    """One managed llama-server process."""
+
+    def __init__(self, model: str) -> None:
+        self.model = model
+        self.proc: Optional[subprocess.Popen] = None
+        self.state = STOPPED
+        self.threads = 0
+        self.launched: Optional[tuple] = None  # _launch_key() of the running process
+        self.spawned = 0.0
+        self.last_used = 0.0
+        self.crashes: List[float] = []
+        self.resize_to: Optional[int] = None  # New thread count once another backend starts or stops
+        self.lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self.state in (STARTING, READY)
+
+    def exited(self) -> bool:
+        return self.proc is not None and self.proc.poll() is not None
+
+
+class Supervisor:
+    """Starts, watches and stops llama-server processes for MODELS."""
+
+    def __init__(
+        self,
+        command: Optional[List[str]] = None,
+        cores: Optional[int] = None,
+        start_timeout: float = START_TIMEOUT,
+        interval: float = MONITOR_INTERVAL,
+    ) -> None:
+        self.command = command or shlex.split(os.environ.get("LLAMA_SERVER", DEFAULT_LLAMA_SERVER))
+        self.cores = cores or os.cpu_count() or 1
+        self.start_timeout = start_timeout
+        self.interval = interval
+        self._backends: Dict[str, Backend] = {}
+        self._lock = threading.Lock()  # Guards _backends and thread allocation
+        self._stop_event = threading.Event()
+        self._monitor: Optional[threading.Thread] = None
+
+    def manages(self, model_name: str) -> bool:
+        cfg = MODELS.get(model_name)
+        return cfg is not None and bool(cfg.model_path)
+
+    def backend(self, model_name: str) -> Backend:
+        with self._lock:
+            return self._backends.setdefault(model_name, Backend(model_name))
+
+    def is_unloaded(self, url: str) -> bool:
+        """True if url is a managed backend that is stopped or still loading."""
+        for name, cfg in list(MODELS.items()):
+            if cfg.url == url and self.manages(name):
+                backend = self._backends.get(name)
+                return backend is None or backend.state != READY
+        return False
+
+    def ensure(self, model_name: str, cancel: Optional[CancelToken] = None) -> bool:
+        """
+        Make sure the model's server is up, starting it if needed.
+
+        Blocks while it loads. Returns False if it fails to come up or cancel
+        fires first (a load in progress carries on for the next request).
+        """
+        if not self.manages(model_name):
+            return True
+        backend = self.backend(model_name)
+        backend.last_used = time.monotonic()
+        if backend.state == READY and not backend.exited():
+            return True
+        while not backend.lock.acquire(timeout=HEALTH_POLL):
+            if cancel is not None and cancel.cancelled:
+                return False
+        try:
+            if backend.running and backend.exited():
+                self._crashed(backend)
+            if not backend.running:
+                self._spawn(backend)
+            return self._wait_ready(backend, cancel)
+        finally:
+            backend.lock.release()
+
+    # -- process control (callers hold backend.lock) --
+
+    def _spawn(self, backend: Backend, threads: Optional[int] = None) -> None:
+        cfg = MODELS[backend.model]
+        parts = urlsplit(cfg.url)
+        threads = threads or self._allocate(backend)
+        cmd = self.command + [
+            "-m", str(ROOT / cfg.model_path),
+            "--host", parts.hostname or "127.0.0.1",
+            "--port", str(parts.port or 80),
+            "-c", str(cfg.ctx_size),
+            "-t", str(threads),
+            *cfg.server_args,
+        ]
+        LOG_DIR.mkdir(exist_ok=True)
+        with open(LOG_DIR / f"{backend.model}-server.log", "ab") as log:
+            backend.proc = subprocess.Popen(cmd, stdout=log, stderr=subprocess.STDOUT, cwd=ROOT)
+        backend.state = STARTING
+        backend.threads = threads
+        backend.resize_to = None
+        backend.launched = _launch_key(cfg)
+        backend.spawned = time.monotonic()
+        log_system_event("BACKEND_START", {
+            "model": backend.model, "pid": backend.proc.pid, "threads": threads,
+        })
+
+    def _healthy(self, backend: Backend) -> bool:
+        health_url = MODELS[backend.model].url.rsplit("/", 1)[0] + "/health"
+        try:
+            return _http.get(health_url, timeout=1).status_code == 200
+        except requests.RequestException:
+            return False
+
+    def _mark_ready(self, backend: Backend) -> None:
+        backend.state = READY
+        backend.last_used = time.monotonic()
+        # Clears any breaker failures recorded while it was down
+        endpoint_pool(backend.model).report_health(MODELS[backend.model].url, True)
+        log_system_event("BACKEND_READY", {
+            "model": backend.model,
+            "load_ms": round((time.monotonic() - backend.spawned) * 1000, 2),
+        })
+
+    def _wait_ready(self, backend: Backend, cancel: Optional[CancelToken]) -> bool:
+        if backend.state == READY:
+            return True
+        while time.monotonic() - backend.spawned < self.start_timeout:
+            if backend.exited():
+                self._crashed(backend)
+                return False
+            if self._healthy(backend):
+                self._mark_ready(backend)
+                return True
+            if cancel is not None and cancel.cancelled:
+                return False
+            time.sleep(HEALTH_POLL)
+        log_system_event("BACKEND_START_TIMEOUT", {"model": backend.model})
+        self._terminate(backend, FAILED)
+        return False
+
+    def _terminate(self, backend: Backend, state: str = STOPPED) -> None:
+        proc = backend.proc
+        if proc is not None and proc.poll() is None:
+            proc.terminate()
+            try:
+                proc.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+                proc.wait()
+        backend.proc = None
+        backend.state = state
+        backend.threads = 0
+
+    def _crashed(self, backend: Backend) -> bool:
+        """Record an unexpected exit. Returns True if it may be restarted."""
+        now = time.monotonic()
+        code = backend.proc.returncode if backend.proc else None
+        backend.crashes = [t for t in backend.crashes if now - t < RESTART_WINDOW] + [now]
+        backend.proc = None
+        backend.threads = 0
+        retry = len(backend.crashes) <= MAX_RESTARTS
+        backend.state = STOPPED if retry else FAILED
+        log_system_event("BACKEND_CRASH", {
+            "model": backend.model, "exit_code": code, "restarting": retry,
+        })
+        if not retry:
+            self._rebalance()
+        return retry
+
+    def _shares(self, active: List[Backend]) -> Dict[str, int]:
+        """Threads per model, splitting the cores by cpu_weight. Callers hold self._lock."""
+        weights = {b.model: MODELS[b.model].cpu_weight for b in active if b.model in MODELS}
+        total = sum(weights.values())
+        return {m: max(1, int(self.cores * w / total)) for m, w in weights.items()}
+
+    def _allocate(self, starting: Backend) -> int:
+        """
+        Threads for a backend about to start, splitting the cores by cpu_weight
+        among running backends. Running ones that now hold more than their
+        share are resized (restarted) when next idle.
+        """
+        with self._lock:
+            active = [b for b in self._backends.values() if b.running and b is not starting]
+            active.append(starting)
+            shares = self._shares(active)
+            for b in active:
+                if b is not starting and b.threads > shares.get(b.model, b.threads):
+                    b.resize_to = shares[b.model]
+        return shares[starting.model]
+
+    def _rebalance(self) -> None:
+        """After a backend stops, mark the running ones whose share changed for a resize."""
+        with self._lock:
+            active = [b for b in self._backends.values() if b.running]
+            shares = self._shares(active)
+            for b in active:
+                share = shares.get(b.model)
+                if share and b.threads:
+                    b.resize_to = share if share != b.threads else None
+
+    # -- background monitor --
+
+    def _check(self, backend: Backend) -> None:
+        now = time.monotonic()
+        cfg = MODELS.get(backend.model)
+        if not backend.lock.acquire(blocking=False):
+            return  # A request is starting it
+        try:
+            if not backend.running:
+                return
+            if cfg is None or not cfg.model_path:
+                self._terminate(backend)  # Removed from the registry
+                log_system_event("BACKEND_UNLOAD", {"model": backend.model, "reason": "unmanaged"})
+                self._rebalance()
+                return
+            if backend.exited():
+                if self._crashed(backend):
+                    self._spawn(backend)
+                return
+            if backend.state == STARTING:
+                if self._healthy(backend):
+                    self._mark_ready(backend)
+                elif now - backend.spawned > self.start_timeout:
+                    log_system_event("BACKEND_START_TIMEOUT", {"model": backend.model})
+                    self._terminate(backend, FAILED)
+                    self._rebalance()
+                return
+
+            ep = next((e for e in endpoint_pool(backend.model).endpoints() if e.url == cfg.url), None)
+            if ep is not None and ep.outstanding:
+                backend.last_used = now
+                return
+            if now - backend.last_used > cfg.idle_unload:
+                self._terminate(backend)
+                log_system_event("BACKEND_UNLOAD", {"model": backend.model, "reason": "idle"})
+                self._rebalance()
+            elif backend.launched != _launch_key(cfg):
+                # Config changed (e.g. a different quantization): reload while idle
+                self._terminate(backend)
+                self._spawn(backend)
+                log_system_event("BACKEND_RESTART", {"model": backend.model, "reason": "config"})
+            elif backend.resize_to:
+                threads = backend.resize_to
+                self._terminate(backend)
+                self._spawn(backend, threads)
+                log_system_event("BACKEND_RESTART", {"model": backend.model, "reason": "threads"})
+        finally:
+            backend.lock.release()
+
+    def _run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            with self._lock:
+                backends = list(self._backends.values())
+            for backend in backends:
+                self._check(backend)
+
+    def start(self) -> "Supervisor":
+        """Start the monitor thread and route base.py requests through this supervisor."""
+        self._monitor = threading.Thread(target=self._run, name="igris-supervisor", daemon=True)
+        self._monitor.start()
+        set_supervisor(self)
+        atexit.register(self.shutdown)
+        return self
+
+    def shutdown(self) -> None:
+        """Stop the monitor and every backend."""
+        set_supervisor(None)
+        self._stop_event.set()
+        with self._lock:
+            backends = list(self._backends.values())
+        for backend in backends:
+            with backend.lock:
+                self._terminate(backend)
+
+    def status(self) -> Dict[str, dict]:
+        """Per-model backend state for /status."""
+        now = time.monotonic()
+        with self._lock:
+            backends = list(self._backends.values())
+        return {
+            b.model: {
+                "state": b.state,
+                "pid": b.proc.pid if b.proc else None,
+                "threads": b.threads,
+                "idle_s": round(now - b.last_used, 1) if b.running else None,
+            }
+            for b in backends
+        }
+
+
+def start_from_env() -> Optional[Supervisor]:
+    """Start a supervisor if IGRIS_SUPERVISE is set (IGRIS_THREADS caps the cores used)."""
+    if os.environ.get("IGRIS_SUPERVISE", "").lower() not in ("1", "true", "yes"):
+        return None
+    cores = os.environ.get("IGRIS_THREADS", "")
+    return Supervisor(cores=int(cores) if cores.isdigit() else None).start()
@@ -0,0 +1,413 @@
+"""
+IGRIS Tool Calling
+
+Lets qwen and deepseek call local Python functions. The models are told about
+the registered tools in their system prompt (tool_instructions()) and ask for
+them with Qwen-style blocks, holding one call or a list of calls:
+
+    <tool_call>
+    {"name": "calculate", "arguments": {"expression": "2**16"}}
+    </tool_call>
+
+Tool-enabled requests stop at TOOL_CALL_END, so the model can't go on to
+invent the results itself. All calls from one block run concurrently: in a
+thread pool, or a process pool for tools registered with process=True. Each call has its own
+timeout. Results of pure tools are memoized. Results go back as
+<tool_response> blocks appended after the turn's output to the prompt that
+produced it, so the prefix the server already holds in its KV cache is
+unchanged and only the new tokens are evaluated. The model then continues,
+for up to MAX_ROUNDS rounds of calls.
+
+Register a tool with the @tool decorator; its signature and the first line
+of its docstring are what the model sees.
+"""
+
+import ast
+import fnmatch
+import inspect
+import json
+import math
+import operator
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from .base import ROOT
+except ImportError:
+    from base import ROOT
+
+MAX_WORKERS = 8
+MAX_ROUNDS = 3  # Rounds of tool calls per request
+DEFAULT_TIMEOUT = 5.0
+RESULT_CHARS = 2000  # Longer results are cut, keeping prompts small
+MEMO_SIZE = 256
+TOOL_CALL_END = "</tool_call>"  # Server-side stop sequence for tool-enabled requests
+
+# A block may be left unclosed when generation stops right after it
+_CALL_PATTERN = re.compile(r"<tool_call>\s*(.*?)\s*(?:</tool_call>|$)", re.DOTALL)
+
+Runner = Callable[[str, str, Callable[[str], None]], dict]
+
+
+@dataclass
+class Tool:
+    name: str
+    func: Callable[..., Any]
+    description: str
+    timeout: float = DEFAULT_TIMEOUT
+    pure: bool = False  # Same arguments always give the same result
+    process: bool = False  # CPU-bound; run in a worker process
+
+    def signature(self) -> str:
+        return f"{self.name}{inspect.signature(self.func)}"
+
+
+@dataclass
+class ToolCall:
+    name: str
+    arguments: Dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None  # Set when the block couldn't be parsed
+
+
+@dataclass
+class ToolResult:
+    name: str
+    content: str
+    ok: bool = True
+    ms: float = 0.0
+    cached: bool = False
+
+
+TOOLS: Dict[str, Tool] = {}
+
+
+def tool(
+    name: Optional[str] = None,
+    timeout: float = DEFAULT_TIMEOUT,
+    pure: bool = False,
+    process: bool = False,
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Register a function as a tool the models can call."""
+    def register(func: Callable[..., Any]) -> Callable[..., Any]:
+        doc = (func.__doc__ or "").strip().splitlines()
+        TOOLS[name or func.__name__] = Tool(
+            name=name or func.__name__,
+            func=func,
+            description=doc[0] if doc else "",
+            timeout=timeout,
+            pure=pure,
+            process=process,
+        )
+        return func
+    return register
+
+
+def tool_instructions() -> str:
+    """System prompt section describing the tools; stable order keeps the prefix cacheable."""
+    lines = [
+        "# Tools",
+        "You can call local tools. To call one, output a block like:",
+        "<tool_call>",
+        '{"name": "calculate", "arguments": {"expression": "2**16"}}',
+        TOOL_CALL_END,
+        "To run several in parallel, put a JSON list of calls in one block. Results "
+        "come back in <tool_response> blocks. Only call tools when they help.",
+        "",
+    ]
+    lines += [f"- {t.signature()}: {t.description}" for _, t in sorted(TOOLS.items())]
+    return "\n".join(lines)
+
+
+def parse_tool_calls(text: str) -> List[ToolCall]:
+    """Tool calls in a model's output, in order."""
+    calls = []
+    for match in _CALL_PATTERN.finditer(text):
+        body = match.group(1)
+        if not body:
+            continue
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            calls.append(ToolCall("?", error=f"malformed tool call: {e}"))
+            continue
+        for item in data if isinstance(data, list) else [data]:
+            try:
+                arguments = item.get("arguments", {})
+                if isinstance(arguments, str):  # Some models encode arguments twice
+                    arguments = json.loads(arguments)
+                if not isinstance(item.get("name"), str) or not isinstance(arguments, dict):
+                    raise ValueError("expected {\"name\": ..., \"arguments\": {...}}")
+                calls.append(ToolCall(item["name"], arguments))
+            except (ValueError, AttributeError) as e:
+                calls.append(ToolCall("?", error=f"malformed tool call: {e}"))
+    return calls
+
+
+# -- execution --
+
+_threads = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="igris-tool")
+_processes: Optional[ProcessPoolExecutor] = None
+_pools_lock = threading.Lock()
+
+_memo: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+
+def _process_pool() -> ProcessPoolExecutor:
+    global _processes
+    with _pools_lock:
+        if _processes is None:
+            _processes = ProcessPoolExecutor(max_workers=min(MAX_WORKERS, 4))
+        return _processes
+
+
+def _invoke(func: Callable[..., Any], arguments: Dict[str, Any]) -> str:
+    value = func(**arguments)
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str)
+    return value
+
+
+def _memo_key(call: ToolCall) -> Tuple[str, str]:
+    return call.name, json.dumps(call.arguments, sort_keys=True, default=str)
+
+
+def clear_memo() -> int:
+    with _memo_lock:
+        count = len(_memo)
+        _memo.clear()
+        return count
+
+
+def execute(calls: List[ToolCall]) -> List[ToolResult]:
+    """
+    Run tool calls concurrently; results come back in call order. Identical
+    calls in one batch run once, and pure tools' results are memoized.
+    """
+    start = time.perf_counter()
+    results: List[Optional[ToolResult]] = [None] * len(calls)
+    running: Dict[Tuple[str, str], Tuple[Future, float]] = {}
+    for i, call in enumerate(calls):
+        t = TOOLS.get(call.name)
+        if call.error or t is None:
+            results[i] = ToolResult(call.name, call.error or f"unknown tool: {call.name}", ok=False)
+            continue
+        try:
+            inspect.signature(t.func).bind(**call.arguments)
+        except TypeError as e:
+            results[i] = ToolResult(call.name, f"bad arguments: {e}", ok=False)
+            continue
+        key = _memo_key(call)
+        if t.pure:
+            with _memo_lock:
+                if key in _memo:
+                    _memo.move_to_end(key)
+                    results[i] = ToolResult(call.name, _memo[key], cached=True)
+                    continue
+        if key not in running:
+            pool = _process_pool() if t.process else _threads
+            running[key] = (pool.submit(_invoke, t.func, call.arguments), start + t.timeout)
+
+    for i, call in enumerate(calls):
+        if results[i] is not None:
+            continue
+        t = TOOLS[call.name]
+        future, deadline = running[_memo_key(call)]
+        try:
+            content = future.result(timeout=max(0.0, deadline - time.perf_counter()))
+        except FutureTimeout:  # Not the builtin TimeoutError before Python 3.11
+            future.cancel()  # Only helps if it hasn't started; running tools can't be stopped
+            result = ToolResult(call.name, f"timed out after {t.timeout:g}s", ok=False)
+        except Exception as e:
+            result = ToolResult(call.name, f"{type(e).__name__}: {e}", ok=False)
+        else:
+            if t.pure:
+                with _memo_lock:
+                    _memo[_memo_key(call)] = content
+                    while len(_memo) > MEMO_SIZE:
+                        _memo.popitem(last=False)
+            result = ToolResult(call.name, content)
+        result.ms = round((time.perf_counter() - start) * 1000, 2)
+        results[i] = result
+    return [r for r in results if r is not None]
+
+
+def format_results(model: str, results: List[ToolResult]) -> str:
+    """Results as a continuation of the model's turn (Qwen's tool message format for qwen)."""
+    blocks = "\n".join(
+        "<tool_response>\n"
+        + json.dumps({"name": r.name, "content": r.content[:RESULT_CHARS]}, ensure_ascii=False)
+        + "\n</tool_response>"
+        for r in results
+    )
+    if model == "qwen":
+        return f"<|im_end|>\n<|im_start|>user\n{blocks}<|im_end|>\n<|im_start|>assistant\n"
+    return f"\n{blocks}\n"
+
+
+def run_with_tools(
+    model: str,
+    prompt: str,
+    generate: Callable[[str, str], dict],
+    max_rounds: int = MAX_ROUNDS,
+) -> dict:
+    """
+    Generate, run any tool calls in the output, and continue with their
+    results. generate(model, prompt) returns a run_model_streaming()-style
+    dict. The final dict lists the calls made under "tool_calls", its latency
+    covers every round, and it is only "cacheable" if every tool involved was pure.
+    """
+    start = time.perf_counter()
+    calls_made: List[dict] = []
+    cacheable = True
+    result = generate(model, prompt)
+    for _ in range(max_rounds):
+        if result["error"]:
+            break
+        calls = parse_tool_calls(result["output"])
+        if not calls:
+            break
+        results = execute(calls)
+        for call, res in zip(calls, results, strict=True):
+            t = TOOLS.get(call.name)
+            cacheable = cacheable and res.ok and t is not None and t.pure
+            calls_made.append({"name": res.name, "ok": res.ok, "ms": res.ms, "cached": res.cached})
+        model = result["model"]  # A hedged request may have been answered by the fallback
+        output = result["output"]
+        if output.rfind("<tool_call>") > output.rfind(TOOL_CALL_END):
+            output += "\n" + TOOL_CALL_END  # The stop sequence isn't part of the output
+        prompt = prompt + output + format_results(model, results)
+        result = generate(model, prompt)
+    if calls_made and result.get("latency_ms") is not None:
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)  # All rounds
+    return {**result, "tool_calls": calls_made, "cacheable": cacheable}
+
+
+def with_tools(first: Runner, follow_up: Optional[Runner] = None) -> Runner:
+    """
+    Wrap a run_model_coalesced() runner so tool calls are executed. The first
+    generation uses `first`; continuations use `follow_up` (default: first).
+    """
+    def run(model: str, prompt: str, on_token: Callable[[str], None]) -> dict:
+        rounds = [0]
+
+        def generate(model_name: str, text: str) -> dict:
+            runner = first if rounds[0] == 0 or follow_up is None else follow_up
+            rounds[0] += 1
+            return runner(model_name, text, on_token)
+        return run_with_tools(model, prompt, generate)
+    return run
+
+
+# -- built-in tools --
+
+_OPERATORS: Dict[type, Callable[..., float]] = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    ast.Div: operator.truediv, ast.FloorDiv: operator.floordiv, ast.Mod: operator.mod,
+    ast.Pow: operator.pow, ast.USub: operator.neg, ast.UAdd: operator.pos,
+}
+_MATH: Dict[str, Callable[..., float]] = {name: getattr(math, name) for name in (
+    "sqrt", "log", "log10", "log2", "exp", "sin", "cos", "tan", "floor", "ceil", "factorial")}
+_CONSTANTS = {"pi": math.pi, "e": math.e}
+# Integer operands and results are kept below this many bits, so no expression
+# (a huge power, factorial(10**7)) can pin a worker thread past its deadline
+MAX_INT_BITS = 4096
+MAX_FACTORIAL = 1000
+
+
+def _bounded(value: float) -> float:
+    if isinstance(value, int) and value.bit_length() > MAX_INT_BITS:
+        raise ValueError("number too large")
+    return value
+
+
+def _evaluate(node: ast.AST) -> float:
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return _bounded(node.value)
+    if isinstance(node, ast.Name) and node.id in _CONSTANTS:
+        return _CONSTANTS[node.id]
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_evaluate(node.operand))
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        left, right = _evaluate(node.left), _evaluate(node.right)
+        if isinstance(node.op, ast.Pow) and abs(left) > 1 and \
+                abs(right) * math.log2(abs(left)) > MAX_INT_BITS:
+            raise ValueError("number too large")
+        return _bounded(_OPERATORS[type(node.op)](left, right))
+    if (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in _MATH and not node.keywords):
+        args = [_evaluate(arg) for arg in node.args]
+        if node.func.id == "factorial" and args and abs(args[0]) > MAX_FACTORIAL:
+            raise ValueError("number too large")
+        return _bounded(_MATH[node.func.id](*args))
+    raise ValueError(f"unsupported expression: {ast.unparse(node)}")
+
+
+@tool(pure=True)
+def calculate(expression: str) -> float:
+    """Evaluate an arithmetic expression (+ - * / // % **, sqrt, log, sin, pi, ...)."""
+    return _evaluate(ast.parse(expression, mode="eval").body)
+
+
+# Paths the file tools refuse: secrets and credentials, matched against each path part
+DENIED_FILES = (".env", ".env.*", "*.pem", "*.key", "id_rsa*", "id_ed25519*", "*.p12",
+                "credentials*", ".git", ".ssh", ".netrc")
+MAX_READ_BYTES = 256 * 1024
+
+
+def _denied(name: str) -> bool:
+    return any(fnmatch.fnmatch(name, pattern) for pattern in DENIED_FILES)
+
+
+def _project_path(path: str) -> Path:
+    """A project path the tools may touch; raises for anything outside or denied."""
+    resolved = (ROOT / path).resolve()
+    if resolved != ROOT.resolve() and ROOT.resolve() not in resolved.parents:
+        raise ValueError("path is outside the project")
+    if any(_denied(part) for part in resolved.relative_to(ROOT.resolve()).parts):
+        raise PermissionError("access to this path is not allowed")
+    return resolved
+
+
+@tool()
+def read_file(path: str, start: int = 1, count: int = 60) -> str:
+    """Read lines of a project file, numbered (path relative to the project root)."""
+    with open(_project_path(path), "rb") as f:
+        data = f.read(MAX_READ_BYTES)  # Only the start of a huge file is read
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    chosen = lines[max(0, start - 1):max(0, start - 1) + count]
+    return "\n".join(f"{start + i}: {line}" for i, line in enumerate(chosen))
+
+
+@tool()
+def list_files(path: str = ".") -> List[str]:
+    """List a project directory (subdirectories end with /)."""
+    directory = _project_path(path)
+    return sorted(p.name + ("/" if p.is_dir() else "") for p in directory.iterdir()
+                  if not p.name.startswith(".") and not _denied(p.name))
+
+
+@tool()
+def search_docs(query: str) -> str:
+    """Search the local document index for relevant snippets."""
+    try:
+        from .vectors import retrieve
+        from .rag import format_context
+    except ImportError:
+        from vectors import retrieve
+        from rag import format_context
+    return format_context(retrieve(query)) or "no matches"
+
+
+@tool()
+def current_time() -> str:
+    """The local date and time."""
+    return datetime.now().isoformat(timespec="seconds")
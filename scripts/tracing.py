@@ -0,0 +1,163 @@
+"""
+IGRIS Tracing
+
+Span tracing for finding where a turn's time goes: routing, prompt building,
+cache lookup, scheduler queue, backend start, connect, TTFT, generation,
+rendering and logging. Spans are recorded on every thread and exported as
+Chrome trace-event JSON, viewable as a flame chart in chrome://tracing or
+https://ui.perfetto.dev.
+
+Each turn runs under its own trace id (trace()), which every span records in
+its args. Threads working for the turn (hedged attempts) take it on with
+bind(), so a turn's breakdown leaves out spans from background
+threads such as the health monitor.
+
+Tracing is off by default. While off, span() returns a shared no-op context
+manager and record() returns immediately, so instrumented code pays one
+attribute check. /profile in the REPL turns it on (see orchestrator.py).
+"""
+
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import ContextManager, Deque, Dict, Iterator, List, Optional, Tuple
+
+MAX_EVENTS = 100_000  # Oldest events are dropped past this
+
+_NULL = nullcontext()
+_EPOCH = time.perf_counter()
+
+
+def _us(t: float) -> float:
+    return round((t - _EPOCH) * 1e6, 1)
+
+
+class Tracer:
+    """Collects complete ("X") and instant ("i") trace events."""
+
+    def __init__(self, max_events: int = MAX_EVENTS) -> None:
+        self.enabled = False
+        self._events: Deque[dict] = deque(maxlen=max_events)
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def disable(self) -> None:
+        self.enabled = False
+
+    def current(self) -> Optional[int]:
+        """The trace id bound to this thread, if any."""
+        return getattr(self._local, "trace", None)
+
+    def trace(self) -> ContextManager[None]:
+        """Run the block under a new trace id on this thread."""
+        if not self.enabled:
+            return _NULL
+        return self._trace(next(self._ids))
+
+    def bind(self, trace_id: Optional[int]) -> ContextManager[None]:
+        """Run the block under another thread's trace id (from current()); None does nothing."""
+        if trace_id is None:
+            return _NULL
+        return self._trace(trace_id)
+
+    @contextmanager
+    def _trace(self, trace_id: int) -> Iterator[None]:
+        previous = self.current()
+        self._local.trace = trace_id
+        try:
+            yield
+        finally:
+            self._local.trace = previous
+
+    def span(self, name: str, **args: object) -> ContextManager[None]:
+        """Time the enclosed block as a span named `name`."""
+        if not self.enabled:
+            return _NULL
+        return self._span(name, args)
+
+    @contextmanager
+    def _span(self, name: str, args: dict) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, **args)
+
+    def record(self, name: str, start: float, end: Optional[float] = None, **args: object) -> None:
+        """Add a span from perf_counter() times already measured; end defaults to now."""
+        if not self.enabled:
+            return
+        end = time.perf_counter() if end is None else end
+        self._add({"name": name, "ph": "X", "ts": _us(start),
+                   "dur": round((end - start) * 1e6, 1), "args": args})
+
+    def instant(self, name: str, **args: object) -> None:
+        if not self.enabled:
+            return
+        self._add({"name": name, "ph": "i", "s": "t", "ts": _us(time.perf_counter()), "args": args})
+
+    def _add(self, event: dict) -> None:
+        thread = threading.current_thread()
+        trace_id = self.current()
+        if trace_id is not None:
+            event["args"]["trace"] = trace_id
+        event["pid"] = os.getpid()
+        event["tid"] = thread.ident
+        with self._lock:
+            self._threads.setdefault(thread.ident or 0, thread.name)
+            self._events.append(event)
+
+    def events(self) -> List[dict]:
+        with self._lock:
+            return list(self._events)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._events.clear()
+            self._threads.clear()
+
+    def export_chrome(self, path: Path) -> Path:
+        """Write the collected events as Chrome trace-event JSON."""
+        with self._lock:
+            events = list(self._events)
+            names = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                      "args": {"name": name}} for tid, name in self._threads.items()]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"traceEvents": names + events, "displayTimeUnit": "ms"}))
+        return path
+
+    def breakdown(self, root: str = "turn") -> List[Tuple[str, float]]:
+        """
+        (name, ms) for the last `root` span and every span of the same trace
+        (the same thread, for a root recorded outside one) that started within
+        it, in start order. Empty if no such span was recorded.
+        """
+        events = self.events()
+        roots = [e for e in events if e["ph"] == "X" and e["name"] == root]
+        if not roots:
+            return []
+        turn = roots[-1]
+        end = turn["ts"] + turn["dur"]
+        by_thread = turn["args"].get("trace") is None
+
+        def request_of(e: dict) -> object:
+            return e["tid"] if by_thread else e["args"].get("trace")
+
+        inside = [e for e in events
+                  if e["ph"] == "X" and e is not turn and turn["ts"] <= e["ts"] <= end
+                  and request_of(e) == request_of(turn)]
+        inside.sort(key=lambda e: e["ts"])
+        return [(root, turn["dur"] / 1000)] + [(e["name"], e["dur"] / 1000) for e in inside]
+
+
+TRACER = Tracer()
@@ -0,0 +1,443 @@
+"""
+IGRIS Vector Retrieval
+
+Embedding search over the same chunks as the BM25 index (rag.py), for
+questions that paraphrase the docs instead of repeating their words.
+
+- build_vectors() embeds chunks in batches through the "embed" model's
+  llama-server /embedding endpoint. Vectors are stored L2-normalised in a
+  float16 matrix that is memory-mapped at query time. Chunks whose text
+  didn't change keep their previous vector.
+- VectorIndex.search() scores queries against the matrix with blocked NumPy
+  matrix products. From IVF_MIN_CHUNKS rows on, an IVF index is built as
+  well: spherical k-means centroids partition the rows and only the
+  IVF_NPROBE nearest partitions are scanned.
+- retrieve() fuses vector and BM25 rankings (reciprocal rank fusion) into
+  prompt context. Without NumPy, an embedding server or a vector index it is
+  plain BM25.
+
+NumPy is optional (pip install igris[rag]). Benchmark IVF against brute force
+with: python scripts/vectors.py bench
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import requests
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+try:
+    from .base import MODELS, endpoint_pool, get_supervisor, run_embedding
+    from .scheduler import BATCH
+    from .rag import (MIN_SCORE, TOP_K, CONTEXT_TOKENS, Hit, current_generation,
+                     default_index_dir, open_index, pack)
+except ImportError:
+    from base import MODELS, endpoint_pool, get_supervisor, run_embedding
+    from scheduler import BATCH
+    from rag import (MIN_SCORE, TOP_K, CONTEXT_TOKENS, Hit, current_generation,
+                    default_index_dir, open_index, pack)
+
+EMBED_MODEL = "embed"
+EMBED_BATCH = 32  # Chunks per /embedding request
+
+SEARCH_BLOCK = 32768  # Rows converted to float32 per step of a brute-force scan
+IVF_MIN_CHUNKS = 100_000
+IVF_NPROBE = 16
+IVF_ITERS = 10
+IVF_SAMPLE = 50_000  # Rows used to train the centroids
+
+MIN_SIMILARITY = 0.3  # Cosine similarity below which a chunk isn't relevant
+RRF_K = 60  # Reciprocal rank fusion constant
+
+
+def _normalize(x: "np.ndarray") -> "np.ndarray":
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return np.divide(x, np.maximum(norms, 1e-12))
+
+
+def _top_k(scores: "np.ndarray", k: int) -> "np.ndarray":
+    """Indices of the k largest scores along the last axis, best first."""
+    k = min(k, scores.shape[-1])
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, part, -1), axis=-1, kind="stable")
+    return np.take_along_axis(part, order, -1)
+
+
+# -- storage --
+
+def train_ivf(matrix: "np.ndarray", nlist: int, seed: int = 0) -> "np.ndarray":
+    """Spherical k-means centroids (float32, unit length) over a sample of rows."""
+    rng = np.random.default_rng(seed)
+    n = matrix.shape[0]
+    sample = np.sort(rng.choice(n, size=min(n, IVF_SAMPLE), replace=False))
+    data = np.asarray(matrix[sample], dtype=np.float32)
+    centroids: "np.ndarray" = data[rng.choice(len(data), size=nlist, replace=False)].copy()
+    for _ in range(IVF_ITERS):
+        assign = np.argmax(data @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        filled = np.bincount(assign, minlength=nlist) > 0
+        centroids[filled] = _normalize(sums[filled])  # Empty lists keep their centroid
+    return centroids
+
+
+def _assign(matrix: "np.ndarray", centroids: "np.ndarray") -> "np.ndarray":
+    out = np.empty(matrix.shape[0], dtype=np.int32)
+    for start in range(0, matrix.shape[0], SEARCH_BLOCK):
+        block = np.asarray(matrix[start:start + SEARCH_BLOCK], dtype=np.float32)
+        out[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return out
+
+
+def write_vectors(
+    vec_dir: Path,
+    matrix: "np.ndarray",
+    keys: List[str],
+    meta: dict,
+    ivf: Optional[bool] = None,
+) -> Path:
+    """
+    Store normalised vectors as a new generation and make it current.
+    ivf=None builds the IVF partitions only from IVF_MIN_CHUNKS rows on.
+    """
+    vec_dir.mkdir(parents=True, exist_ok=True)
+    gen = vec_dir / f"gen-{time.time_ns()}"
+    gen.mkdir()
+    n, dim = matrix.shape
+    stored = np.lib.format.open_memmap(gen / "matrix.npy", mode="w+", dtype=np.float16, shape=(n, dim))
+    stored[:] = matrix
+    stored.flush()
+
+    use_ivf = n >= IVF_MIN_CHUNKS if ivf is None else ivf and n > 0
+    if use_ivf:
+        nlist = max(1, min(n, int(math.sqrt(n))))
+        centroids = train_ivf(stored, nlist)
+        assign = _assign(stored, centroids)
+        np.save(gen / "ivf_centroids.npy", centroids.astype(np.float16))
+        np.save(gen / "ivf_ids.npy", np.argsort(assign, kind="stable").astype(np.int32))
+        np.save(gen / "ivf_offsets.npy",
+                np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]))
+    del stored
+
+    (gen / "meta.json").write_text(json.dumps({**meta, "dim": dim, "keys": keys, "ivf": use_ivf}))
+    tmp = vec_dir / "CURRENT.tmp"
+    tmp.write_text(gen.name)
+    os.replace(tmp, vec_dir / "CURRENT")
+    for old in vec_dir.glob("gen-*"):
+        if old != gen:
+            shutil.rmtree(old, ignore_errors=True)
+    return gen
+
+
+class VectorIndex:
+    """A read-only vector generation; rows line up with a BM25 generation's chunk ids."""
+
+    def __init__(self, gen: Path) -> None:
+        self.gen = gen
+        meta = json.loads((gen / "meta.json").read_text())
+        self.chunks_gen: Optional[str] = meta.get("chunks_gen")
+        self.embed_model: Optional[str] = meta.get("embed_model")
+        self.keys: List[str] = meta["keys"]
+        self.dim: int = meta["dim"]
+        self.matrix: "np.ndarray" = np.load(gen / "matrix.npy", mmap_mode="r")
+        self.ivf = meta["ivf"]
+        if self.ivf:
+            self.centroids = np.load(gen / "ivf_centroids.npy").astype(np.float32)
+            self.ids = np.load(gen / "ivf_ids.npy", mmap_mode="r")
+            self.offsets = np.load(gen / "ivf_offsets.npy")
+
+    def __len__(self) -> int:
+        return self.matrix.shape[0]
+
+    def search(
+        self,
+        queries: "np.ndarray",
+        k: int = TOP_K,
+        nprobe: int = IVF_NPROBE,
+        exact: bool = False,
+    ) -> Tuple["np.ndarray", "np.ndarray"]:
+        """
+        Top-k rows for each query vector (shape (m, dim) or (dim,)).
+        Returns (ids, similarities), each (m, k). Uses IVF when built unless exact.
+        """
+        q = _normalize(np.atleast_2d(np.asarray(queries, dtype=np.float32)))
+        if self.ivf and not exact:
+            results = [self._search_ivf(row, k, nprobe) for row in q]
+            return np.stack([r[0] for r in results]), np.stack([r[1] for r in results])
+        return self._search_brute(q, k)
+
+    def _search_brute(self, q: "np.ndarray", k: int) -> Tuple["np.ndarray", "np.ndarray"]:
+        best_ids = np.empty((len(q), 0), dtype=np.int64)
+        best_scores = np.empty((len(q), 0), dtype=np.float32)
+        for start in range(0, len(self), SEARCH_BLOCK):
+            block = np.asarray(self.matrix[start:start + SEARCH_BLOCK], dtype=np.float32)
+            scores = q @ block.T  # (m, block)
+            top = _top_k(scores, k)
+            best_ids = np.concatenate([best_ids, top + start], axis=1)
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, 1)], axis=1)
+            keep = _top_k(best_scores, k)
+            best_ids = np.take_along_axis(best_ids, keep, 1)
+            best_scores = np.take_along_axis(best_scores, keep, 1)
+        return best_ids, best_scores
+
+    def _search_ivf(self, q: "np.ndarray", k: int, nprobe: int) -> Tuple["np.ndarray", "np.ndarray"]:
+        probe = _top_k(self.centroids @ q, nprobe)
+        rows = np.concatenate([self.ids[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+        rows.sort()  # Ascending reads through the memory map
+        scores = np.asarray(self.matrix[rows], dtype=np.float32) @ q
+        top = _top_k(scores, k)
+        ids = np.full(k, -1, dtype=np.int64)
+        sims = np.full(k, -np.inf, dtype=np.float32)
+        ids[:len(top)] = rows[top]
+        sims[:len(top)] = scores[top]
+        return ids, sims
+
+
+_open_vectors: Optional[VectorIndex] = None
+_open_lock = threading.Lock()
+
+
+def open_vectors(index_dir: Optional[Path] = None) -> Optional[VectorIndex]:
+    """The current vector generation, or None if there is none (or no NumPy)."""
+    global _open_vectors
+    if not NUMPY_AVAILABLE:
+        return None
+    gen = current_generation((index_dir or default_index_dir()) / "vectors")
+    if gen is None:
+        return None
+    with _open_lock:
+        if _open_vectors is None or _open_vectors.gen != gen:
+            _open_vectors = VectorIndex(gen)
+        return _open_vectors
+
+
+# -- building --
+
+def _embed_model_id() -> str:
+    cfg = MODELS.get(EMBED_MODEL)
+    return (cfg.model_path or cfg.url) if cfg else ""
+
+
+def build_vectors(
+    index_dir: Optional[Path] = None,
+    embed: Optional[Callable[[List[str]], Optional[List[List[float]]]]] = None,
+) -> dict:
+    """
+    Embed the current BM25 index's chunks, reusing vectors of unchanged chunks.
+    Returns counts of chunks, embedded and reused, or an "error".
+    """
+    if not NUMPY_AVAILABLE:
+        return {"error": "numpy is not installed"}
+    index_dir = index_dir or default_index_dir()
+    index = open_index(index_dir)
+    if index is None:
+        return {"error": "no document index; run rag.py index first"}
+    embed = embed or (lambda texts: run_embedding(EMBED_MODEL, texts, priority=BATCH))
+    start = time.perf_counter()
+
+    texts = [index.chunk(i).text for i in range(index.n_chunks)]
+    keys = [hashlib.sha1(t.encode("utf-8")).hexdigest() for t in texts]
+    previous = open_vectors(index_dir)
+    reusable: Dict[str, int] = {}
+    if previous is not None and previous.embed_model == _embed_model_id():
+        reusable = {key: row for row, key in enumerate(previous.keys)}
+
+    missing = [i for i, key in enumerate(keys) if key not in reusable]
+    fresh: Dict[int, List[float]] = {}
+    try:
+        for b in range(0, len(missing), EMBED_BATCH):
+            batch = missing[b:b + EMBED_BATCH]
+            vectors = embed([texts[i] for i in batch])
+            if vectors is None:
+                return {"error": "embedding server unreachable"}
+            fresh.update(zip(batch, vectors, strict=True))  # ValueError if any are missing
+    except (requests.RequestException, ValueError) as e:
+        return {"error": str(e)}
+
+    dim = len(next(iter(fresh.values()))) if fresh else (previous.dim if previous else 0)
+    if reusable and fresh and previous.dim != dim:  # type: ignore[union-attr]
+        return {"error": f"embedding size changed to {dim}; remove {index_dir / 'vectors'} and rebuild"}
+    matrix = np.zeros((len(keys), dim), dtype=np.float32)
+    for i, key in enumerate(keys):
+        if i in fresh:
+            matrix[i] = fresh[i]
+        else:
+            matrix[i] = previous.matrix[reusable[key]]  # type: ignore[union-attr]
+    write_vectors(index_dir / "vectors", _normalize(matrix), keys, {
+        "chunks_gen": index.gen.name,
+        "embed_model": _embed_model_id(),
+    })
+    return {
+        "chunks": len(keys),
+        "embedded": len(missing),
+        "reused": len(keys) - len(missing),
+        "ms": round((time.perf_counter() - start) * 1000, 2),
+    }
+
+
+# -- querying --
+
+_query_cache: Dict[str, "np.ndarray"] = {}
+QUERY_CACHE_SIZE = 256
+
+
+def _embed_query(query: str) -> Optional["np.ndarray"]:
+    """
+    Query vector, cached; None if the embedding server can't be used right
+    now. A supervised server that isn't loaded is not started for a query:
+    that cold start would sit in front of the answer, so BM25 goes alone.
+    """
+    cached = _query_cache.get(query)
+    if cached is not None:
+        return cached
+    if EMBED_MODEL not in MODELS or not endpoint_pool(EMBED_MODEL).any_available():
+        return None
+    supervisor = get_supervisor()
+    if supervisor is not None and supervisor.is_unloaded(MODELS[EMBED_MODEL].url):
+        return None
+    try:
+        vectors = run_embedding(EMBED_MODEL, [query])
+    except requests.RequestException:
+        return None
+    if not vectors:
+        return None
+    if len(_query_cache) >= QUERY_CACHE_SIZE:
+        _query_cache.pop(next(iter(_query_cache)))
+    _query_cache[query] = np.asarray(vectors[0], dtype=np.float32)
+    return _query_cache[query]
+
+
+def retrieve(
+    query: str,
+    budget_tokens: int = CONTEXT_TOKENS,
+    k: int = TOP_K,
+    index_dir: Optional[Path] = None,
+) -> List[Hit]:
+    """
+    Snippets for query, best first, within budget_tokens: BM25 and vector
+    rankings fused by reciprocal rank. Falls back to BM25 alone.
+    """
+    index = open_index(index_dir)
+    if index is None:
+        return []
+    fused: Dict[int, float] = {}
+    for rank, hit in enumerate(h for h in index.search(query, 2 * k) if h.score >= MIN_SCORE):
+        fused[hit.chunk_id] = fused.get(hit.chunk_id, 0.0) + 1 / (RRF_K + rank)
+
+    vectors = open_vectors(index_dir)
+    if vectors is not None and vectors.chunks_gen == index.gen.name and len(vectors):
+        qvec = _embed_query(query)
+        if qvec is not None and qvec.shape[0] == vectors.dim:
+            ids, sims = vectors.search(qvec, 2 * k)
+            ranked = [i for i, s in zip(ids[0], sims[0], strict=True)
+                      if i >= 0 and s >= MIN_SIMILARITY]
+            for rank, chunk_id in enumerate(ranked):
+                fused[int(chunk_id)] = fused.get(int(chunk_id), 0.0) + 1 / (RRF_K + rank)
+
+    best = sorted(fused.items(), key=lambda kv: kv[1], reverse=True)[:k]
+    return pack([index.chunk(chunk_id, score) for chunk_id, score in best], budget_tokens)
+
+
+# -- benchmark --
+
+def _clustered(n: int, dim: int, clusters: int, rng: "np.random.Generator") -> "np.ndarray":
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    points = centers[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return _normalize(points)
+
+
+def benchmark(n: int, dim: int, queries: int, k: int, nprobe: int, seed: int = 0) -> dict:
+    """IVF recall@k and latency against brute force on synthetic clustered vectors."""
+    rng = np.random.default_rng(seed)
+    points = _clustered(n + queries, dim, max(16, n // 100), rng)
+    data, qs = points[:n], points[n:]  # Queries come from the same distribution
+    with tempfile.TemporaryDirectory() as tmp:
+        build_start = time.perf_counter()
+        index = VectorIndex(write_vectors(Path(tmp), data, [], {}, ivf=True))
+        build_s = time.perf_counter() - build_start
+
+        def timed(index: VectorIndex, exact: bool) -> Tuple[List[float], "np.ndarray"]:
+            times, found = [], []
+            for q in qs:
+                t = time.perf_counter()
+                ids, _ = index.search(q, k, nprobe=nprobe, exact=exact)
+                times.append((time.perf_counter() - t) * 1000)
+                found.append(ids[0])
+            return times, np.stack(found)
+
+        brute_ms, truth = timed(index, exact=True)
+        ivf_ms, approx = timed(index, exact=False)
+        batch_start = time.perf_counter()
+        index.search(qs, k, exact=True)
+        batch_ms = (time.perf_counter() - batch_start) * 1000 / queries
+        recall = np.mean([len(set(a) & set(t)) / k for a, t in zip(approx, truth, strict=True)])
+        del index
+
+    def pct(values: List[float], p: float) -> float:
+        return round(sorted(values)[min(len(values) - 1, int(p * len(values)))], 3)
+
+    return {
+        "rows": n,
+        "dim": dim,
+        "nlist": max(1, int(math.sqrt(n))),
+        "nprobe": nprobe,
+        f"recall@{k}": round(float(recall), 4),
+        "brute_p50_ms": pct(brute_ms, 0.5),
+        "brute_p95_ms": pct(brute_ms, 0.95),
+        "brute_batched_ms_per_query": round(batch_ms, 3),
+        "ivf_p50_ms": pct(ivf_ms, 0.5),
+        "ivf_p95_ms": pct(ivf_ms, 0.95),
+        "ivf_build_s": round(build_s, 2),
+        "speedup_p50": round(statistics.median(brute_ms) / statistics.median(ivf_ms), 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="IGRIS vector index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("build", help="embed the document index's chunks")
+    search_cmd = sub.add_parser("search", help="show the best fused matches for a query")
+    search_cmd.add_argument("query")
+    bench = sub.add_parser("bench", help="IVF vs brute force on synthetic vectors")
+    bench.add_argument("--rows", type=int, default=IVF_MIN_CHUNKS + 20_000)
+    bench.add_argument("--dim", type=int, default=384)
+    bench.add_argument("--queries", type=int, default=200)
+    bench.add_argument("-k", type=int, default=10)
+    bench.add_argument("--nprobe", type=int, default=IVF_NPROBE)
+    args = parser.parse_args()
+
+    if not NUMPY_AVAILABLE:
+        parser.error("numpy is required: pip install numpy")
+    if args.command == "build":
+        print(build_vectors())
+    elif args.command == "search":
+        start = time.perf_counter()
+        hits = retrieve(args.query)
+        elapsed = (time.perf_counter() - start) * 1000
+        for hit in hits:
+            print(f"{hit.score:7.4f}  {hit.path}:{hit.line}")
+        print(f"[{len(hits)} hits in {elapsed:.2f}ms]")
+    else:
+        for key, value in benchmark(args.rows, args.dim, args.queries, args.k, args.nprobe).items():
+            print(f"{key:>28}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+"""
+IGRIS Cache Warming
+
+The same questions come up day after day, but the response cache starts empty
+on every launch. The Warmer mines recent logs for frequent inputs whose
+answers don't depend on conversation history, and generates their responses
+into the cache while IGRIS is idle:
+
+- candidates are inputs answered without error at least MIN_COUNT times in
+  the last LOG_DAYS days with no history or workspace in the prompt, most
+  frequent first
+- work happens only after IDLE_SECONDS without interactive requests, and only
+  on models whose servers are already loaded (warming never starts one)
+- generations run at BATCH priority, and an arriving interactive request
+  cancels them at once (Scheduler.on_interactive); they are retried later
+
+Warmed entries are cached with "warmed": True, and WARM_STATS counts how many
+were hit afterwards (shown in /status). Set IGRIS_WARMUP=0 to disable.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Deque, List, Optional, Set, Tuple
+
+import requests
+
+try:
+    from .base import MODELS, CancelToken, get_cached, get_supervisor, run_model_streaming, set_cached
+    from .logger import LOG_DIR, log_system_event
+    from .scheduler import BATCH, SCHEDULER
+except ImportError:
+    from base import MODELS, CancelToken, get_cached, get_supervisor, run_model_streaming, set_cached
+    from logger import LOG_DIR, log_system_event
+    from scheduler import BATCH, SCHEDULER
+
+LOG_DAYS = 14
+MIN_COUNT = 3
+WARM_LIMIT = 10  # Most frequent inputs warmed per launch
+IDLE_SECONDS = 30.0
+POLL_INTERVAL = 1.0
+LOGGED_INPUT_CHARS = 500  # logger.log_request truncates inputs to this
+
+# (model, prompt, run_model_streaming options) for answering an input as the
+# first turn of a session would
+Plan = Callable[[str], Tuple[str, str, dict]]
+
+
+def mine_queries(
+    log_dir: Optional[Path] = None,
+    days: int = LOG_DAYS,
+    min_count: int = MIN_COUNT,
+    limit: int = WARM_LIMIT,
+) -> List[str]:
+    """Frequent history-independent inputs from the daily logs, most frequent first."""
+    cutoff = date.today() - timedelta(days=days)
+    counts: Counter = Counter()
+    for path in sorted((log_dir or LOG_DIR).glob("*.jsonl")):
+        try:
+            if date.fromisoformat(path.stem) < cutoff:
+                continue
+        except ValueError:
+            continue
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                text = (entry.get("input") or "").strip()
+                if not text or entry.get("error") or len(text) >= LOGGED_INPUT_CHARS:
+                    continue
+                turns = entry.get("history_turns")
+                if turns != 0 and not (turns is None and entry.get("model") == "deepseek"):
+                    continue  # The answer may depend on earlier turns
+                counts[text] += 1
+    return [text for text, n in counts.most_common() if n >= min_count][:limit]
+
+
+class WarmStats:
+    """Which cache entries were warmed, and how often they were hit."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._warmed: Set[str] = set()
+        self._hits: Counter = Counter()
+
+    @staticmethod
+    def _key(model: str, prompt: str) -> str:
+        return hashlib.md5(f"{model}:{prompt}".encode()).hexdigest()
+
+    def add(self, model: str, prompt: str) -> None:
+        with self._lock:
+            self._warmed.add(self._key(model, prompt))
+
+    def hit(self, model: str, prompt: str) -> None:
+        with self._lock:
+            self._hits[self._key(model, prompt)] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            warmed = len(self._warmed)
+            used = sum(1 for key in self._warmed if self._hits[key])
+            return {
+                "warmed": warmed,
+                "entries_hit": used,
+                "hits": sum(self._hits.values()),
+                "hit_rate": round(used / warmed, 3) if warmed else None,
+            }
+
+
+WARM_STATS = WarmStats()
+
+
+class Warmer(threading.Thread):
+    """Background thread that pre-computes answers to frequent inputs."""
+
+    def __init__(
+        self,
+        plan: Plan,
+        queries: Optional[List[str]] = None,
+        idle_seconds: float = IDLE_SECONDS,
+        interval: float = POLL_INTERVAL,
+    ) -> None:
+        super().__init__(name="igris-warmup", daemon=True)
+        self.plan = plan
+        self.idle_seconds = idle_seconds
+        self.interval = interval
+        self.pending: Deque[str] = deque(queries if queries is not None else mine_queries())
+        self.warmed = 0
+        self.preempted = 0
+        self.failed = 0
+        self._created = time.monotonic()
+        self._stop_event = threading.Event()
+
+    def idle(self) -> bool:
+        since_start = time.monotonic() - self._created
+        return min(SCHEDULER.interactive_idle(), since_start) >= self.idle_seconds
+
+    def run(self) -> None:
+        while self.pending and not self._stop_event.wait(self.interval):
+            if not self.idle():
+                continue
+            query = self.pending[0]
+            outcome = self.warm(query)
+            if outcome in ("preempted", "unloaded"):
+                self.pending.rotate(-1)  # Try again later
+            else:
+                self.pending.popleft()
+        log_system_event("CACHE_WARMUP", {
+            "warmed": self.warmed, "preempted": self.preempted, "failed": self.failed,
+        })
+
+    def warm(self, query: str) -> str:
+        """
+        Generate and cache the answer to one input. Returns "warmed", "cached"
+        (nothing to do), "unloaded" (server not running), "preempted" or "failed".
+        """
+        model, prompt, options = self.plan(query)
+        if get_cached(model, prompt):
+            return "cached"
+        supervisor = get_supervisor()
+        if supervisor is not None and supervisor.is_unloaded(MODELS[model].url):
+            return "unloaded"
+
+        cancel = CancelToken()
+        unsubscribe = SCHEDULER.on_interactive(lambda: cancel.cancel("PREEMPTED"))
+        try:
+            if not self.idle():  # Someone arrived before we subscribed
+                cancel.cancel("PREEMPTED")
+            else:
+                result = run_model_streaming(model, prompt, lambda token: None, cancel=cancel,
+                                             **{**options, "priority": BATCH})
+        except requests.RequestException:
+            result = {"error": "REQUEST_FAILED", "output": ""}
+        finally:
+            unsubscribe()
+
+        if cancel.reason == "PREEMPTED":  # Deadline cancellations (TIMEOUT_*) are failures
+            self.preempted += 1
+            return "preempted"
+        if result["error"] or not result["output"]:
+            self.failed += 1
+            return "failed"
+        set_cached(model, prompt, {**result, "warmed": True})
+        WARM_STATS.add(model, prompt)
+        self.warmed += 1
+        return "warmed"
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+def start_warmup(plan: Plan) -> Optional[Warmer]:
+    """Start warming the cache from the logs unless IGRIS_WARMUP=0 or nothing qualifies."""
+    if os.environ.get("IGRIS_WARMUP", "1") == "0":
+        return None
+    warmer = Warmer(plan)
+    if not warmer.pending:
+        return None
+    warmer.start()
+    return warmer
@@ -0,0 +1,339 @@
+"""
+IGRIS Code Workspace
+
+Multi-turn code editing for deepseek. Each session keeps the file being
+worked on (the artifact), taken from code the user pastes or from deepseek's
+answer to a fresh task. A later turn edits it only if the user pastes code or
+the task names something in it (applies_to()); other tasks get a fresh prompt.
+When editing, the prompt doesn't carry the whole file again:
+
+- only the relevant region is shown: lines the user changed since the model
+  last saw the file, the definitions the task names, and lines mentioning
+  its identifiers, within REGION_LINES, plus an outline of the other
+  definitions
+- changes the user made since the last turn are shown as a unified diff
+- the model is asked for a unified diff back, which is applied locally
+
+Patches are applied by matching each hunk's context near its stated line, so
+small line-number mistakes don't matter. A reply with a whole file replaces
+the artifact; a reply with one definition replaces that definition.
+"""
+
+import difflib
+import re
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+REGION_LINES = 120  # Files up to this long are always shown whole
+CONTEXT_LINES = 12  # Around changed lines and mentions
+DIFF_LINES = 80  # Longer diffs of the user's changes are cut
+OUTLINE_ITEMS = 40
+MAX_MENTIONS = 5  # Task words found on more lines than this don't pick lines
+RELATED_RATIO = 0.5  # Pasted code less similar than this starts a new artifact
+PATCH_SEARCH_LINES = 200  # How far from its stated line a hunk is looked for
+
+_FENCE = re.compile(r"```([\w+-]*)[^\n]*\n(.*?)(?:```|$)", re.DOTALL)
+_DEFINITION = re.compile(
+    r"^\s*(?:export\s+)?(?:pub\s+)?(?:async\s+)?"
+    r"(?:def|class|function|fn|func|struct|impl|interface|enum)\s+(\w+)")
+_IDENTIFIER = re.compile(r"[A-Za-z_]\w{2,}")
+_CODE_SHAPED = re.compile(r"_|\d|[a-z][A-Z]")  # snake_case, f42, camelCase; not plain words
+_BACKTICKED = re.compile(r"`([^`\n]+)`")
+# Lines of unfenced code: statements, assignments, calls, braces, comments
+_STATEMENT = re.compile(
+    r"^\s*(?:(?:import|from|return|if|elif|else|for|while|try|except|with|raise|yield"
+    r"|const|let|var|use|package|#include)\b|[\w.\[\]]+\s*[-+*/|&]?=[^=]|[\w.]+\(.*\)\s*;?$"
+    r"|.*[;{}]\s*$|#|//|@\w)")
+CODE_LINE_RATIO = 0.6  # Unfenced replies with fewer code-like lines are prose
+_HUNK = re.compile(r"^@@ -(\d+)(?:,\d+)? \+\d+(?:,\d+)? @@")
+
+Range = Tuple[int, int]  # [start, end) line indexes
+
+
+class PatchError(ValueError):
+    """A diff that doesn't apply to the artifact."""
+
+
+def split_code(text: str) -> Tuple[str, Optional[str]]:
+    """(text without its largest fenced code block, that block) or (text, None)."""
+    blocks = list(_FENCE.finditer(text))
+    if not blocks:
+        return text, None
+    largest = max(blocks, key=lambda m: len(m.group(2)))
+    rest = (text[:largest.start()] + text[largest.end():]).strip()
+    return rest, largest.group(2).rstrip("\n")
+
+
+def looks_like_code(text: str) -> bool:
+    """Whether unfenced text reads as code: mostly definitions and statements."""
+    lines = [line for line in text.split("\n") if line.strip()]
+    code = sum(1 for line in lines if _DEFINITION.match(line) or _STATEMENT.match(line))
+    return len(lines) > 1 and code >= CODE_LINE_RATIO * len(lines)
+
+
+def _changed_lines(old: List[str], new: List[str]) -> List[int]:
+    """Indexes in `new` of lines added or changed since `old` (or next to deletions)."""
+    changed: List[int] = []
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, _, _, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            changed.extend(range(j1, j2) if j2 > j1 else [min(j1, len(new) - 1)])
+    return [i for i in changed if i >= 0]
+
+
+def _block_end(lines: List[str], start: int) -> int:
+    """End of the indented block that starts at a definition line."""
+    indent = len(lines[start]) - len(lines[start].lstrip())
+    end = start + 1
+    while end < len(lines):
+        line = lines[end]
+        if line.strip() and len(line) - len(line.lstrip()) <= indent:
+            # A closing brace at the definition's indentation still belongs to it
+            if line.strip() in ("}", "};", "end"):
+                end += 1
+            break
+        end += 1
+    while end > start + 1 and not lines[end - 1].strip():
+        end -= 1
+    return end
+
+
+def relevant_region(
+    lines: List[str],
+    task: str,
+    changed: Sequence[int] = (),
+    budget: int = REGION_LINES,
+) -> List[Range]:
+    """Line ranges worth showing for a task, sorted and within `budget` lines."""
+    if len(lines) <= budget:
+        return [(0, len(lines))]
+    words = set(_IDENTIFIER.findall(task))
+    wanted: List[Range] = [(i - CONTEXT_LINES, i + CONTEXT_LINES + 1) for i in changed]
+    for i, line in enumerate(lines):
+        match = _DEFINITION.match(line)
+        if match and match.group(1) in words:
+            wanted.append((i, _block_end(lines, i)))
+    if words:
+        pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, sorted(words))) + r")\b")
+        mentions: dict = {}
+        for i, line in enumerate(lines):
+            for word in set(pattern.findall(line)):
+                mentions.setdefault(word, []).append(i)
+        # Words on many lines ("return", "self") say nothing about where to look
+        wanted += sorted((i - CONTEXT_LINES // 2, i + CONTEXT_LINES // 2 + 1)
+                         for found in mentions.values() if len(found) <= MAX_MENTIONS
+                         for i in found)
+    if not wanted:
+        wanted = [(0, budget)]
+
+    chosen: List[Range] = []
+    for start, end in wanted:  # In priority order
+        start, end = max(0, start), min(len(lines), end)
+        covered = sum(e - s for s, e in _merge(chosen + [(start, end)]))
+        if covered > budget:
+            end -= covered - budget
+            if end <= start:
+                break
+        chosen = _merge(chosen + [(start, end)])
+    return chosen
+
+
+def _merge(ranges: List[Range]) -> List[Range]:
+    merged: List[Range] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def apply_patch(text: str, patch: str) -> str:
+    """Apply a unified diff to text, placing each hunk where its context matches."""
+    lines = text.split("\n")
+    hunks: List[Tuple[int, List[str], List[str]]] = []
+    for line in patch.split("\n"):
+        header = _HUNK.match(line)
+        if header:
+            hunks.append((int(header.group(1)), [], []))
+        elif line.startswith(("---", "+++")) and (not hunks or not hunks[-1][1] + hunks[-1][2]):
+            continue
+        elif hunks:
+            _, old, new = hunks[-1]
+            if line.startswith("-"):
+                old.append(line[1:])
+            elif line.startswith("+"):
+                new.append(line[1:])
+            elif line.startswith("\\"):
+                continue  # "\ No newline at end of file"
+            else:
+                body = line[1:] if line.startswith(" ") else line  # Models drop the space on blank lines
+                old.append(body)
+                new.append(body)
+    if not hunks:
+        raise PatchError("no hunks in patch")
+
+    offset = 0
+    for stated, old, new in hunks:
+        while old and new and not old[-1].strip() and not new[-1].strip():
+            old.pop()  # Trailing blank context is usually an artifact of the reply
+            new.pop()
+        at = _find(lines, old, max(0, stated - 1 + offset))
+        if at is None:
+            raise PatchError(f"hunk at line {stated} doesn't match the file")
+        lines[at:at + len(old)] = new
+        offset = at - (stated - 1) + len(new) - len(old)
+    return "\n".join(lines)
+
+
+def _find(lines: List[str], old: List[str], near: int) -> Optional[int]:
+    """Index nearest `near` where `old` matches, ignoring trailing then all edge whitespace."""
+    if not old:
+        return min(near, len(lines))
+    for normalize in (str.rstrip, str.strip):
+        target = [normalize(line) for line in old]
+        for distance in range(PATCH_SEARCH_LINES + 1):
+            for at in (near - distance, near + distance) if distance else (near,):
+                if 0 <= at <= len(lines) - len(old) and all(
+                        normalize(lines[at + k]) == target[k] for k in range(len(old))):
+                    return at
+    return None
+
+
+def _extract_patch(output: str) -> Optional[str]:
+    for match in _FENCE.finditer(output):
+        if match.group(1) in ("diff", "patch") or re.search(r"^@@ ", match.group(2), re.MULTILINE):
+            return match.group(2)
+    if re.search(r"^@@ ", output, re.MULTILINE):
+        return output
+    return None
+
+
+@dataclass
+class Workspace:
+    """The artifact a session is editing, and the version the model last saw."""
+
+    text: str = ""
+    seen: str = ""
+    version: int = 0
+
+    @property
+    def active(self) -> bool:
+        return bool(self.text)
+
+    def applies_to(self, task: str) -> bool:
+        """
+        Whether a task names something in the artifact: one of its definitions,
+        an identifier shaped like code, or any identifier of it in backticks.
+        """
+        if not self.text:
+            return False
+        names = set(_IDENTIFIER.findall(self.text))
+        definitions = {m.group(1) for m in map(_DEFINITION.match, self.text.split("\n")) if m}
+        quoted = {word for span in _BACKTICKED.findall(task) for word in _IDENTIFIER.findall(span)}
+        return any(word in definitions or word in quoted or
+                   (word in names and _CODE_SHAPED.search(word))
+                   for word in _IDENTIFIER.findall(task))
+
+    def update(self, code: str) -> None:
+        """Take code the user pasted as the new artifact."""
+        code = code.rstrip("\n")
+        if code == self.text:
+            return
+        matcher = difflib.SequenceMatcher(None, self.text, code, autojunk=False)
+        if not self.text or matcher.quick_ratio() < RELATED_RATIO or matcher.ratio() < RELATED_RATIO:
+            self.seen = ""  # A different file; no diff against the old one
+        self.text = code
+        self.version += 1
+
+    def context(self, task: str) -> str:
+        """Prompt section for a task on the artifact."""
+        lines = self.text.split("\n")
+        changed = _changed_lines(self.seen.split("\n"), lines) if self.seen else []
+        ranges = relevant_region(lines, task, changed)
+        parts = []
+        if ranges == [(0, len(lines))]:
+            parts.append(f"Current file ({len(lines)} lines):\n```\n{self.text}\n```\n")
+        else:
+            parts.append(f"Current file ({len(lines)} lines), the parts relevant to the task:\n")
+            for start, end in ranges:
+                parts.append(f"Lines {start + 1}-{end}:\n```\n" + "\n".join(lines[start:end]) + "\n```\n")
+            outline = [f"  {i + 1}: {line.strip()}" for i, line in enumerate(lines)
+                       if _DEFINITION.match(line) and not any(s <= i < e for s, e in ranges)]
+            if outline:
+                parts.append("Other definitions:\n" + "\n".join(outline[:OUTLINE_ITEMS]) + "\n")
+        if self.seen and self.seen != self.text:
+            diff = list(difflib.unified_diff(self.seen.split("\n"), lines, "before", "after",
+                                             n=2, lineterm=""))[2:]
+            if len(diff) > DIFF_LINES:
+                diff = diff[:DIFF_LINES] + ["..."]
+            parts.append("The user changed it since your last edit:\n```diff\n"
+                         + "\n".join(diff) + "\n```\n")
+        parts.append(
+            "Reply with only a unified diff of your changes to this file in a ```diff block, "
+            "hunks like @@ -12,3 +12,4 @@ with two unchanged lines around each change. "
+            "Reply with the whole file only if you rewrite most of it.\n\n"
+        )
+        return "\n".join(parts)
+
+    def apply_reply(self, output: str, fresh: bool = False) -> str:
+        """
+        Update the artifact from a model reply. Returns "patched", "replaced",
+        "created", "unchanged" (no code) or "failed" (a diff that didn't apply).
+        With fresh (a reply to a prompt without the artifact), code in it
+        starts a new artifact.
+        """
+        if fresh and self.text:
+            _, code = split_code(output)
+            if code is None and not looks_like_code(output.strip()):
+                return "unchanged"  # Prose keeps the artifact for a later edit
+            self.clear()
+        patch = _extract_patch(output) if self.text else None
+        if patch is not None:
+            try:
+                text = apply_patch(self.text, patch)
+            except PatchError:
+                return "failed"
+            status = "patched"
+        else:
+            _, fenced = split_code(output)
+            code = output.strip() if fenced is None else fenced
+            if fenced is None and not looks_like_code(code):
+                return "unchanged"  # Prose, or a one-line reply ("Not a coding task.")
+            text, status = self._merge_code(code.rstrip("\n"))
+            if text is None:
+                return "unchanged"
+        if text != self.text:
+            self.text = text
+            self.version += 1
+        self.seen = self.text
+        return status
+
+    def _merge_code(self, code: str) -> Tuple[Optional[str], str]:
+        if not self.text:
+            return code, "created"
+        old, new = self.text.split("\n"), code.split("\n")
+        first = next((_DEFINITION.match(line) for line in new if _DEFINITION.match(line)), None)
+        if len(new) < len(old) // 2 and first:
+            # One definition: swap it in for the one with the same name
+            for i, line in enumerate(old):
+                match = _DEFINITION.match(line)
+                if match and match.group(1) == first.group(1):
+                    old[i:_block_end(old, i)] = new
+                    return "\n".join(old), "patched"
+        if len(new) >= len(old) // 2:
+            return code, "replaced"
+        return None, "unchanged"
+
+    def clear(self) -> None:
+        self.text = ""
+        self.seen = ""
+        self.version = 0
+
+    def to_dict(self) -> dict:
+        return {"text": self.text, "seen": self.seen, "version": self.version}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Workspace":
+        return cls(text=data.get("text", ""), seen=data.get("seen", ""),
+                   version=data.get("version", 0))
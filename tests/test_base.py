@@ -0,0 +1,203 @@
+"""
+Unit tests for the IGRIS model client layer (base.py).
+"""
+
+import threading
+import time
+
+import pytest
+
+import base
+from latency import TIMEOUT_MIN_SAMPLES, LatencyTracker
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    base.clear_cache()
+    yield
+    base.clear_cache()
+
+
+class TestSingleFlight:
+    """Test coalescing of identical in-flight requests."""
+
+    def test_followers_share_one_generation(self, monkeypatch):
+        calls = []
+        release = threading.Event()
+
+        def fake_stream(model_name, prompt, on_token, cancel=None):
+            calls.append(prompt)
+            on_token("hello ")
+            release.wait(2)
+            on_token("world")
+            return {"model": model_name, "output": "hello world",
+                    "latency_ms": 1.0, "error": None}
+
+        monkeypatch.setattr(base, "run_model_streaming", fake_stream)
+
+        received = [[] for _ in range(3)]
+        results = [None] * 3
+
+        def worker(i):
+            results[i] = base.run_model_coalesced("qwen", "same prompt", received[i].append)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(3)]
+        for t in threads:
+            t.start()
+            time.sleep(0.05)
+        release.set()
+        for t in threads:
+            t.join(2)
+
+        assert len(calls) == 1
+        assert all("".join(tokens) == "hello world" for tokens in received)
+        assert sum(1 for r in results if r.get("coalesced")) == 2
+        assert base.get_cached("qwen", "same prompt")["output"] == "hello world"
+
+    def test_errors_are_not_cached(self, monkeypatch):
+        def offline(model_name, prompt):
+            return {"model": model_name, "output": "", "latency_ms": None,
+                    "error": "MODEL_OFFLINE"}
+
+        monkeypatch.setattr(base, "run_model", offline)
+        result = base.run_model_coalesced("qwen", "prompt")
+        assert result["error"] == "MODEL_OFFLINE"
+        assert base.get_cached("qwen", "prompt") is None
+        assert not base._inflight
+
+    def test_follower_sees_leader_exception(self, monkeypatch):
+        started = threading.Event()
+        release = threading.Event()
+
+        def failing(model_name, prompt):
+            started.set()
+            release.wait(2)
+            raise base.requests.ConnectionError("boom")
+
+        monkeypatch.setattr(base, "run_model", failing)
+        errors = []
+
+        def call():
+            try:
+                base.run_model_coalesced("deepseek", "task")
+            except base.requests.RequestException as e:
+                errors.append(e)
+
+        leader = threading.Thread(target=call)
+        leader.start()
+        started.wait(2)
+        follower = threading.Thread(target=call)
+        follower.start()
+        time.sleep(0.05)
+        release.set()
+        leader.join(2)
+        follower.join(2)
+        assert len(errors) == 2
+
+    def test_follower_retries_when_leader_is_cancelled(self, monkeypatch):
+        started = threading.Event()
+        calls = []
+
+        def fake_stream(model_name, prompt, on_token, cancel=None):
+            calls.append(prompt)
+            if len(calls) == 1:
+                on_token("partial")
+                started.set()
+                time.sleep(0.1)
+                raise KeyboardInterrupt
+            on_token("partial")  # The same prompt regenerates the same start
+            on_token(" answer")
+            return {"model": model_name, "output": "partial answer",
+                    "latency_ms": 1.0, "error": None}
+
+        monkeypatch.setattr(base, "run_model_streaming", fake_stream)
+        results = {}
+
+        def leader():
+            try:
+                base.run_model_coalesced("qwen", "shared", lambda t: None)
+            except KeyboardInterrupt:
+                results["leader"] = "interrupted"
+
+        received = []
+
+        def follower():
+            results["follower"] = base.run_model_coalesced("qwen", "shared", received.append)
+
+        first = threading.Thread(target=leader)
+        first.start()
+        started.wait(2)
+        second = threading.Thread(target=follower)
+        second.start()
+        first.join(2)
+        second.join(2)
+        assert results["leader"] == "interrupted"
+        assert results["follower"]["output"] == "partial answer"
+        assert results["follower"]["error"] is None and len(calls) == 2
+        assert "".join(received) == "partial answer"  # Nothing shown twice
+
+    def test_follower_stops_on_its_own_cancel(self, monkeypatch):
+        started = threading.Event()
+        release = threading.Event()
+
+        def fake_stream(model_name, prompt, on_token, cancel=None):
+            on_token("slow ")
+            started.set()
+            release.wait(5)
+            return {"model": model_name, "output": "slow ", "latency_ms": 1.0, "error": None}
+
+        monkeypatch.setattr(base, "run_model_streaming", fake_stream)
+        leader = threading.Thread(target=base.run_model_coalesced,
+                                  args=("qwen", "shared", lambda t: None))
+        leader.start()
+        started.wait(2)
+        cancel = base.CancelToken()
+        threading.Timer(0.1, cancel.cancel).start()
+        start = time.monotonic()
+        result = base.run_model_coalesced("qwen", "shared", lambda t: None, cancel=cancel)
+        assert time.monotonic() - start < 1.0
+        assert result["error"] == "CANCELLED" and result["output"] == "slow "
+        release.set()
+        leader.join(2)
+
+
+class TestAdaptiveTimeouts:
+    """Test latency-derived deadlines and their enforcement."""
+
+    def test_ceiling_until_enough_samples(self):
+        tracker = LatencyTracker()
+        tracker.record("qwen", "ttft", 100)
+        assert tracker.deadline("qwen", "ttft", ceiling=30.0) == 30.0
+
+    def test_adapts_and_clamps(self):
+        tracker = LatencyTracker()
+        for _ in range(TIMEOUT_MIN_SAMPLES):
+            tracker.record("qwen", "ttft", 4000)
+        assert tracker.deadline("qwen", "ttft", ceiling=30.0) == 12.0
+        assert tracker.deadline("qwen", "ttft", ceiling=10.0) == 10.0
+
+        fast = LatencyTracker()
+        for _ in range(TIMEOUT_MIN_SAMPLES):
+            fast.record("qwen", "ttft", 10)
+        assert fast.deadline("qwen", "ttft", ceiling=30.0) == 5.0  # Floor
+
+    def test_watch_expiry_by_phase(self):
+        limits = base.Deadlines(connect=1, ttft=2, idle=1, total=10)
+        watch = base._StreamWatch(base.CancelToken(), limits)
+        assert watch.expired(watch.start + 1.5) is None
+        assert watch.expired(watch.start + 2.5) == "TIMEOUT_TTFT"
+        watch.touch()
+        assert watch.expired(watch.last + 0.5) is None
+        assert watch.expired(watch.last + 1.5) == "TIMEOUT_IDLE"
+        assert watch.expired(watch.start + 11) == "TIMEOUT_TOTAL"
+
+    def test_total_scales_with_n_predict(self, monkeypatch):
+        tracker = LatencyTracker()
+        for _ in range(TIMEOUT_MIN_SAMPLES):
+            tracker.record("deepseek", "ttft", 1000)
+            tracker.record("deepseek", "token", 50)
+            tracker.record("deepseek", "embed", 10)  # Other kinds don't count
+        monkeypatch.setattr(base, "LATENCY", tracker)
+        assert base.deadlines("deepseek", 64).total == 15.0  # 5s + 64 x 0.15s, floored
+        assert base.deadlines("deepseek", 1000).total == pytest.approx(155.0)
+        assert base.deadlines("deepseek", 4000).total == base.MODELS["deepseek"].timeout
@@ -0,0 +1,152 @@
+"""
+Unit tests for IGRIS batch mode.
+"""
+
+import json
+import os
+import signal
+import threading
+import time
+
+import pytest
+
+import batch
+from batch import Checkpoint, run_batch
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    calls = []
+
+    def fake_run(model_name, prompt, runner=None, cancel=None):
+        calls.append(model_name)
+        return {"model": model_name, "output": f"{model_name} answer",
+                "latency_ms": 1.0, "error": None}
+
+    monkeypatch.setattr(batch, "run_model_coalesced", fake_run)
+    monkeypatch.setattr(batch, "log_system_event", lambda *a, **k: None)
+    return calls
+
+
+def write_input(path, items):
+    path.write_text("\n".join(items) + "\n")
+
+
+class TestCheckpoint:
+    """Test watermark bookkeeping."""
+
+    def test_watermark_advances_over_contiguous_lines(self, tmp_path):
+        ckpt = Checkpoint(tmp_path / "c.ckpt")
+        ckpt.mark(1)
+        ckpt.mark(2)
+        assert ckpt.watermark == 0
+        ckpt.mark(0)
+        assert ckpt.watermark == 3
+        assert not ckpt.done
+
+    def test_roundtrip(self, tmp_path):
+        ckpt = Checkpoint(tmp_path / "c.ckpt")
+        ckpt.mark(0)
+        ckpt.mark(5)
+        ckpt.save(42)
+        loaded = Checkpoint.load(tmp_path / "c.ckpt")
+        assert loaded.is_done(0) and loaded.is_done(5) and not loaded.is_done(1)
+        assert loaded.output_offset == 42
+
+
+class TestRunBatch:
+    """Test end-to-end batch processing with a fake backend."""
+
+    def test_routes_and_writes_every_line(self, tmp_path, fake_backend):
+        src, dst = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+        write_input(src, [
+            json.dumps({"id": 1, "input": "write a python function to sort a list"}),
+            json.dumps({"id": 2, "input": "hello there"}),
+            "not json",
+            "",
+            json.dumps({"id": 3, "prompt": "explain recursion"}),
+        ])
+        stats = run_batch(src, dst, window=2)
+
+        records = {r["line"]: r for r in map(json.loads, dst.read_text().splitlines())}
+        assert stats["processed"] == 4
+        assert records[0]["model"] == "deepseek"
+        assert records[1]["model"] == "qwen"
+        assert records[2]["error"] == "INVALID_INPUT"
+        assert records[4]["id"] == 3
+        assert sorted(fake_backend) == ["deepseek", "qwen", "qwen"]
+
+    def test_resume_skips_finished_lines(self, tmp_path, fake_backend):
+        src, dst = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+        write_input(src, [json.dumps({"input": f"hello {i}"}) for i in range(5)])
+        run_batch(src, dst)
+        first = dst.read_text()
+
+        stats = run_batch(src, dst)
+        assert stats["skipped"] == 5
+        assert stats["processed"] == 0
+        assert dst.read_text() == first
+
+    def test_resume_drops_uncheckpointed_output(self, tmp_path, fake_backend):
+        src, dst = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+        write_input(src, [json.dumps({"input": f"hello {i}"}) for i in range(3)])
+        dst.write_text('{"line": 0, "partial": true}\n')  # No checkpoint yet
+
+        run_batch(src, dst)
+        lines = [json.loads(x) for x in dst.read_text().splitlines()]
+        assert sorted(r["line"] for r in lines) == [0, 1, 2]
+        assert not any(r.get("partial") for r in lines)
+
+    def test_interrupt_does_not_wait_for_queued_items(self, tmp_path, monkeypatch):
+        def slow_run(model_name, prompt, runner=None, cancel=None):
+            time.sleep(0.2)
+            return {"model": model_name, "output": "answer", "latency_ms": 1.0, "error": None}
+
+        routed = []
+
+        def interrupting(route):
+            routed.append(route)
+            if len(routed) == 10:
+                raise KeyboardInterrupt
+            return "qwen", "fast"
+
+        monkeypatch.setattr(batch, "run_model_coalesced", slow_run)
+        monkeypatch.setattr(batch, "select_model", interrupting)
+        monkeypatch.setattr(batch, "log_system_event", lambda *a, **k: None)
+        src, dst = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+        write_input(src, [json.dumps({"input": f"hello {i}"}) for i in range(20)])
+
+        start = time.perf_counter()
+        with pytest.raises(KeyboardInterrupt):
+            run_batch(src, dst, limits={"qwen": 1})
+        assert time.perf_counter() - start < 0.5  # Not the 9 x 0.2s queued
+
+        ckpt = Checkpoint.load(dst.with_name(dst.name + ".ckpt"))
+        written = [json.loads(x)["line"] for x in dst.read_text().splitlines()]
+        assert all(ckpt.is_done(line) for line in written)
+        assert ckpt.watermark == len(written) < 9
+
+    def test_interrupt_cancels_running_generations(self, tmp_path, monkeypatch):
+        cancelled = []
+
+        def generating(model_name, prompt, runner=None, cancel=None):
+            deadline = time.monotonic() + 5
+            while not cancel.cancelled and time.monotonic() < deadline:
+                time.sleep(0.01)
+            cancelled.append(cancel.cancelled)
+            return {"model": model_name, "output": "", "latency_ms": None, "error": cancel.reason}
+
+        monkeypatch.setattr(batch, "run_model_coalesced", generating)
+        monkeypatch.setattr(batch, "log_system_event", lambda *a, **k: None)
+        src, dst = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+        write_input(src, [json.dumps({"input": f"hello {i}"}) for i in range(3)])
+
+        # All input is submitted by then; the run is waiting on the pools
+        threading.Timer(0.3, os.kill, (os.getpid(), signal.SIGINT)).start()
+        start = time.perf_counter()
+        with pytest.raises(KeyboardInterrupt):
+            run_batch(src, dst, limits={"qwen": 2, "deepseek": 1})
+        assert time.perf_counter() - start < 1.0
+        time.sleep(0.1)
+        assert cancelled and all(cancelled)
+        assert dst.read_text() == ""
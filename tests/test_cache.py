@@ -0,0 +1,59 @@
+"""
+Unit tests for the deduplicating, compressing response cache.
+"""
+
+import pytest
+
+import cache
+from cache import ENTRY_OVERHEAD, ResponseCache, sample_outputs
+
+
+def response(output, model="deepseek"):
+    return {"model": model, "output": output, "latency_ms": 12.5, "error": None}
+
+
+class TestResponseCache:
+    """Test storage, dedup and eviction."""
+
+    def test_round_trip(self):
+        store = ResponseCache()
+        code = sample_outputs(4096, 1)[0]
+        store.put("a", response(code))
+        store.put("b", response("short answer", model="qwen"))
+        assert store.get("a") == response(code)
+        assert store.get("b") == response("short answer", model="qwen")
+        assert store.get("missing") is None
+
+    def test_large_outputs_are_compressed(self):
+        store = ResponseCache()
+        store.put("a", response(sample_outputs(4096, 1)[0]))
+        store.put("b", response("x" * (cache.COMPRESS_MIN - 1)))
+        codecs = sorted(blob.codec for blob in store._blobs.values())
+        assert codecs == ["raw", "zlib"]
+        assert store.stats()["ratio"] > 1.5
+
+    def test_identical_outputs_share_a_blob(self):
+        store = ResponseCache()
+        code = sample_outputs(2048, 1)[0]
+        store.put("prompt one", response(code))
+        store.put("prompt two", response(code))
+        assert store.stats()["blobs"] == 1
+        store.put("prompt one", response("something else entirely"))
+        assert store.get("prompt two")["output"] == code  # Still referenced
+        store.put("prompt two", response("and another"))
+        assert store.stats()["blobs"] == 2  # The shared blob was freed
+
+    def test_evicts_least_recently_used_within_budget(self):
+        outputs = sample_outputs(600, 3)
+        store = ResponseCache(max_bytes=2 * (ENTRY_OVERHEAD + 600), codec="raw")
+        store.put("a", response(outputs[0]))
+        store.put("b", response(outputs[1]))
+        store.get("a")
+        store.put("c", response(outputs[2]))
+        assert store.get("b") is None
+        assert store.get("a") and store.get("c")
+        assert store.stats()["bytes"] <= store.max_bytes
+
+    def test_unknown_codec(self):
+        with pytest.raises(ValueError):
+            ResponseCache(codec="brotli")
@@ -0,0 +1,86 @@
+"""
+Unit tests for backend record/replay, run against scripts/mock_server.py.
+"""
+
+import argparse
+import threading
+import time
+
+import pytest
+import requests
+
+import base
+from cassette import Cassette, recording, replaying, summarize
+from mock_server import MockServer
+
+
+@pytest.fixture
+def server():
+    options = argparse.Namespace(load_time=0.0, ttft=0.05, token_delay=0.02, crash_after=0,
+                                 embedding_dim=8, parallel=0, batch_overhead=0.1)
+    mock = MockServer(("127.0.0.1", 0), options)
+    threading.Thread(target=mock.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{mock.server_address[1]}"
+    mock.shutdown()
+    mock.server_close()
+
+
+def stream(session, url, n_predict=6):
+    """Tokens and their arrival times from a streamed /completion."""
+    tokens, times = [], []
+    start = time.perf_counter()
+    with session.post(f"{url}/completion", json={"prompt": "hi", "n_predict": n_predict,
+                                                 "stream": True}, stream=True, timeout=5) as r:
+        for line in r.iter_lines():
+            if line.startswith(b"data: ") and b'"stop": false' in line:
+                tokens.append(line)
+                times.append(time.perf_counter() - start)
+    return tokens, times
+
+
+class TestRecordReplay:
+    """Test recording real exchanges and playing them back."""
+
+    def test_round_trip_keeps_content_and_timing(self, server, tmp_path):
+        path = tmp_path / "run.json.gz"
+        session = requests.Session()
+        with recording(path, session) as cassette:
+            live_tokens, live_times = stream(session, server)
+            assert session.get(f"{server}/health", timeout=2).json() == {"status": "ok"}
+        assert len(cassette) == 2 and path.exists()
+
+        offline = requests.Session()  # The server is not used from here on
+        with replaying(path, session=offline) as adapter:
+            tokens, times = stream(offline, "http://127.0.0.1:9")
+            assert offline.get("http://127.0.0.1:9/health", timeout=2).status_code == 200
+        assert tokens == live_tokens and adapter.misses == 0
+        assert times[0] == pytest.approx(live_times[0], abs=0.03)  # Prompt evaluation
+        assert times[-1] == pytest.approx(live_times[-1], abs=0.05)
+
+        with replaying(path, speed=0, session=offline):
+            start = time.perf_counter()
+            assert stream(offline, server)[0] == live_tokens
+            assert time.perf_counter() - start < 0.05
+
+    def test_unrecorded_request_is_unreachable(self, tmp_path):
+        path = tmp_path / "empty.json.gz"
+        Cassette(path).save()
+        session = requests.Session()
+        with replaying(path, session=session) as adapter:
+            with pytest.raises(requests.ConnectionError):
+                session.get("http://127.0.0.1:9/health", timeout=1)
+        assert adapter.misses == 1
+
+    def test_replay_through_the_client(self, server, tmp_path, monkeypatch):
+        path = tmp_path / "qwen.json.gz"
+        endpoint = base.endpoint_pool("qwen").endpoints()[0]
+        monkeypatch.setattr(endpoint, "url", f"{server}/completion")
+        with recording(path):
+            live = base.run_model_streaming("qwen", "hello", lambda t: None, max_tokens=6)
+        monkeypatch.setattr(endpoint, "url", "http://127.0.0.1:9/completion")
+        with replaying(path, speed=0):
+            replayed = base.run_model_streaming("qwen", "hello", lambda t: None, max_tokens=6)
+        assert replayed["output"] == live["output"] == "Hello from the mock server."
+        assert replayed["error"] is None
+        rows = summarize(Cassette.load(path))
+        assert rows[0]["endpoint"] == "POST /completion" and rows[0]["ttfb_ms"] >= 40
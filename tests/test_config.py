@@ -0,0 +1,132 @@
+"""
+Unit tests for the TOML model registry and hot reload.
+"""
+
+import os
+import time
+
+import pytest
+
+import base
+import config
+from config import ConfigError, apply_config, load_config, parse_config, reload_config
+
+
+@pytest.fixture(autouse=True)
+def restore_models(monkeypatch):
+    saved = dict(base.MODELS)
+    for name in config.BUILTIN_MODELS:
+        monkeypatch.delenv(f"{name.upper()}_PORT", raising=False)
+        monkeypatch.delenv(f"{name.upper()}_MODEL", raising=False)
+    monkeypatch.setattr(config, "log_system_event", lambda *a, **k: None)
+    yield
+    base.MODELS.clear()
+    base.MODELS.update(saved)
+
+
+class TestParseConfig:
+    """Test building a registry from parsed TOML."""
+
+    def test_overrides_keep_builtin_defaults(self):
+        registry = parse_config({"models": {"deepseek": {
+            "max_tokens": 512, "replicas": ["http://127.0.0.1:8012/completion"]}}})
+        deepseek = registry["deepseek"]
+        assert deepseek.max_tokens == 512
+        assert deepseek.endpoints == ["http://127.0.0.1:8002/completion",
+                                      "http://127.0.0.1:8012/completion"]
+        assert deepseek.ttft_timeout == 45.0  # Built-in value untouched
+
+    def test_port_add_and_disable(self):
+        registry = parse_config({"models": {
+            "qwen": {"port": 9001},
+            "phi": {"port": 9005, "max_tokens": 128},
+            "mistral": {"enabled": False},
+        }})
+        assert registry["qwen"].url == "http://127.0.0.1:9001/completion"
+        assert registry["phi"].max_tokens == 128
+        assert "mistral" not in registry
+
+    def test_env_port_and_model(self, monkeypatch):
+        monkeypatch.setenv("QWEN_PORT", "9101")
+        monkeypatch.setenv("QWEN_MODEL", "models/qwen-q8.gguf")
+        qwen = parse_config({})["qwen"]
+        assert qwen.url == "http://127.0.0.1:9101/completion"
+        assert qwen.model_path == "models/qwen-q8.gguf"
+
+    @pytest.mark.parametrize("models", [
+        {"qwen": {"max_tokens": "lots"}},
+        {"qwen": {"max_tokens": 0}},
+        {"qwen": {"colour": "blue"}},
+        {"qwen": {"stop_patterns": ["(unclosed"]}},
+        {"qwen": {"url": "localhost:8001"}},
+        {"deepseek": {"enabled": False}},
+        {"phi": {"max_tokens": 64}},
+    ])
+    def test_rejects_invalid(self, models):
+        with pytest.raises(ConfigError):
+            parse_config({"models": models})
+
+
+class TestReload:
+    """Test applying and hot-reloading config files."""
+
+    def test_apply_updates_in_place(self):
+        models = base.MODELS
+        in_flight = models["qwen"]
+        changed = apply_config(parse_config({"models": {"qwen": {"max_tokens": 99},
+                                                        "mistral": {"enabled": False}}}))
+        assert changed == ["mistral", "qwen"]
+        assert base.MODELS is models
+        assert models["qwen"].max_tokens == 99
+        assert in_flight.max_tokens == 256  # Running requests keep their config
+        assert "mistral" not in models
+
+    def test_invalid_edit_keeps_last_good(self, tmp_path):
+        path = tmp_path / "igris.toml"
+        path.write_text("[models.qwen]\nmax_tokens = 77\n")
+        assert reload_config(path)
+        path.write_text("[models.qwen]\nmax_tokens = \n")
+        assert not reload_config(path)
+        assert base.MODELS["qwen"].max_tokens == 77
+
+    def test_bad_env_port_without_file_uses_defaults(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("QWEN_PORT", "eighty")
+        monkeypatch.setattr(config, "load_dotenv", lambda: None)
+        config.init_config(tmp_path / "missing.toml", watch=False)
+        assert base.MODELS["qwen"].url == config.BUILTIN_MODELS["qwen"].url
+
+    def test_config_path_from_dotenv(self, tmp_path, monkeypatch):
+        path = tmp_path / "custom.toml"
+        path.write_text("[models.qwen]\nmax_tokens = 55\n")
+        env = tmp_path / ".env"
+        env.write_text(f"IGRIS_CONFIG={path}\n")
+        monkeypatch.delenv("IGRIS_CONFIG", raising=False)
+        load_dotenv = config.load_dotenv
+        monkeypatch.setattr(config, "load_dotenv", lambda: load_dotenv(env))
+        try:
+            config.init_config(watch=False)
+            assert base.MODELS["qwen"].max_tokens == 55
+        finally:
+            os.environ.pop("IGRIS_CONFIG", None)
+
+    def test_watcher_picks_up_edits(self, tmp_path):
+        path = tmp_path / "igris.toml"
+        path.write_text("[models.qwen]\nmax_tokens = 10\n")
+        watcher = config.ConfigWatcher(path, interval=0.02)
+        watcher.start()
+        try:
+            path.write_text("[models.qwen]\nmax_tokens = 20\n")
+            os.utime(path, (time.time() + 5, time.time() + 5))
+            deadline = time.time() + 2
+            while base.MODELS["qwen"].max_tokens != 20 and time.time() < deadline:
+                time.sleep(0.02)
+            assert base.MODELS["qwen"].max_tokens == 20
+        finally:
+            watcher.stop()
+
+    def test_load_reads_toml(self, tmp_path):
+        path = tmp_path / "igris.toml"
+        path.write_text('[models.deepseek]\nreplicas = ["http://10.0.0.2:8002/completion"]\n')
+        assert load_config(path)["deepseek"].replicas == ["http://10.0.0.2:8002/completion"]
+        with pytest.raises(ConfigError):
+            load_config(tmp_path / "missing.toml")
@@ -0,0 +1,122 @@
+"""
+Unit tests for replica load balancing and circuit breakers.
+"""
+
+import pytest
+import requests
+
+import base
+from endpoints import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, EndpointPool
+
+
+class TestCircuitBreaker:
+    """Test breaker state transitions."""
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+        breaker.record_failure()
+        assert breaker.state == CLOSED
+        breaker.record_failure()
+        assert breaker.state == OPEN
+        assert not breaker.allow()
+
+    def test_half_open_allows_single_probe(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        assert breaker.allow()
+        assert breaker.state == HALF_OPEN
+        assert not breaker.allow()
+        breaker.record_success()
+        assert breaker.state == CLOSED
+
+    def test_failed_probe_reopens(self):
+        breaker = CircuitBreaker(failure_threshold=5, reset_timeout=0)
+        breaker.trip()
+        breaker.allow()
+        breaker.record_failure()
+        assert breaker.state == OPEN
+
+
+class TestEndpointPool:
+    """Test least-outstanding-requests selection."""
+
+    def test_picks_least_loaded(self):
+        pool = EndpointPool(["http://a/completion", "http://b/completion"])
+        first = pool.acquire()
+        second = pool.acquire()
+        assert first.url != second.url
+        pool.release(first, ok=True)
+        assert pool.acquire().url == first.url
+
+    def test_skips_open_breakers(self):
+        pool = EndpointPool(["http://a/completion", "http://b/completion"])
+        pool.report_health("http://a/completion", False)
+        for _ in range(3):
+            ep = pool.acquire()
+            assert ep.url == "http://b/completion"
+            pool.release(ep, ok=True)
+
+    def test_none_when_all_down(self):
+        pool = EndpointPool(["http://a/completion"])
+        pool.report_health("http://a/completion", False)
+        assert pool.acquire() is None
+        assert not pool.any_available()
+
+    def test_set_urls_keeps_breaker_state(self):
+        pool = EndpointPool(["http://a/completion"])
+        pool.report_health("http://a/completion", False)
+        pool.set_urls(["http://a/completion", "http://b/completion"])
+        states = {ep.url: ep.breaker.state for ep in pool.endpoints()}
+        assert states == {"http://a/completion": OPEN, "http://b/completion": CLOSED}
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return {"content": " ok "}
+
+
+class TestFailover:
+    """Test that run_model fails over between replicas."""
+
+    @pytest.fixture
+    def replicated(self, monkeypatch):
+        cfg = base.ModelConfig(
+            name="replicated",
+            url="http://dead/completion",
+            replicas=["http://alive/completion"],
+        )
+        monkeypatch.setitem(base.MODELS, "replicated", cfg)
+        yield cfg
+        base._pools.pop("replicated", None)
+
+    def test_connect_error_fails_over(self, monkeypatch, replicated):
+        attempts = []
+
+        def fake_post(url, **kwargs):
+            attempts.append(url)
+            if "dead" in url:
+                raise requests.ConnectionError("refused")
+            return FakeResponse()
+
+        monkeypatch.setattr(base._http, "post", fake_post)
+        result = base.run_model("replicated", "hi")
+        assert result["output"] == "ok"
+        assert attempts == ["http://dead/completion", "http://alive/completion"]
+
+    def test_all_replicas_down_is_offline(self, monkeypatch, replicated):
+        def refuse(url, **kwargs):
+            raise requests.ConnectionError("refused")
+
+        monkeypatch.setattr(base._http, "post", refuse)
+        assert base.run_model("replicated", "hi")["error"] == "MODEL_OFFLINE"
@@ -0,0 +1,161 @@
+"""
+Unit tests for hedged requests and fast failover.
+"""
+
+import threading
+import time
+
+import pytest
+
+import hedging
+from latency import LatencyTracker
+
+
+def fake_stream(delays, errors=None):
+    """Build a run_model_streaming stand-in: per-model first-token delay."""
+    errors = errors or {}
+
+    def run(model, prompt, on_token, cancel=None):
+        if model in errors:
+            return {"model": model, "output": "", "latency_ms": None, "error": errors[model]}
+        deadline = time.monotonic() + delays[model]
+        while time.monotonic() < deadline:
+            if cancel.cancelled:
+                return {"model": model, "output": "", "latency_ms": None, "error": "CANCELLED"}
+            time.sleep(0.01)
+        on_token(f"{model}!")
+        return {"model": model, "output": f"{model}!", "latency_ms": 1.0, "error": None}
+
+    return run
+
+
+@pytest.fixture
+def events(monkeypatch):
+    logged = []
+    monkeypatch.setattr(hedging, "log_system_event", lambda e, d=None: logged.append((e, d)))
+    monkeypatch.setattr(hedging, "print_status", lambda *a, **k: None)
+    monkeypatch.setattr(hedging, "HEDGE_DEFAULT_MS", 100.0)
+    monkeypatch.setattr(hedging, "LATENCY", LatencyTracker())
+    return logged
+
+
+class TestHedging:
+    """Test racing a slow primary against an alternate."""
+
+    def test_fast_primary_is_not_hedged(self, monkeypatch, events):
+        monkeypatch.setattr(hedging, "run_model_streaming", fake_stream({"qwen": 0.0, "deepseek": 0.0}))
+        tokens = []
+        result = hedging.run_hedged("qwen", "p", tokens.append, "deepseek", "q")
+        assert result["model"] == "qwen"
+        assert tokens == ["qwen!"]
+        assert events == []
+
+    def test_slow_primary_loses_to_alternate(self, monkeypatch, events):
+        monkeypatch.setattr(hedging, "run_model_streaming", fake_stream({"qwen": 2.0, "deepseek": 0.0}))
+        tokens = []
+        start = time.monotonic()
+        result = hedging.run_hedged("qwen", "p", tokens.append, "deepseek", "q")
+        assert time.monotonic() - start < 1.0
+        assert result["model"] == "deepseek"
+        assert tokens == ["deepseek!"]
+        event, details = events[0]
+        assert event == "HEDGE" and details["winner"] == "alternate"
+        assert details["time_saved_ms"] > 0
+
+    def test_failed_primary_fails_over_immediately(self, monkeypatch, events):
+        monkeypatch.setattr(hedging, "run_model_streaming",
+                            fake_stream({"deepseek": 0.0}, errors={"qwen": "MODEL_OFFLINE"}))
+        result = hedging.run_hedged("qwen", "p", None, "deepseek", "q")
+        assert result["model"] == "deepseek"
+        assert events[0][0] == "FALLBACK"
+        assert events[0][1]["failed_after_ms"] < 100
+
+    def test_primary_failing_mid_stream_does_not_fail_over(self, monkeypatch, events):
+        calls = []
+
+        def run(model, prompt, on_token, cancel=None):
+            calls.append(model)
+            on_token(f"partial-{model} ")
+            return {"model": model, "output": f"partial-{model} ", "latency_ms": None,
+                    "error": "TIMEOUT_IDLE"}
+
+        monkeypatch.setattr(hedging, "run_model_streaming", run)
+        tokens = []
+        result = hedging.run_hedged("qwen", "p", tokens.append, "deepseek", "q")
+        assert result["error"] == "TIMEOUT_IDLE" and result["model"] == "qwen"
+        assert tokens == ["partial-qwen "] and calls == ["qwen"]
+
+    def test_budget_tracks_observed_ttft(self, monkeypatch, events):
+        tracker = LatencyTracker()
+        for ms in [1000, 2000, 3000, 4000, 5000, 6000]:
+            tracker.record("qwen", "ttft", ms)
+        monkeypatch.setattr(hedging, "LATENCY", tracker)
+        assert hedging.hedge_budget_ms("qwen") == 6000
+
+    def test_cancel_aborts_all_attempts(self, monkeypatch, events):
+        seen = []
+
+        def run(model, prompt, on_token, cancel=None):
+            seen.append(cancel)
+            on_token("partial")
+            while not cancel.cancelled:
+                time.sleep(0.01)
+            return {"model": model, "output": "partial", "latency_ms": None, "error": "CANCELLED"}
+
+        monkeypatch.setattr(hedging, "run_model_streaming", run)
+        token = hedging.CancelToken()
+        threading.Timer(0.1, token.cancel).start()
+        result = hedging.run_hedged("qwen", "p", None, "deepseek", "q", cancel=token)
+        assert result["error"] == "CANCELLED"
+        assert result["output"] == "partial"
+        assert all(c.cancelled for c in seen)
+
+    def test_alternate_excludes_the_primary_replica(self, monkeypatch):
+        replicas = ["http://a/completion", "http://b/completion"]
+        monkeypatch.setattr(hedging.MODELS["qwen"], "replicas", replicas[1:])
+        monkeypatch.setattr(hedging.MODELS["qwen"], "url", replicas[0])
+        assert hedging.pick_alternate("qwen", "deepseek", exclude=[replicas[0]]) == "qwen"
+
+        pool = hedging.endpoint_pool("qwen")
+        for ep in pool.endpoints():
+            if ep.url == replicas[1]:
+                monkeypatch.setattr(ep.breaker, "state", "open")
+                monkeypatch.setattr(ep.breaker, "opened_at", time.monotonic())
+        # Only the slow primary's replica is up: hedge onto the other model instead
+        monkeypatch.setattr(hedging.endpoint_pool("deepseek"), "any_available", lambda exclude=(): True)
+        assert hedging.pick_alternate("qwen", "deepseek", exclude=[replicas[0]]) == "deepseek"
+
+    def test_replica_hedge_is_sent_elsewhere(self, monkeypatch, events):
+        calls = []
+
+        def run(model, prompt, on_token, cancel=None, exclude=()):
+            calls.append((model, list(exclude)))
+            if len(calls) == 1:
+                cancel.endpoint = "http://a/completion"
+                while not cancel.cancelled:
+                    time.sleep(0.01)
+                return {"model": model, "output": "", "latency_ms": None, "error": "CANCELLED"}
+            on_token("fast")
+            return {"model": model, "output": "fast", "latency_ms": 1.0, "error": None}
+
+        monkeypatch.setattr(hedging, "run_model_streaming", run)
+        monkeypatch.setattr(hedging, "pick_alternate", lambda m, f, exclude=(): m)
+        result = hedging.run_hedged("qwen", "p", None, "deepseek", "q")
+        assert result["output"] == "fast"
+        assert calls == [("qwen", []), ("qwen", ["http://a/completion"])]
+
+    def test_fallback_prompt_built_only_when_launched(self, monkeypatch, events):
+        prompts = []
+
+        def build():
+            prompts.append("built")
+            return "q"
+
+        monkeypatch.setattr(hedging, "run_model_streaming", fake_stream({"qwen": 0.0, "deepseek": 0.0}))
+        hedging.run_hedged("qwen", "p", None, "deepseek", build)
+        assert prompts == []
+
+        monkeypatch.setattr(hedging, "run_model_streaming",
+                            fake_stream({"deepseek": 0.0}, errors={"qwen": "MODEL_OFFLINE"}))
+        result = hedging.run_hedged("qwen", "p", None, "deepseek", build)
+        assert result["model"] == "deepseek" and prompts == ["built"]
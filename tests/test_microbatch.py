@@ -0,0 +1,132 @@
+"""
+Unit tests for multi-prompt requests and the micro-batching dispatcher.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import base
+from latency import LatencyTracker
+from microbatch import MicroBatcher
+
+
+class EchoResponse:
+    """A multi-prompt reply, in reverse order, each result tagged with its index."""
+    status_code = 200
+
+    def __init__(self, prompts):
+        self.prompts = prompts
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return [{"index": i, "content": f" {p.upper()} "}
+                for i, p in reversed(list(enumerate(self.prompts)))]
+
+
+def echo_send(sizes):
+    def send(model_name, prompts, max_tokens, priority):
+        sizes.append(len(prompts))
+        time.sleep(0.02)
+        return [{"model": model_name, "output": p.upper(), "latency_ms": 20.0,
+                 "queue_ms": 0.0, "error": None} for p in prompts]
+    return send
+
+
+class TestRunModelBatch:
+    """Test one request carrying several prompts."""
+
+    def test_results_follow_prompt_order(self, monkeypatch):
+        sent = []
+
+        def fake_post(url, json=None, **kwargs):
+            sent.append(json)
+            return EchoResponse(json["prompt"])
+
+        monkeypatch.setattr(base._http, "post", fake_post)
+        results = base.run_model_batch("qwen", ["a", "b", "c"], max_tokens=8)
+        assert [r["output"] for r in results] == ["A", "B", "C"]
+        assert len(sent) == 1 and sent[0]["prompt"] == ["a", "b", "c"]
+        assert sent[0]["n_predict"] == 8
+
+    def test_latency_recorded_under_its_own_key(self, monkeypatch):
+        tracker = LatencyTracker()
+        monkeypatch.setattr(base, "LATENCY", tracker)
+        monkeypatch.setattr(base._http, "post",
+                            lambda url, json=None, **k: EchoResponse(json["prompt"]))
+        base.run_model_batch("qwen", ["a", "b"])
+        assert tracker.count("qwen", "batch") == 1
+        assert tracker.count("qwen", "total") == 0
+
+
+class TestMicroBatcher:
+    """Test grouping concurrent requests and handing back results."""
+
+    def test_concurrent_requests_are_grouped(self):
+        sizes = []
+        batcher = MicroBatcher(window_ms=50, max_batch=4, send=echo_send(sizes))
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(lambda i: batcher.run("qwen", f"item {i}"), range(8)))
+        batcher.close()
+        assert [r["output"] for r in results] == [f"ITEM {i}" for i in range(8)]
+        assert sizes == [4, 4]
+        assert batcher.stats() == {"batches": 2, "requests": 8, "mean_batch": 4.0}
+
+    def test_lone_request_waits_one_window(self):
+        sizes = []
+        batcher = MicroBatcher(window_ms=30, max_batch=4, send=echo_send(sizes))
+        start = time.perf_counter()
+        result = batcher.run("qwen", "alone")
+        elapsed = time.perf_counter() - start
+        batcher.close()
+        assert result["batch_size"] == 1 and result["queue_ms"] >= 25
+        assert 0.045 <= elapsed < 0.2  # Window plus the 20ms request
+
+    def test_different_budgets_are_not_mixed(self):
+        sizes = []
+        batcher = MicroBatcher(window_ms=30, max_batch=4, send=echo_send(sizes))
+        futures = [batcher.submit("qwen", "short", 16), batcher.submit("qwen", "long", 256),
+                   batcher.submit("deepseek", "code", 16)]
+        assert [f.result()["batch_size"] for f in futures] == [1, 1, 1]
+        batcher.close()
+
+    def test_errors_reach_every_caller(self):
+        def broken(model_name, prompts, max_tokens, priority):
+            raise requests.ConnectionError("down")
+
+        batcher = MicroBatcher(window_ms=20, max_batch=2, send=broken)
+        futures = [batcher.submit("qwen", "a"), batcher.submit("qwen", "b")]
+        for future in futures:
+            with pytest.raises(requests.ConnectionError):
+                future.result()
+        batcher.close()
+        with pytest.raises(RuntimeError):
+            batcher.submit("qwen", "late")
+
+    def test_short_reply_fails_every_caller(self):
+        def short(model_name, prompts, max_tokens, priority):
+            return [{"model": model_name, "output": "x", "latency_ms": 1.0, "error": None}]
+
+        batcher = MicroBatcher(window_ms=50, max_batch=2, send=short)
+        futures = [batcher.submit("qwen", "a"), batcher.submit("qwen", "b")]
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result(timeout=2)
+        batcher.close()
+
+    def test_limits_read_when_created(self, monkeypatch):
+        monkeypatch.setenv("IGRIS_BATCH_WINDOW_MS", "5")  # Loaded from .env after import
+        monkeypatch.setenv("IGRIS_BATCH_SIZE", "8")
+        batcher = MicroBatcher(send=echo_send([]))
+        assert (batcher.window_ms, batcher.max_batch) == (5.0, 8)
+        batcher.close()
@@ -0,0 +1,87 @@
+"""
+Unit tests for the local BM25 document index.
+"""
+
+import os
+
+import pytest
+
+import orchestrator
+import rag
+from rag import build_index, chunk_text, open_index, retrieve, tokenize
+
+
+@pytest.fixture
+def docs(tmp_path, monkeypatch):
+    """A small doc tree and an empty index directory."""
+    root = tmp_path / "docs"
+    root.mkdir()
+    (root / "pool.py").write_text(
+        "class EndpointPool:\n"
+        "    '''Least outstanding requests load balancing across replicas.'''\n"
+    )
+    (root / "breaker.md").write_text("The circuit breaker opens after repeated failures.\n")
+    (root / "notes.txt").write_text("Lunch menu: soup, salad, bread.\n")
+    (root / "image.png").write_bytes(b"\x89PNG\0\0")
+    monkeypatch.setenv("IGRIS_RAG_INDEX", str(tmp_path / "index"))
+    return root
+
+
+class TestTokenize:
+    """Test term extraction and chunking."""
+
+    def test_identifiers_split_into_parts(self):
+        terms = tokenize("EndpointPool max_tokens the HTTP")
+        assert {"endpointpool", "endpoint", "pool", "max_tokens", "max", "tokens", "http"} <= set(terms)
+        assert "the" not in terms
+
+    def test_chunks_break_on_lines(self, monkeypatch):
+        monkeypatch.setattr(rag, "CHUNK_CHARS", 20)
+        chunks = chunk_text("line one\nline two\nline three\n")
+        assert [line for line, _ in chunks] == [1, 3]
+        assert "".join(text for _, text in chunks) == "line one\nline two\nline three\n"
+
+
+class TestIndex:
+    """Test incremental indexing and search."""
+
+    def test_search_ranks_matching_chunk_first(self, docs):
+        stats = build_index([docs])
+        assert stats["files"] == 3  # The .png is skipped
+        hits = open_index().search("replicas load balancing")
+        assert hits[0].path.endswith("pool.py")
+        assert hits[0].line == 1
+
+    def test_only_changed_files_are_reindexed(self, docs):
+        build_index([docs])
+        assert build_index([docs])["changed"] == 0
+
+        os.utime(docs / "notes.txt")  # mtime moved, content identical
+        assert build_index([docs])["changed"] == 0
+
+        (docs / "breaker.md").write_text("Half-open breakers allow a single probe request.\n")
+        (docs / "notes.txt").unlink()
+        stats = build_index([docs])
+        assert (stats["changed"], stats["removed"]) == (1, 1)
+        assert open_index().search("probe")[0].path.endswith("breaker.md")
+        assert open_index().search("lunch soup") == []
+
+    def test_retrieve_respects_token_budget(self, docs):
+        build_index([docs])
+        assert len(retrieve("circuit breaker replicas balancing", budget_tokens=1000)) == 2
+        assert len(retrieve("circuit breaker replicas balancing", budget_tokens=30)) == 1
+        assert retrieve("circuit breaker", budget_tokens=1) == []
+
+    def test_no_index_means_no_context(self, docs):
+        assert retrieve("anything") == []
+        prompt = orchestrator.build_prompt("write a function", "deepseek")
+        assert "Relevant local files" not in prompt
+
+    def test_deepseek_prompt_includes_snippets(self, docs):
+        build_index([docs])
+        prompt = orchestrator.build_prompt("explain the circuit breaker failures", "deepseek")
+        assert "--- " in prompt and "breaker.md:1" in prompt
+        assert prompt.index("circuit breaker opens") < prompt.index("Task:")
+        bare = orchestrator.build_prompt("explain the circuit breaker", "deepseek",
+                                         include_context=False)
+        assert "Relevant local files" not in bare
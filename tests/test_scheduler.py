@@ -0,0 +1,128 @@
+"""
+Unit tests for RAM/CPU-budgeted request scheduling.
+"""
+
+import threading
+import time
+
+import base
+from scheduler import BATCH, INTERACTIVE, Scheduler
+
+
+def acquire_async(scheduler, *args, **kwargs):
+    """Start acquire() on a thread; returns (thread, result list)."""
+    out = []
+    thread = threading.Thread(target=lambda: out.append(scheduler.acquire(*args, **kwargs)))
+    thread.start()
+    time.sleep(0.05)
+    return thread, out
+
+
+class TestScheduler:
+    """Test admission, queueing and priorities."""
+
+    def test_queues_when_over_cpu_budget(self):
+        scheduler = Scheduler(ram_mb=16000, cpu_threads=8)
+        first = scheduler.acquire("qwen", 2600, 6)
+        thread, out = acquire_async(scheduler, "deepseek", 4800, 8)
+        assert not out  # 6 + 8 threads would oversubscribe 8 cores
+        scheduler.release(first)
+        thread.join(1)
+        assert out[0].granted and out[0].queue_ms >= 40
+        assert first.queue_ms < 40
+
+    def test_ram_counted_once_per_model(self):
+        scheduler = Scheduler(ram_mb=5000, cpu_threads=32)
+        grants = [scheduler.acquire("qwen", 3000, 1) for _ in range(3)]
+        assert scheduler.snapshot()["ram_used_mb"] == 3000
+        thread, out = acquire_async(scheduler, "deepseek", 4800, 1)
+        assert not out
+        for grant in grants:
+            scheduler.release(grant)
+        thread.join(1)
+        assert scheduler.snapshot()["ram_used_mb"] == 4800
+
+    def test_same_model_requests_share_its_threads(self):
+        scheduler = Scheduler(ram_mb=16000, cpu_threads=8)
+        first = scheduler.acquire("qwen", 2600, 6)
+        thread, out = acquire_async(scheduler, "qwen", 2600, 6, BATCH)
+        thread.join(1)
+        assert out[0].granted  # Same server, same -t threads: admitted together
+        assert scheduler.snapshot()["cpu_used"] == 6
+        scheduler.release(first)
+        scheduler.release(out[0])
+        assert scheduler.snapshot()["cpu_used"] == 0
+
+    def test_interactive_before_batch(self):
+        scheduler = Scheduler(ram_mb=None, cpu_threads=4)
+        running = scheduler.acquire("qwen", 0, 4)
+        order = []
+
+        def wait(priority, name):
+            grant = scheduler.acquire(name, 0, 4, priority)
+            order.append(name)
+            time.sleep(0.1)
+            scheduler.release(grant)
+
+        threads = [threading.Thread(target=wait, args=(BATCH, "batch")),
+                   threading.Thread(target=wait, args=(INTERACTIVE, "repl"))]
+        for t in threads:
+            t.start()
+            time.sleep(0.05)
+        scheduler.release(running)
+        for t in threads:
+            t.join(1)
+        assert order == ["repl", "batch"]
+
+    def test_batch_does_not_overtake_blocked_interactive(self):
+        scheduler = Scheduler(ram_mb=None, cpu_threads=8)
+        running = scheduler.acquire("qwen", 0, 4)
+        t1, interactive = acquire_async(scheduler, "deepseek", 0, 6, INTERACTIVE)
+        t2, batch = acquire_async(scheduler, "qwen", 0, 2, BATCH)
+        assert not interactive and not batch  # Batch would fit, but must not jump ahead
+        scheduler.release(running)
+        t1.join(1)
+        assert interactive[0].granted
+        scheduler.release(interactive[0])
+        t2.join(1)
+        assert batch[0].granted
+
+    def test_resident_model_batch_cannot_starve_interactive(self):
+        scheduler = Scheduler(ram_mb=None, cpu_threads=4)
+        held = scheduler.acquire("qwen", 0, 4, BATCH)
+        t1, interactive = acquire_async(scheduler, "deepseek", 0, 4, INTERACTIVE)
+        # Batch work for the running model keeps arriving; none of it is admitted
+        batches = [acquire_async(scheduler, "qwen", 0, 4, BATCH) for _ in range(3)]
+        assert not interactive and not any(out for _, out in batches)
+        scheduler.release(held)
+        t1.join(1)
+        assert interactive[0].granted and not any(out for _, out in batches)
+        scheduler.release(interactive[0])
+        for thread, out in batches:
+            thread.join(1)
+            scheduler.release(out[0])
+
+    def test_oversized_request_runs_alone(self):
+        scheduler = Scheduler(ram_mb=1000, cpu_threads=2)
+        grant = scheduler.acquire("deepseek", 4800, 8)
+        assert grant.granted
+        scheduler.release(grant)
+
+    def test_cancel_while_queued(self):
+        scheduler = Scheduler(ram_mb=None, cpu_threads=1)
+        running = scheduler.acquire("qwen", 0, 1)
+        cancel = threading.Event()
+        thread, out = acquire_async(scheduler, "deepseek", 0, 1, cancelled=cancel.is_set)
+        cancel.set()
+        thread.join(1)
+        assert out == [None]
+        assert scheduler.snapshot()["queued"] == 0
+        scheduler.release(running)
+
+    def test_streaming_reports_queue_time(self, monkeypatch):
+        monkeypatch.setattr(base, "SCHEDULER", Scheduler(ram_mb=None, cpu_threads=64))
+        monkeypatch.setattr(base, "_stream", lambda *a: {
+            "model": "qwen", "output": "hi", "latency_ms": 5.0, "error": None})
+        result = base.run_model_streaming("qwen", "p", lambda t: None, priority=BATCH)
+        assert result["latency_ms"] == 5.0
+        assert result["queue_ms"] is not None
@@ -0,0 +1,116 @@
+"""
+Unit tests for the multi-session conversation store.
+"""
+
+import asyncio
+import threading
+
+import pytest
+
+import base
+import orchestrator
+import sessions
+from sessions import Session, SessionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SessionStore(tmp_path / "sessions", max_sessions=2, slots=2)
+
+
+class TestSession:
+    """Test history trimming and summaries."""
+
+    def test_old_turns_move_into_summary(self):
+        session = Session("s")
+        for i in range(sessions.MAX_HISTORY + 2):
+            session.add_turn(f"question {i}", f"answer {i}")
+        assert len(session.turns()) == sessions.MAX_HISTORY
+        assert session.summary == "question 0; question 1"
+
+    def test_prompts_do_not_mix_sessions(self, store):
+        alice, bob = store.get("alice"), store.get("bob")
+        orchestrator.add_to_history(alice, "my name is Alice", "Nice to meet you, Alice!")
+        assert "Alice" in orchestrator.build_prompt("who am I?", "qwen", alice)
+        assert "Alice" not in orchestrator.build_prompt("who am I?", "qwen", bob)
+        assert "Alice" not in orchestrator.build_prompt("who am I?", "qwen")
+
+
+class TestSessionStore:
+    """Test LRU eviction, persistence and slots."""
+
+    def test_lru_sessions_spill_to_disk(self, store, tmp_path):
+        store.get("a").add_turn("hello there", "hi, how can I help?")
+        store.get("b")
+        store.get("c")  # Evicts "a", the least recently used
+        assert store.ids() == ["b", "c"]
+        assert (tmp_path / "sessions" / "a.json").exists()
+
+        restored = store.get("a")
+        assert restored.turns() == [("hello there", "hi, how can I help?")]
+        assert not (tmp_path / "sessions" / "a.json").exists()
+
+    def test_sessions_in_use_are_not_evicted(self, store):
+        with store.use("a") as a:
+            store.get("b")
+            store.get("c")
+            store.get("d")
+            assert "a" in store.ids()
+            a.add_turn("still here?", "yes, still here")
+        assert len(store) == 2
+        assert store.get("a").turns() == [("still here?", "yes, still here")]
+
+    def test_slots_spread_over_sessions(self, store):
+        assert {store.get("a").slot, store.get("b").slot} == {0, 1}
+
+    def test_settings_read_at_first_use(self, tmp_path, monkeypatch):
+        shared = SessionStore()  # Created at import, before .env is loaded
+        monkeypatch.setenv("IGRIS_SESSION_DIR", str(tmp_path / "spill"))
+        monkeypatch.setenv("IGRIS_SLOTS", "3")
+        assert shared.directory == tmp_path / "spill" and shared.slots == 3
+
+    def test_rejects_unsafe_ids(self, store):
+        with pytest.raises(ValueError):
+            store.get("../etc/passwd")
+
+    def test_concurrent_and_async_access(self, store):
+        def worker(n):
+            for i in range(50):
+                store.get(f"s{(n + i) % 5}").add_turn(f"q{i}", "a long enough answer")
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert len(store) == 2
+        assert asyncio.run(store.aget("s0")).id == "s0"
+
+
+class TestSessionCache:
+    """Test the response cache across sessions."""
+
+    def test_identical_prompts_share_the_cache(self, monkeypatch):
+        calls = []
+
+        def fake(model, prompt, on_token, **kwargs):
+            calls.append(prompt)
+            return {"model": model, "output": "Hi there.", "latency_ms": 1.0, "error": None}
+
+        monkeypatch.setattr(orchestrator, "run_hedged", fake)
+        monkeypatch.setattr(orchestrator, "log_request", lambda **k: None)
+        monkeypatch.setattr(orchestrator, "STREAMING_ENABLED", False)
+        base.clear_cache()
+        for session_id in ("alice", "bob"):
+            assert orchestrator.orchestrate("hello", session_id=session_id) == "Hi there."
+        assert len(calls) == 1  # Same prompt (no history yet), one generation
+        assert orchestrator.orchestrate("hello again", session_id="alice") == "Hi there."
+        assert len(calls) == 2  # Alice's history makes her prompt differ
+        for session_id in ("alice", "bob"):
+            orchestrator.SESSIONS.drop(session_id)
+        base.clear_cache()
+
+    def test_slot_pins_request(self):
+        payload = {}
+        base._pin_slot(payload, 1)
+        assert payload == {"id_slot": 1, "cache_prompt": True}
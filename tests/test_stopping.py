@@ -0,0 +1,80 @@
+"""
+Unit tests for client-side stop detection and generation budgets.
+"""
+
+from orchestrator import choose_n_predict
+from stopping import StopDetector
+
+
+def feed_all(detector, tokens):
+    for i, token in enumerate(tokens):
+        if detector.feed(token):
+            return i
+    return None
+
+
+class TestStopDetector:
+    """Test each end-of-answer condition."""
+
+    def test_closed_code_fence(self):
+        detector = StopDetector(code_only=True)
+        tokens = ["```py", "thon\n", "print(1)\n", "``", "`\n", "Explanation..."]
+        assert feed_all(detector, tokens) == 4
+        assert detector.output() == "```python\nprint(1)\n```"
+
+    def test_fence_not_required_for_plain_code(self):
+        detector = StopDetector(code_only=True)
+        assert feed_all(detector, ["x = 1\n", "y = 2\n"]) is None
+
+    def test_stop_pattern_split_across_tokens(self):
+        detector = StopDetector(patterns=[r"\nUser:"])
+        assert feed_all(detector, ["Sure thing.", "\nUs", "er: next"]) == 2
+        assert detector.output() == "Sure thing."
+        assert detector.kept("er: next") == ""
+
+    def test_line_loop(self):
+        detector = StopDetector()
+        tokens = ["intro\n"] + ["the same line again\n"] * 10
+        assert feed_all(detector, tokens) is not None
+        assert detector.reason == "REPETITION"
+        assert detector.output() == "intro\nthe same line again\n"
+
+    def test_span_loop(self):
+        detector = StopDetector()
+        feed_all(detector, ["ok "] + ["na "] * 100)
+        assert detector.reason == "REPETITION"
+        assert detector.output() == "ok na "
+
+    def test_identical_rows_in_code_are_kept(self):
+        detector = StopDetector()
+        rows = ["    [0, 0, 0, 0, 0, 0],\n"] * 10
+        tokens = ["Here:\n", "```python\n", "grid = [\n"] + rows + ["]\n", "```\n"]
+        assert feed_all(detector, tokens) is None
+        assert detector.output() == "".join(tokens)
+
+    def test_long_loop_in_code_is_still_cut(self):
+        detector = StopDetector()
+        tokens = ["```python\n"] + ["print('again and again')\n"] * 60
+        assert feed_all(detector, tokens) is not None
+        assert detector.output() == "```python\nprint('again and again')\n"
+
+    def test_normal_text_runs_to_completion(self):
+        detector = StopDetector(patterns=[r"\nUser:"], code_only=True)
+        text = "Recursion is when a function calls itself.\nIt needs a base case.\n"
+        assert feed_all(detector, list(text)) is None
+        assert detector.output() == text
+
+
+class TestNPredict:
+    """Test per-request generation budgets."""
+
+    def test_short_chat_gets_small_budget(self):
+        assert choose_n_predict("hey", "qwen", "general") == 64
+
+    def test_explanations_get_full_budget(self):
+        assert choose_n_predict("explain how TCP handshakes work", "qwen", "general") == 256
+
+    def test_code_budget_scales_with_task(self):
+        assert choose_n_predict("hello world in rust code", "deepseek", "code") == 384
+        long_task = "implement a python class " + "with many requirements " * 10
+        assert choose_n_predict(long_task, "deepseek", "code") == 1024
@@ -0,0 +1,117 @@
+"""
+Unit tests for the backend supervisor, run against scripts/mock_server.py.
+"""
+
+import socket
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import base
+import supervisor
+from supervisor import READY, STOPPED, Supervisor
+
+MOCK_SERVER = [sys.executable, str(Path(supervisor.__file__).with_name("mock_server.py"))]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+@pytest.fixture
+def stub_model(monkeypatch, tmp_path):
+    """Register mock-backed models; returns a factory taking ModelConfig overrides."""
+    monkeypatch.setattr(supervisor, "log_system_event", lambda *a, **k: None)
+    monkeypatch.setattr(supervisor, "LOG_DIR", tmp_path)
+
+    def make(name: str = "stub", **overrides) -> str:
+        cfg = base.ModelConfig(
+            name=name,
+            url=f"http://127.0.0.1:{free_port()}/completion",
+            model_path="models/stub.gguf",
+            **overrides,
+        )
+        monkeypatch.setitem(base.MODELS, name, cfg)
+        return name
+    return make
+
+
+@pytest.fixture
+def sup():
+    instance = Supervisor(command=list(MOCK_SERVER), cores=8, interval=0.05).start()
+    yield instance
+    instance.shutdown()
+
+
+class TestSupervisor:
+    """Test lazy start, idle unload, crash restart and thread allocation."""
+
+    def test_starts_on_first_request(self, stub_model, sup):
+        name = stub_model()
+        assert sup.is_unloaded(base.MODELS[name].url)
+        result = base.run_model_streaming(name, "hi", lambda t: None, max_tokens=4)
+        assert result["error"] is None
+        assert result["output"] == "Hello from the mock"
+        assert sup.backend(name).state == READY
+
+    def test_unmanaged_models_are_left_alone(self, monkeypatch, sup):
+        monkeypatch.setitem(base.MODELS, "qwen", base.ModelConfig(name="qwen", url="http://x/"))
+        assert sup.ensure("qwen")
+        assert "qwen" not in sup.status()
+
+    def test_unloads_when_idle(self, stub_model, sup):
+        name = stub_model(idle_unload=0.2)
+        assert sup.ensure(name)
+        proc = sup.backend(name).proc
+        assert wait_for(lambda: sup.backend(name).state == STOPPED)
+        assert proc.poll() is not None
+        assert sup.ensure(name)  # Comes back on the next request
+
+    def test_restarts_after_crash(self, stub_model, sup):
+        name = stub_model()
+        assert sup.ensure(name)
+        first = sup.backend(name).proc
+        first.kill()
+        assert wait_for(lambda: sup.backend(name).state == READY
+                        and sup.backend(name).proc is not first)
+
+    def test_threads_split_by_weight(self, stub_model, sup):
+        small = stub_model("small", cpu_weight=1.0)
+        large = stub_model("large", cpu_weight=3.0)
+        assert sup.ensure(small)
+        assert sup.backend(small).threads == 8  # Alone: every core
+        assert sup.ensure(large)
+        assert sup.backend(large).threads == 6
+        # The first backend is restarted with its share once idle
+        assert wait_for(lambda: sup.backend(small).threads == 2
+                        and sup.backend(small).state == READY)
+
+    def test_survivor_grows_back_after_unload(self, stub_model, sup):
+        small = stub_model("small", cpu_weight=1.0)
+        large = stub_model("large", cpu_weight=3.0, idle_unload=0.3)
+        assert sup.ensure(small)
+        assert sup.ensure(large)
+        assert wait_for(lambda: sup.backend(small).threads == 2
+                        and sup.backend(small).state == READY)
+        assert wait_for(lambda: sup.backend(large).state == STOPPED)
+        assert wait_for(lambda: sup.backend(small).threads == 8
+                        and sup.backend(small).state == READY)
+
+    def test_command_read_at_start_up(self, monkeypatch):
+        monkeypatch.setenv("LLAMA_SERVER", "python scripts/mock_server.py")  # As .env sets it
+        assert Supervisor().command == ["python", "scripts/mock_server.py"]
+        monkeypatch.delenv("LLAMA_SERVER")
+        assert Supervisor().command == [supervisor.DEFAULT_LLAMA_SERVER]
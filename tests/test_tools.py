@@ -0,0 +1,199 @@
+"""
+Unit tests for tool calling.
+"""
+
+import json
+import time
+
+import pytest
+
+import base
+import orchestrator
+import tools
+from tools import TOOLS, ToolCall, execute, format_results, parse_tool_calls, run_with_tools
+
+
+@pytest.fixture(autouse=True)
+def scratch_tools():
+    before = dict(TOOLS)
+    tools.clear_memo()
+    base.clear_cache()
+    yield
+    TOOLS.clear()
+    TOOLS.update(before)
+    tools.clear_memo()
+    base.clear_cache()
+
+
+def call_block(name, **arguments):
+    return f"<tool_call>\n{json.dumps({'name': name, 'arguments': arguments})}\n</tool_call>"
+
+
+class TestParsing:
+    """Test reading tool calls from model output."""
+
+    def test_several_calls_in_order(self):
+        text = ("Let me check.\n" + call_block("calculate", expression="2+2")
+                + "\n" + call_block("current_time"))
+        calls = parse_tool_calls(text)
+        assert [c.name for c in calls] == ["calculate", "current_time"]
+        assert calls[0].arguments == {"expression": "2+2"}
+        assert parse_tool_calls("no tools needed") == []
+
+    def test_unclosed_and_malformed_blocks(self):
+        assert parse_tool_calls('<tool_call>{"name": "current_time"}')[0].name == "current_time"
+        bad = parse_tool_calls("<tool_call>{not json}</tool_call>")
+        assert bad[0].error and execute(bad)[0].ok is False
+
+    def test_list_of_calls_in_one_block(self):
+        text = '<tool_call>[{"name": "current_time"}, {"name": "calculate", ' \
+               '"arguments": {"expression": "1+1"}}, 3]'
+        calls = parse_tool_calls(text)
+        assert [c.name for c in calls] == ["current_time", "calculate", "?"]
+        assert calls[2].error
+
+
+class TestExecution:
+    """Test concurrent execution, timeouts and memoization."""
+
+    def test_calls_run_concurrently(self):
+        @tools.tool()
+        def nap(seconds: float) -> str:
+            time.sleep(seconds)
+            return f"slept {seconds}"
+
+        start = time.perf_counter()
+        results = execute([ToolCall("nap", {"seconds": 0.3 + i / 100}) for i in range(4)])
+        elapsed = time.perf_counter() - start
+        assert [r.content for r in results] == [f"slept {0.3 + i / 100}" for i in range(4)]
+        assert elapsed < 0.6  # One after another would take over 1.2s
+
+    def test_timeouts_and_errors_are_results(self):
+        @tools.tool(timeout=0.1)
+        def stuck() -> str:
+            time.sleep(0.5)
+            return "late"
+
+        results = execute([ToolCall("stuck"), ToolCall("calculate", {"expression": "1/0"}),
+                           ToolCall("calculate", {"wrong": 1}), ToolCall("missing")])
+        assert not any(r.ok for r in results)
+        assert "timed out" in results[0].content
+        assert "ZeroDivisionError" in results[1].content
+        assert "bad arguments" in results[2].content
+        assert "unknown tool" in results[3].content
+
+    def test_pure_results_are_memoized(self):
+        runs = []
+
+        @tools.tool(pure=True)
+        def square(x: int) -> int:
+            runs.append(x)
+            return x * x
+
+        first = execute([ToolCall("square", {"x": 7}), ToolCall("square", {"x": 7})])
+        second = execute([ToolCall("square", {"x": 7})])
+        assert [r.content for r in first + second] == ["49", "49", "49"]
+        assert runs == [7]  # Duplicates in a batch share a run; later batches hit the memo
+        assert second[0].cached
+
+    def test_calculator_is_restricted(self):
+        assert execute([ToolCall("calculate", {"expression": "sqrt(16) + 2**10"})])[0].content == "1028.0"
+        huge_product = " * ".join(["10**999"] * 5)
+        for expression in ("__import__('os')", "9**9**9", "(1).real", "factorial(10**7)",
+                           "pow(pow(10, 999), 999)", "(10**999)**5", huge_product):
+            start = time.perf_counter()
+            assert not execute([ToolCall("calculate", {"expression": expression})])[0].ok
+            assert time.perf_counter() - start < 1.0
+
+    def test_read_file_is_capped_and_denies_secrets(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(tools, "ROOT", tmp_path)
+        monkeypatch.setattr(tools, "MAX_READ_BYTES", 100)
+        (tmp_path / ".env").write_text("API_KEY=secret\n")
+        (tmp_path / "big.txt").write_text("".join(f"line {i}\n" for i in range(1000)))
+        denied = execute([ToolCall("read_file", {"path": ".env"})])[0]
+        assert not denied.ok and "secret" not in denied.content
+        assert not execute([ToolCall("read_file", {"path": ".git/config"})])[0].ok
+        text = execute([ToolCall("read_file", {"path": "big.txt", "count": 1000})])[0].content
+        assert "line 5" in text and "line 50" not in text
+
+        (tmp_path / "server.pem").write_text("key")
+        (tmp_path / "credentials.json").write_text("{}")
+        listed = execute([ToolCall("list_files")])[0].content
+        assert json.loads(listed) == ["big.txt"]
+        assert not execute([ToolCall("list_files", {"path": ".git"})])[0].ok
+
+
+class TestLoop:
+    """Test feeding results back to the model."""
+
+    def test_results_extend_the_prompt(self):
+        prompts = []
+        outputs = iter([call_block("calculate", expression="6*7"), "It is 42."])
+
+        def generate(model, prompt):
+            prompts.append(prompt)
+            return {"model": model, "output": next(outputs), "latency_ms": 1.0, "error": None}
+
+        result = run_with_tools("qwen", "<|im_start|>assistant\n", generate)
+        assert result["output"] == "It is 42."
+        assert result["cacheable"] and result["tool_calls"][0]["name"] == "calculate"
+        # The previous prompt and output are an unchanged prefix of the next prompt
+        assert prompts[1].startswith(prompts[0] + call_block("calculate", expression="6*7"))
+        assert prompts[1].endswith("<|im_start|>assistant\n")
+        assert '"content": "42"' in prompts[1]
+
+    def test_stop_sequence_closes_the_block(self):
+        prompts = []
+        # The server stops at </tool_call> and leaves it out of the output
+        outputs = iter(['<tool_call>\n{"name": "calculate", "arguments": {"expression": "6*7"}}',
+                        "It is 42."])
+
+        def generate(model, prompt):
+            prompts.append(prompt)
+            return {"model": model, "output": next(outputs), "latency_ms": 1.0, "error": None}
+
+        run_with_tools("qwen", "", generate)
+        assert prompts[1].startswith(call_block("calculate", expression="6*7"))
+        options = orchestrator.request_options("hi", "qwen", "qwen", tools=True)
+        assert options["stop"] == [tools.TOOL_CALL_END]
+        assert "stop" not in orchestrator.request_options("hi", "qwen", "qwen")
+
+    def test_tool_answers_through_orchestrate(self, monkeypatch):
+        @tools.tool()
+        def weather(city: str) -> str:
+            return f"Sunny in {city}"
+
+        seen = {}
+        monkeypatch.setattr(orchestrator, "run_hedged", lambda model, prompt, on_token, **k: {
+            "model": model, "output": call_block("weather", city="Oslo"),
+            "latency_ms": 1.0, "error": None})
+
+        def follow_up(model, prompt, on_token, **kwargs):
+            seen["prompt"] = prompt
+            return {"model": model, "output": "It's sunny.", "latency_ms": 1.0, "error": None}
+
+        monkeypatch.setattr(orchestrator, "run_model_streaming", follow_up)
+        monkeypatch.setattr(orchestrator, "log_request", lambda **k: None)
+        monkeypatch.setattr(orchestrator, "STREAMING_ENABLED", False)
+        monkeypatch.setattr(orchestrator, "TOOLS_ENABLED", True)
+        output = orchestrator.orchestrate("what's the weather in oslo", session_id="tools-test")
+        assert output == "It's sunny."
+        assert "Sunny in Oslo" in seen["prompt"] and "# Tools" in seen["prompt"]
+        # weather() isn't pure, so the answer isn't cached
+        prompt = orchestrator.build_prompt("what's the weather in oslo", "qwen",
+                                           include_tools=True)
+        assert base.get_cached("qwen", prompt) is None
+        orchestrator.SESSIONS.drop("tools-test")
+
+    def test_enabled_from_env_until_toggled(self, monkeypatch):
+        monkeypatch.setattr(orchestrator, "TOOLS_ENABLED", None)
+        monkeypatch.setenv("IGRIS_TOOLS", "1")  # Loaded from .env after import
+        assert orchestrator.tools_enabled()
+        monkeypatch.setattr(orchestrator, "TOOLS_ENABLED", False)  # /tools
+        assert not orchestrator.tools_enabled()
+
+    def test_formats(self):
+        results = execute([ToolCall("calculate", {"expression": "1+1"})])
+        assert format_results("qwen", results).startswith("<|im_end|>\n<|im_start|>user\n")
+        assert format_results("deepseek", results) == (
+            '\n<tool_response>\n{"name": "calculate", "content": "2"}\n</tool_response>\n')
@@ -0,0 +1,103 @@
+"""
+Unit tests for span tracing and Chrome trace export.
+"""
+
+import json
+import threading
+import time
+
+import orchestrator
+from tracing import Tracer, TRACER
+
+
+class TestTracer:
+    """Test span collection and export."""
+
+    def test_disabled_tracer_records_nothing(self):
+        tracer = Tracer()
+        with tracer.span("a"):
+            pass
+        tracer.record("b", time.perf_counter())
+        assert tracer.span("a") is tracer.span("b")  # Shared no-op context
+        assert tracer.events() == []
+
+    def test_spans_across_threads_export_as_chrome_trace(self, tmp_path):
+        tracer = Tracer()
+        tracer.enable()
+        with tracer.span("turn", session="s"):
+            with tracer.span("inner"):
+                time.sleep(0.01)
+            worker = threading.Thread(target=lambda: tracer.record("remote", time.perf_counter()),
+                                      name="worker")
+            worker.start()
+            worker.join()
+            tracer.instant("first_token")
+
+        trace = json.loads(tracer.export_chrome(tmp_path / "trace.json").read_text())
+        events = {e["name"]: e for e in trace["traceEvents"]}
+        assert events["turn"]["ph"] == "X" and events["turn"]["args"] == {"session": "s"}
+        assert events["inner"]["dur"] >= 10_000  # Microseconds
+        assert events["turn"]["ts"] <= events["inner"]["ts"]
+        assert events["remote"]["tid"] != events["turn"]["tid"]
+        assert events["first_token"]["ph"] == "i"
+        names = [e["args"]["name"] for e in trace["traceEvents"] if e["ph"] == "M"]
+        assert "worker" in names
+
+    def test_breakdown_covers_last_turn(self):
+        tracer = Tracer()
+        tracer.enable()
+        with tracer.span("turn"):
+            with tracer.span("old"):
+                pass
+        with tracer.span("turn"):
+            with tracer.span("route"):
+                pass
+            with tracer.span("generate"):
+                pass
+        assert [name for name, _ in tracer.breakdown()] == ["turn", "route", "generate"]
+        assert Tracer().breakdown() == []
+
+    def test_breakdown_leaves_out_other_threads(self):
+        tracer = Tracer()
+        tracer.enable()
+        release = threading.Event()
+
+        def background():
+            release.wait(1)
+            tracer.record("health_check", time.perf_counter())
+
+        with tracer.trace(), tracer.span("turn"):
+            trace_id = tracer.current()
+
+            def helper():
+                with tracer.bind(trace_id), tracer.span("hedge"):
+                    pass
+
+            threads = [threading.Thread(target=background), threading.Thread(target=helper)]
+            for thread in threads:
+                thread.start()
+            release.set()
+            for thread in threads:
+                thread.join(1)
+        assert [name for name, _ in tracer.breakdown()] == ["turn", "hedge"]
+
+
+class TestOrchestratorTracing:
+    """Test that a turn is broken down into stages."""
+
+    def test_turn_stages(self, monkeypatch):
+        monkeypatch.setattr(orchestrator, "run_model_coalesced", lambda *a, **k: {
+            "model": "qwen", "output": "hi there, nice to meet you", "latency_ms": 5.0,
+            "queue_ms": 0.0, "error": None})
+        monkeypatch.setattr(orchestrator, "log_request", lambda **k: None)
+        monkeypatch.setattr(orchestrator, "STREAMING_ENABLED", False)
+        TRACER.clear()
+        TRACER.enable()
+        try:
+            orchestrator.orchestrate("hello tracing", session_id="tracing-test")
+        finally:
+            TRACER.disable()
+        stages = [name for name, _ in TRACER.breakdown()]
+        TRACER.clear()
+        assert stages == ["turn", "fast_route", "build_prompt", "cache_lookup",
+                          "generate", "render", "log"]
@@ -0,0 +1,113 @@
+"""
+Unit tests for embedding search and hybrid retrieval.
+"""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import rag
+import vectors
+from mock_server import embed
+from rag import build_index
+from vectors import VectorIndex, build_vectors, retrieve, write_vectors
+
+
+def fake_embed(calls):
+    """Embedding function backed by the mock server's hashed bag of words."""
+    def run(texts):
+        calls.append(len(texts))
+        return [embed(t, 64) for t in texts]
+    return run
+
+
+@pytest.fixture
+def docs(tmp_path, monkeypatch):
+    root = tmp_path / "docs"
+    root.mkdir()
+    (root / "pool.py").write_text("Least outstanding requests balancing across replicas.\n")
+    (root / "breaker.md").write_text("The circuit breaker opens after repeated failures.\n")
+    monkeypatch.setenv("IGRIS_RAG_INDEX", str(tmp_path / "index"))
+    monkeypatch.setattr(vectors, "_query_cache", {})
+    return root
+
+
+class TestSearch:
+    """Test brute-force and IVF search over a stored matrix."""
+
+    def test_brute_force_matches_numpy(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(vectors, "SEARCH_BLOCK", 64)  # Several blocks to merge
+        rng = np.random.default_rng(1)
+        data = vectors._normalize(rng.standard_normal((300, 16)).astype(np.float32))
+        index = VectorIndex(write_vectors(tmp_path, data, [], {}))
+        queries = rng.standard_normal((5, 16)).astype(np.float32)
+
+        ids, sims = index.search(queries, k=7)
+        stored = np.asarray(index.matrix, dtype=np.float32)
+        expected = np.argsort(-(vectors._normalize(queries) @ stored.T), axis=1)[:, :7]
+        assert (ids == expected).all()
+        assert (np.diff(sims, axis=1) <= 0).all()
+
+    def test_ivf_recall_on_clustered_data(self, tmp_path):
+        rng = np.random.default_rng(2)
+        points = vectors._clustered(4050, 32, 40, rng)
+        index = VectorIndex(write_vectors(tmp_path, points[:4000], [], {}, ivf=True))
+        assert index.ivf
+
+        found = exact = 0
+        for q in points[4000:]:
+            approx = set(index.search(q, 10)[0][0])
+            truth = set(index.search(q, 10, exact=True)[0][0])
+            found += len(approx & truth)
+            exact += len(truth)
+        assert found / exact >= 0.9
+
+
+class TestHybridRetrieval:
+    """Test vector index builds and fusion with BM25."""
+
+    def test_unchanged_chunks_are_not_reembedded(self, docs):
+        build_index([docs])
+        calls = []
+        stats = build_vectors(embed=fake_embed(calls))
+        assert (stats["chunks"], stats["embedded"]) == (2, 2)
+
+        (docs / "notes.txt").write_text("Lunch menu: soup, salad, bread.\n")
+        build_index([docs])
+        stats = build_vectors(embed=fake_embed(calls))
+        assert (stats["embedded"], stats["reused"]) == (1, 2)
+        assert calls == [2, 1]
+
+    def test_unreachable_embedder_leaves_index_unchanged(self, docs):
+        build_index([docs])
+        assert "error" in build_vectors(embed=lambda texts: None)
+        assert vectors.open_vectors() is None
+
+    def test_vector_hits_fused_with_bm25(self, docs, monkeypatch):
+        build_index([docs])
+        build_vectors(embed=fake_embed([]))
+        monkeypatch.setattr(vectors, "_embed_query", lambda q: np.asarray(embed(q, 64)))
+        both = retrieve("circuit breaker failures")
+        assert both[0].path.endswith("breaker.md")
+
+        monkeypatch.setattr(vectors, "MIN_SCORE", float("inf"))  # Vectors alone
+        hits = retrieve("circuit breaker failures")
+        assert [h.path for h in hits] == [both[0].path]
+        assert hits[0].score < both[0].score  # One ranking instead of two
+
+    def test_stale_vectors_fall_back_to_bm25(self, docs, monkeypatch):
+        build_index([docs])
+        build_vectors(embed=fake_embed([]))
+        (docs / "notes.txt").write_text("Lunch menu: soup, salad, bread.\n")
+        build_index([docs])  # Chunk ids moved; vectors no longer line up
+        monkeypatch.setattr(vectors, "_embed_query", pytest.fail)
+        assert retrieve("lunch soup")[0].path.endswith("notes.txt")
+
+    def test_unloaded_embedder_is_not_started_for_a_query(self, monkeypatch):
+        class Unloaded:
+            def is_unloaded(self, url):
+                return True
+
+        monkeypatch.setattr(vectors, "get_supervisor", lambda: Unloaded())
+        monkeypatch.setattr(vectors, "run_embedding", pytest.fail)
+        assert vectors._embed_query("circuit breaker") is None
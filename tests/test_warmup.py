@@ -0,0 +1,118 @@
+"""
+Unit tests for idle-time cache warming.
+"""
+
+import json
+import threading
+import time
+from datetime import date, timedelta
+
+import pytest
+
+import base
+import orchestrator
+import warmup
+from scheduler import INTERACTIVE, SCHEDULER
+from warmup import WarmStats, Warmer, mine_queries
+
+
+def write_log(log_dir, day, entries):
+    with open(log_dir / f"{day.isoformat()}.jsonl", "a") as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + "\n")
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(warmup, "WARM_STATS", WarmStats())
+    monkeypatch.setattr(orchestrator, "WARM_STATS", warmup.WARM_STATS)
+    base.clear_cache()
+    yield
+    base.clear_cache()
+
+
+def answer(*args, **kwargs):
+    return {"model": args[0], "output": "Good morning! Here is the news.", "latency_ms": 5.0,
+            "ttft_ms": 1.0, "queue_ms": 0.0, "error": None}
+
+
+class TestMining:
+    """Test candidate selection from the logs."""
+
+    def test_frequent_history_free_inputs(self, tmp_path):
+        today = date.today()
+        chat = {"input": "good morning", "model": "qwen", "error": None, "history_turns": 0}
+        code = {"input": "write a hello world in rust", "model": "deepseek", "error": None}
+        write_log(tmp_path, today, [chat] * 2 + [code] * 3)
+        write_log(tmp_path, today - timedelta(days=1), [chat] * 2)
+        write_log(tmp_path, today, [
+            {**chat, "input": "and then?", "history_turns": 2},  # Depends on history
+            {**chat, "input": "and then?", "history_turns": 2},
+            {**chat, "input": "and then?", "history_turns": 2},
+            {"input": "legacy entry", "model": "qwen", "error": None},  # History unknown
+            {"input": "legacy entry", "model": "qwen", "error": None},
+            {"input": "legacy entry", "model": "qwen", "error": None},
+            {**code, "error": "TIMEOUT"},
+            {"event": "STARTUP", "details": {}},
+        ])
+        write_log(tmp_path, today - timedelta(days=warmup.LOG_DAYS + 1), [
+            {**chat, "input": "long ago"}] * 5)
+        (tmp_path / "notes.jsonl").write_text("not a daily log\n")
+
+        assert mine_queries(tmp_path) == ["good morning", "write a hello world in rust"]
+        assert mine_queries(tmp_path, limit=1) == ["good morning"]
+
+
+class TestWarmer:
+    """Test warming, hit accounting and preemption."""
+
+    def test_warmed_answer_is_served_and_counted(self, monkeypatch):
+        monkeypatch.setattr(warmup, "run_model_streaming", answer)
+        monkeypatch.setattr(orchestrator, "log_request", lambda **k: None)
+        warmer = Warmer(orchestrator.warm_plan, queries=[], idle_seconds=0)
+        assert warmer.warm("good morning") == "warmed"
+        assert warmer.warm("good morning") == "cached"
+
+        monkeypatch.setattr(orchestrator, "STREAMING_ENABLED", False)
+        output = orchestrator.orchestrate("good morning", session_id="warm-test")
+        assert output == "Good morning! Here is the news."
+        assert warmup.WARM_STATS.snapshot() == {
+            "warmed": 1, "entries_hit": 1, "hits": 1, "hit_rate": 1.0}
+
+    def test_interactive_request_preempts_warming(self, monkeypatch):
+        started = threading.Event()
+
+        def slow(*args, cancel, **kwargs):
+            started.set()
+            deadline = time.monotonic() + 2
+            while not cancel.cancelled and time.monotonic() < deadline:
+                time.sleep(0.01)
+            return {**answer(*args), "error": cancel.reason}
+
+        monkeypatch.setattr(warmup, "run_model_streaming", slow)
+        warmer = Warmer(orchestrator.warm_plan, queries=[], idle_seconds=0.01)
+        time.sleep(0.05)
+        outcome = []
+        thread = threading.Thread(target=lambda: outcome.append(warmer.warm("good morning")))
+        thread.start()
+        assert started.wait(1)
+
+        grant = SCHEDULER.acquire("qwen", 0, 1, INTERACTIVE)
+        SCHEDULER.release(grant)
+        thread.join(1)
+        assert outcome == ["preempted"]
+        assert base.get_cached(*orchestrator.warm_plan("good morning")[:2]) is None
+
+    def test_timed_out_warming_is_a_failure(self, monkeypatch):
+        def timing_out(*args, cancel, **kwargs):
+            cancel.cancel("TIMEOUT_TTFT")  # As the stream watchdog does
+            return {**answer(*args), "output": "", "error": cancel.reason}
+
+        monkeypatch.setattr(warmup, "run_model_streaming", timing_out)
+        warmer = Warmer(orchestrator.warm_plan, queries=[], idle_seconds=0)
+        assert warmer.warm("good morning") == "failed"
+        assert (warmer.failed, warmer.preempted) == (1, 0)
+
+    def test_waits_for_idle(self):
+        warmer = Warmer(orchestrator.warm_plan, queries=["good morning"], idle_seconds=60)
+        assert not warmer.idle()
@@ -0,0 +1,171 @@
+"""
+Unit tests for the deepseek code workspace.
+"""
+
+import pytest
+
+import base
+import orchestrator
+from sessions import Session
+from workspace import PatchError, Workspace, apply_patch, relevant_region, split_code
+
+SOURCE = "\n".join(f"def f{i}(x):\n    y = x + {i}\n    return y\n" for i in range(60))
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    base.clear_cache()
+    yield
+    base.clear_cache()
+
+
+class TestRegion:
+    """Test choosing the part of the file to show."""
+
+    def test_small_files_are_shown_whole(self):
+        lines = ["a = 1", "b = 2"]
+        assert relevant_region(lines, "change b") == [(0, 2)]
+
+    def test_named_definition_and_changed_lines(self):
+        lines = SOURCE.split("\n")
+        ranges = relevant_region(lines, "make f42 return y * 2", changed=[10])
+        assert any(s <= 168 < e for s, e in ranges)  # def f42
+        assert any(s <= 10 < e for s, e in ranges)
+        assert sum(e - s for s, e in ranges) < 60  # "return" and "y" are everywhere; ignored
+
+    def test_split_code(self):
+        task, code = split_code("fix this:\n```python\nx = 1\n```\nplease")
+        assert code == "x = 1" and "fix this" in task and "```" not in task
+        assert split_code("no code") == ("no code", None)
+
+
+class TestPatching:
+    """Test applying the model's diffs."""
+
+    def test_hunk_found_despite_wrong_line_numbers(self):
+        patch = "@@ -100,3 +100,3 @@\n def f42(x):\n     y = x + 42\n-    return y\n+    return y * 2"
+        lines = apply_patch(SOURCE, patch).split("\n")
+        assert lines[170] == "    return y * 2"
+        assert len(lines) == len(SOURCE.split("\n"))
+
+    def test_multiple_hunks_shift_later_ones(self):
+        text = "a\nb\nc\nd\ne\nf"
+        patch = "--- a\n+++ b\n@@ -1,2 +1,3 @@\n a\n+a2\n b\n@@ -5,2 +6,1 @@\n e\n-f"
+        assert apply_patch(text, patch) == "a\na2\nb\nc\nd\ne"
+
+    def test_mismatch_raises(self):
+        with pytest.raises(PatchError):
+            apply_patch("a\nb", "@@ -1,1 +1,1 @@\n-zzz\n+y")
+
+
+class TestWorkspace:
+    """Test the workspace across turns."""
+
+    def test_edit_cycle(self):
+        ws = Workspace()
+        assert ws.apply_reply("def add(a, b):\n    return a + b") == "created"
+        assert ws.apply_reply("```diff\n@@ -2 +2 @@\n-    return a + b\n+    return b + a\n```") \
+            == "patched"
+        assert ws.text == "def add(a, b):\n    return b + a" and ws.version == 2
+        assert ws.apply_reply("```diff\n@@ -1 +1 @@\n-nothing\n+x\n```") == "failed"
+        assert ws.apply_reply("Not a coding task.") == "unchanged"
+
+    def test_user_edits_are_sent_as_a_diff(self):
+        ws = Workspace()
+        ws.update(SOURCE)
+        ws.apply_reply("```diff\n@@ -3 +3 @@\n-    return y\n+    return y + 1\n```")
+        ws.update(ws.text.replace("y = x + 30", "y = x * 30"))
+        context = ws.context("tidy this up")
+        assert "-    y = x + 30\n+    y = x * 30" in context
+        assert "def f0" in context  # Outline of what isn't shown
+
+    def test_definition_reply_replaces_only_that_definition(self):
+        ws = Workspace()
+        ws.update(SOURCE)
+        assert ws.apply_reply("```python\ndef f7(x):\n    return x * 7\n```") == "patched"
+        assert "def f7(x):\n    return x * 7\n\ndef f8" in ws.text
+
+    def test_unrelated_paste_starts_over(self):
+        ws = Workspace()
+        ws.update(SOURCE)
+        ws.seen = ws.text
+        ws.update("fn main() {\n    println!(\"hi\");\n}")
+        assert ws.seen == "" and "The user changed" not in ws.context("add a loop")
+
+    def test_unfenced_prose_is_not_code(self):
+        ws = Workspace()
+        ws.update(SOURCE)
+        before = ws.text
+        prose = ("The function adds i to x and returns it.\n\n"
+                 "Nothing here needs changing; the loop bounds are fine.")
+        assert ws.apply_reply(prose) == "unchanged" and ws.text == before
+        assert ws.apply_reply(prose, fresh=True) == "unchanged" and ws.text == before
+        assert Workspace().apply_reply(prose) == "unchanged"
+        assert Workspace().apply_reply("x = 1\nprint(x)") == "created"
+
+    def test_survives_session_round_trip(self):
+        session = Session(id="ws")
+        session.workspace.update("x = 1")
+        assert Session.from_dict(session.to_dict()).workspace.text == "x = 1"
+
+    def test_applies_only_to_tasks_naming_its_code(self):
+        ws = Workspace()
+        ws.update("def parse_row(line):\n    fieldCount = 3\n    total = 0\n    return total")
+        assert ws.applies_to("make parse_row skip blank lines")
+        assert ws.applies_to("rename fieldCount")
+        assert ws.applies_to("initialise `total` to None")
+        assert not ws.applies_to("write a function that returns the total of a list")
+        assert not Workspace().applies_to("fix parse_row")
+
+
+class TestOrchestrate:
+    """Test the workspace through orchestrate()."""
+
+    def test_second_turn_sends_a_region_not_the_file(self, monkeypatch):
+        prompts = []
+        replies = iter(["```python\n" + SOURCE + "\n```",
+                        "```diff\n@@ -171 +171 @@\n-    return y\n+    return y * 2\n```"])
+
+        def fake(model, prompt, on_token, **kwargs):
+            prompts.append(prompt)
+            return {"model": model, "output": next(replies), "latency_ms": 1.0, "error": None}
+
+        monkeypatch.setattr(orchestrator, "run_hedged", fake)
+        monkeypatch.setattr(orchestrator, "log_request", lambda **k: None)
+        monkeypatch.setattr(orchestrator, "STREAMING_ENABLED", False)
+        monkeypatch.setattr(orchestrator, "retrieve", lambda *a, **k: [])
+        orchestrator.orchestrate("write a python script with sixty functions", session_id="ws-test")
+        orchestrator.orchestrate("fix the function f42 so it doubles y", session_id="ws-test")
+        session = orchestrator.SESSIONS.get("ws-test")
+        assert "    return y * 2" in session.workspace.text.split("\n")[170]
+        assert "def f42(x):" in prompts[1] and "y = x + 5\n" not in prompts[1]
+        assert len(prompts[1]) - len(prompts[0]) < len(SOURCE) / 2
+        orchestrator.SESSIONS.drop("ws-test")
+
+    def test_unrelated_follow_up_gets_a_fresh_prompt(self, monkeypatch):
+        prompts = []
+        replies = iter(["```python\ndef parse_row(line):\n    return line.split(',')\n```",
+                        "```bash\nls -la | sort -k5 -n\n```",
+                        "```diff\n@@ -1 +1 @@\n-ls -la | sort -k5 -n\n+ls -la | sort -k5 -rn\n```"])
+
+        def fake(model, prompt, on_token, **kwargs):
+            prompts.append(prompt)
+            return {"model": model, "output": next(replies), "latency_ms": 1.0, "error": None}
+
+        monkeypatch.setattr(orchestrator, "run_hedged", fake)
+        monkeypatch.setattr(orchestrator, "log_request", lambda **k: None)
+        monkeypatch.setattr(orchestrator, "STREAMING_ENABLED", False)
+        monkeypatch.setattr(orchestrator, "retrieve", lambda *a, **k: [])
+        orchestrator.orchestrate("write a python csv row parser", session_id="ws-fresh")
+        unrelated = "write a shell script function listing files by size"
+        orchestrator.orchestrate(unrelated, session_id="ws-fresh")
+        fresh = orchestrator.build_prompt(unrelated, "deepseek")
+        assert prompts[1] == fresh  # Same prompt as without a session, so it caches alike
+        assert "unified diff" not in prompts[1] and "parse_row" not in prompts[1]
+        session = orchestrator.SESSIONS.get("ws-fresh")
+        assert session.workspace.text == "ls -la | sort -k5 -n"  # The new answer is the artifact
+        orchestrator.orchestrate("fix the `sort` code to pass -rn so the largest show first",
+                                 session_id="ws-fresh")
+        assert "unified diff" in prompts[2]
+        assert session.workspace.text == "ls -la | sort -k5 -rn"
+        orchestrator.SESSIONS.drop("ws-fresh")